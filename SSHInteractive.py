@@ -1,13 +1,22 @@
+import collections
+import concurrent.futures
 import getpass
+import itertools
 import logging
+import queue
 import re
 import socket
 import sys
+import time
 import traceback
 
 import nxos_XML_errors
 from command_parser import commandparse, ConfigParse
-from ncssh import SshConnect
+from config_diff import missing_config
+from ncssh import SshConnect, IDLE_TIME
+from pipeline import CommandPipeline
+from running_config import RunningConfigCache, parse_show_run
+from spool import SpooledOutput, SPOOL_THRESHOLD
 
 __version__ = '2019.02.27.1'
 
@@ -17,6 +26,94 @@ CISCO_CONFIG_PROMPT = r"\(config\S*\)#"
 CISCO_BASE_PROMPT = r'>'
 CISCO_PRIV_PROMPT = r'#'
 CISCO_COPY_CONFIG_SAVE_PATTERN = r"\[startup-config\]\?"
+CISCO_COPY_CONFIG_MERGE_PATTERN = r"\[running-config\]\?"
+CISCO_RUNNING_CONFIG_COMMAND = 'show running-config'
+# file system push_config_file uploads to
+PUSH_FILESYSTEM = 'flash:'
+# numbers the files uploaded by push_config_file, so concurrent pushes do not overwrite each other
+_push_ids = itertools.count()
+# end of output that looks like a device prompt, used when the prompt is not yet known
+PROMPT_SHAPE_PATTERN = r"[#>]\s*$"
+
+
+def _command_key(cmdr):
+    """
+    Whitespace is collapsed in the command, output filter patterns after the first | are kept as they are since
+    the device matches their whitespace
+    """
+    command, bar, filters = cmdr.partition('|')
+    return ' '.join(command.split()) + (' | ' + filters.strip() if bar else '')
+
+
+def plan_commands(parselist):
+    """
+    Groups the commands of an ssh_parse_test parselist that are the same apart from whitespace
+
+    The key only identifies the group, the first parselist key of the group is what is sent to the device.
+
+    :param parselist: dictionary of command to tests
+    :return: OrderedDict of command, with whitespace collapsed outside output filter patterns, to the list of
+    parselist keys it answers, in the order of parselist
+    """
+    plan = collections.OrderedDict()
+    for cmdr in parselist:
+        command = _command_key(cmdr) if isinstance(cmdr, str) else cmdr
+        plan.setdefault(command, []).append(cmdr)
+    return plan
+
+
+class SessionState(object):
+    """
+    What is known about the mode of an interactive shell, from the prompt at the end of the last response
+
+    Every response read by SSHInteractive ends with whatever the device printed last, so when that is a prompt it
+    shows the mode the shell is in, and check_enable_mode and check_config_mode can answer without sending a newline
+    and waiting for the prompt again. When the last response did not end with a prompt, for example at a password
+    or confirmation prompt, or after an error, the mode is unknown and the checks go to the device.
+
+    Commands sent with SshConnect.send directly are not seen, call invalidate after using it.
+    """
+
+    def __init__(self):
+        # last line of the last response if it looks like a prompt, else None
+        self.prompt = None
+        # one-time terminal setup, term len 0, has been sent on this channel
+        self.terminal_ready = False
+        self.checks_skipped = 0
+
+    def update(self, response):
+        """
+        @param response: str, output of the last command, ending with the prompt the device printed after it
+        """
+        last_line = response.rstrip().rsplit('\n', 1)[-1].strip() if response else ''
+        self.prompt = last_line if re.search(PROMPT_SHAPE_PATTERN, last_line) else None
+
+    def invalidate(self):
+        self.prompt = None
+
+    def check(self, check_string):
+        """
+        @param check_string: regex identifying the mode, as passed to SSHInteractive._check_mode
+        @return: boolean, whether the current prompt matches check_string, None if the prompt is not known
+        """
+        if self.prompt is None:
+            return None
+        self.checks_skipped += 1
+        return bool(re.search(check_string, self.prompt))
+
+    @property
+    def mode(self):
+        """
+        @return: 'config', 'enable', 'user', or None if not known
+        """
+        if self.prompt is None:
+            return None
+        if re.search(CISCO_CONFIG_PROMPT, self.prompt):
+            return 'config'
+        return 'enable' if self.prompt.endswith(CISCO_PRIV_PROMPT) else 'user'
+
+    def __repr__(self):
+        return "<SessionState mode {} prompt {!r}>".format(self.mode, self.prompt)
 
 
 class SSHInteractive(SshConnect):
@@ -40,16 +137,37 @@ class SSHInteractive(SshConnect):
         self.logger.debug("Instantiating SSH object")
 
     def sshconnect(self, host, *args, prompt=None, username=None, password=None, type='Cisco', check_priv=True,
-                   enable_password=None, command_timeout=10, log_session_file=None, log_file_mode='w', **kwargs):
+                   enable_password=None, command_timeout=10, log_session_file=None, log_file_mode='w',
+                   prompt_idle_time=IDLE_TIME, prompt_timeout=1.5, channel_mode='shell', **kwargs):
+        """
+        Connects to the device, see ncssh.SshConnect.sshconnect for the connection arguments
+
+        :param channel_mode: 'shell' for an interactive session, or 'exec' for read-only collection, where each command
+        passed to ssh_cmd_run runs on its own exec channel and no prompt discovery or enable is done. Output in exec
+        mode does not contain the echoed command or the prompt. Configuration methods require 'shell'.
+        """
         super().__init__(host)
+        self.channel_mode = channel_mode
         self.type = type
         self.prompt = prompt
+        self.prompt_idle_time = prompt_idle_time
+        self.prompt_timeout = prompt_timeout
         self.check_priv = check_priv
         self.enable_password = enable_password
+        self.init_session_state()
         super().sshconnect(*args, username=username, password=password,
                            command_timeout=command_timeout, log_session_file=log_session_file,
                            log_file_mode=log_file_mode, **kwargs)
 
+    def init_session_state(self):
+        """
+        Starts the per-connection state _send keeps up to date, the mode tracked from the prompt and the running
+        configuration cache. Called by sshconnect, and by anything that sets up a session without it.
+        """
+        self.state = SessionState()
+        # shared with the sessions of additional channels, see open_channel
+        self.config_cache = RunningConfigCache()
+
     # SSH object requires that the subclass define the object
     def setup_channel(self):
         """
@@ -57,11 +175,18 @@ class SSHInteractive(SshConnect):
         """
 
         self.logger.info("SSHInteractive: setup_channel: {}".format(self.host))
-        self.ssh_shell()
-        self.look_for_prompt()
+        if self.channel_mode == 'exec':
+            # commands run on their own exec channels, see ssh_cmd_run
+            self._transport = self.ssh_client.get_transport()
+            return
+        with self.timing.phase('setup_channel'):
+            self.ssh_shell()
+        with self.timing.phase('find_prompt'):
+            self.look_for_prompt()
         if self.check_priv:
             try:
-                self.enable()
+                with self.timing.phase('enable'):
+                    self.enable()
             except:
                 self.logger.error("SSHInteractive look_for_prompt: failed to elevate to privileged mode")
                 exc_type, exc_value, exc_traceback = sys.exc_info()
@@ -86,6 +211,16 @@ class SSHInteractive(SshConnect):
                     "SSHInteractive: look_for_prompt: Waiting for ssh shell prompt {}".format(self.prompt))
                 s = self.rpexpect(self.prompt)
                 self.logger.debug("SSHInteractive: look_for_prompt: Received from server {}".format(s))
+                # enable, open_channel and the config prompts are built from base_prompt, take it from the prompt
+                # the device printed, or from the given prompt without its terminator
+                lines = s.strip().splitlines()
+                last = lines[-1].strip() if lines else ''
+                if last[-1:] in ('#', '>'):
+                    self.base_prompt = last[:-1]
+                else:
+                    self.base_prompt = re.sub(r"[#>]\s*$", "", self.prompt.strip())
+                self.state.update(s)
+                self.logger.debug("SSHInteractive: look_for_prompt: base_prompt: {}".format(self.base_prompt))
             except:
                 self.logger.error(
                     "SSHInteractive: look_for_prompt: Unexpected string from device {} - {}".format(self.host, s))
@@ -96,6 +231,28 @@ class SSHInteractive(SshConnect):
                 self.close()
                 raise
 
+    def open_channel(self):
+        """
+        Opens another interactive shell on the existing connection, see ncssh.SshConnect.open_channel
+
+        Waits for the device prompt on the new shell and elevates to privileged mode if check_priv is set.
+        @return: SSHInteractive using the new channel
+        """
+        session = super().open_channel()
+        session.state = SessionState()
+        try:
+            output = session.rpexpect(r"{}[>#]".format(re.escape(self.base_prompt)))
+            session.state.update(output)
+            session.prompt = self.base_prompt + (CISCO_PRIV_PROMPT if output.rstrip().endswith('#') else
+                                                 CISCO_BASE_PROMPT)
+            if self.check_priv:
+                session.enable()
+        except:
+            self.logger.error("SSHInteractive: open_channel: failed to set up additional channel to {}".format(self.host))
+            session.close()
+            raise
+        return session
+
     def _send(self, cmd, tprompt=None):
 
         """
@@ -110,16 +267,19 @@ class SSHInteractive(SshConnect):
             prompt = tprompt
 
         # send message to server
-        self.logger.debug(
-            "SSHInteractive Send: Sending command {} to device {}: waiting for {}".format(cmd, self.host, prompt))
+        trace = self.trace
+        trace.start_command()
+        trace("SSHInteractive Send: Sending command %s to device %s: waiting for %s", cmd, self.host, prompt)
+        start = time.monotonic()
+        received = self._bytes_received
         self.send(cmd.strip() + '\n')
 
         # wait for response from server
-        self.logger.debug("SSHInteractive Send: Waiting for response from device {} ".format(self.host))
         response = None
+        self.state.invalidate()
         try:
             response = self.rpexpect(prompt)
-            self.logger.debug("SSHInteractive Send: response from device {}: {}".format(self.host, response))
+            trace("SSHInteractive Send: response from device %s: %s", self.host, response)
         except socket.timeout:
             exc_type, exc_value, exc_traceback = sys.exc_info()
             stacktrace = traceback.extract_tb(exc_traceback)
@@ -151,7 +311,7 @@ class SSHInteractive(SshConnect):
             self.logger.debug(sys.exc_info())
             self.logger.debug(stacktrace)
             self.close()
-            # do not propagate exception, closesession will raise one
+            raise
         except:
             exc_type, exc_value, exc_traceback = sys.exc_info()
             stacktrace = traceback.extract_tb(exc_traceback)
@@ -163,8 +323,16 @@ class SSHInteractive(SshConnect):
             self.logger.debug(stacktrace)
             raise
 
-        # parse response and check for errors
-        self.logger.debug("SSHInteractive Send: Received response {}".format(response))
+        self.timing.add_command(cmd.strip(), start, time.monotonic(), self._bytes_received - received)
+        self.state.update(response)
+        self.config_cache.invalidate_for(cmd, self.state.mode)
+        self._log_response_errors(cmd, response)
+        return response
+
+    def _log_response_errors(self, cmd, response):
+        """
+        Logs errors reported by the device in the response to cmd
+        """
         if re.search('ERROR', response):
             self.logger.error(
                 "SSHInteractive Send: Error at :  " + self.host + " while running :  " + cmd + "  Output:  " + response + "\n")
@@ -174,7 +342,6 @@ class SSHInteractive(SshConnect):
             if re.search(r"%\s*Error", response) or re.search(r"%\s*Invalid", response):
                 self.logger.error(
                     "SSHInteractive Send: %Error detected on :  " + self.host + " while running :  " + cmd + "  Output:  " + response + "\n")
-        return response
 
     def ssh_cmd_run(self, cmdlist, stop_on_error=False):
 
@@ -182,16 +349,14 @@ class SSHInteractive(SshConnect):
         buff = ''
         if isinstance(cmdlist, str):
             cmdlist = [cmdlist]
-        self.logger.debug("SSHInteractive ssh_cmd_run: Command list for device {}: {}".format(self.host, str(cmdlist)))
+        self.trace("SSHInteractive ssh_cmd_run: Command list for device %s: %s", self.host, cmdlist)
         try:
-            if self.type == 'Cisco':
-                self.logger.debug(
-                    "SSHInteractive ssh_cmd_run: Sending command 'term len 0' to device {}".format(self.host))
-                response = self._send('term len 0')
+            self.setup_terminal()
             for cmd in cmdlist:
-                response = self._send(cmd)
-                self.logger.debug("SSHInteractive ssh_cmd_run: Running " + cmd + " on " + self.host)
-                self.logger.debug("SSHInteractive ssh_cmd_run: Received response " + response + " from " + self.host)
+                if self.channel_mode == 'exec':
+                    response = self.exec_command(cmd)
+                else:
+                    response = self._send(cmd)
                 buff += response
                 if stop_on_error and (re.search(r"%\s*Invalid", response) or re.search(r"%\s*Error", response)):
                     self.logger.error("SSHInteractive ssh_cmd_action: Error Sending " + cmd + " on " + self.host)
@@ -200,12 +365,202 @@ class SSHInteractive(SshConnect):
                         "SSHInteractive: ssh_cmd_run: Error Sending " + cmd + " on " + self.host + ": command output " + response)
         except:
             raise
-        self.logger.debug("SSHInteractive ssh_cmd_run: Sending response {}".format(buff))
+        self.trace("SSHInteractive ssh_cmd_run: Sending response %s", buff)
         return buff
 
+    def setup_terminal(self):
+        """
+        Sends the one-time terminal setup, term len 0 on Cisco, unless it was already sent on this channel
+        """
+        if self.type != 'Cisco' or self.channel_mode == 'exec' or self.state.terminal_ready:
+            return
+        self._send('term len 0')
+        self.state.terminal_ready = True
+
+    def ssh_cmd_stream(self, cmdlist, lines=False, stop_on_error=False):
+        """
+        Generator version of ssh_cmd_run, yields the output as it arrives instead of returning it as one string
+
+        Only a window at the end of the output is kept to find the prompt, which is found even when it is split
+        across chunks, so memory use does not depend on the size of the output. The output is the same as that of
+        ssh_cmd_run: the echoed command, its output and the prompt, for each command in turn.
+
+        :param cmdlist: command or list of commands
+        :param lines: boolean, if True yield complete lines, with their line endings, instead of chunks as received.
+        The prompt at the end of each command's output is yielded as a line of its own.
+        :param stop_on_error: boolean, raise ValueError after a command whose output contains a device error
+
+        If the generator is closed before the output of a command has been read to the prompt, e.g. by breaking out
+        of the loop over it, the rest of that command's output is read and discarded when it is closed, so it is not
+        taken for the response to the next command. On an exec channel the channel is closed instead.
+        """
+        self.logger.info("SSHInteractive: ssh_cmd_stream: {}".format(self.host))
+        if isinstance(cmdlist, str):
+            cmdlist = [cmdlist]
+        self.setup_terminal()
+        for cmd in cmdlist:
+            if self.channel_mode == 'exec':
+                chunks = self.exec_command_iter(cmd)
+            else:
+                chunks = self._send_iter(cmd)
+            partial = ''
+            carry = ''
+            error = False
+            read = False
+            try:
+                for text in chunks:
+                    if stop_on_error and not error:
+                        # an error marker may be split across chunks
+                        error = bool(re.search(r"%\s*Invalid|%\s*Error", carry + text))
+                        carry = text[-16:]
+                    if not lines:
+                        yield text
+                        continue
+                    partial += text
+                    if '\n' in text:
+                        complete, partial = partial.rsplit('\n', 1)
+                        for line in complete.split('\n'):
+                            yield line + '\n'
+                read = True
+            finally:
+                if not read:
+                    self._discard_stream(cmd, chunks)
+            if partial:
+                yield partial
+            if error:
+                self.logger.error("SSHInteractive ssh_cmd_stream: Error Sending " + cmd + " on " + self.host)
+                raise ValueError("SSHInteractive: ssh_cmd_stream: Error Sending " + cmd + " on " + self.host)
+
+    def _discard_stream(self, cmd, chunks):
+        """
+        Reads the rest of the output of a command whose stream was abandoned, up to the prompt, the session is closed
+        if that fails since the output would otherwise be read as the response to the next command
+        """
+        if self.channel_mode == 'exec':
+            chunks.close()
+            return
+        self.logger.debug("SSHInteractive ssh_cmd_stream: discarding the rest of the output of {} on {}".format(
+            cmd, self.host))
+        try:
+            for text in chunks:
+                pass
+        except:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            self.logger.error("SSHInteractive ssh_cmd_stream: could not read the rest of the output of {} on {}, "
+                              "closing the session: {}".format(cmd, self.host, exc_value))
+            self.logger.debug(traceback.extract_tb(exc_traceback))
+            self.close()
+
+    def ssh_cmd_spool(self, cmdlist, threshold=SPOOL_THRESHOLD):
+        """
+        Runs the commands like ssh_cmd_run, but collects the output in a spool.SpooledOutput, which moves the output
+        to a temporary file once it is larger than threshold bytes
+
+        :param cmdlist: command or list of commands
+        :param threshold: int, bytes kept in memory
+        :return: spool.SpooledOutput, the caller must close it; its parser method gives a ConfigParse or
+        MappedConfigParse for commandparse
+        """
+        spooled = SpooledOutput(threshold=threshold)
+        try:
+            for text in self.ssh_cmd_stream(cmdlist):
+                spooled.write(text)
+        except:
+            spooled.close()
+            raise
+        return spooled
+
+    def _send_iter(self, cmd, tprompt=None):
+        """
+        Streaming version of _send, yields the response to cmd as it arrives
+        """
+        prompt = self.prompt if tprompt is None else tprompt
+        trace = self.trace
+        trace.start_command()
+        trace("SSHInteractive Send: Streaming command %s to device %s: waiting for %s", cmd, self.host, prompt)
+        start = time.monotonic()
+        received = self._bytes_received
+        self.send(cmd.strip() + '\n')
+        self.state.invalidate()
+        tail = ''
+        try:
+            for text in self.rpexpect_iter(prompt):
+                tail = (tail + text)[-256:]
+                yield text
+            self.state.update(tail)
+            self.config_cache.invalidate_for(cmd, self.state.mode)
+        except:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            stacktrace = traceback.extract_tb(exc_traceback)
+            self.logger.error(
+                "SSHInteractive Send: Error waiting for response to {} to {}: {}".format(cmd, self.host, exc_value))
+            self.logger.debug(sys.exc_info())
+            self.logger.debug(stacktrace)
+            raise
+        finally:
+            self.timing.add_command(cmd.strip(), start, time.monotonic(), self._bytes_received - received)
+
+    def ssh_cmd_run_parallel(self, cmdlists, stop_on_error=False):
+        """
+        Runs independent commands concurrently, each on its own channel of this connection
+
+        Up to max_channels channels are used, this session's channel and additional channels from open_channel, which
+        are closed afterwards. If an additional channel can not be opened the remaining commands run on the channels
+        that are open.
+
+        :param cmdlists: iterable of commands or command lists, each one is passed to ssh_cmd_run
+        :param stop_on_error: boolean, passed to ssh_cmd_run
+        :return: list of the ssh_cmd_run output for each item of cmdlists, in the same order
+        """
+        self.logger.info("SSHInteractive: ssh_cmd_run_parallel: {}".format(self.host))
+        cmdlists = list(cmdlists)
+        results = [None] * len(cmdlists)
+        work = queue.Queue()
+        for index, cmdlist in enumerate(cmdlists):
+            work.put((index, cmdlist))
+
+        def run(session):
+            while True:
+                try:
+                    index, cmdlist = work.get_nowait()
+                except queue.Empty:
+                    return
+                results[index] = session.ssh_cmd_run(cmdlist, stop_on_error=stop_on_error)
+
+        def run_on_new_channel():
+            if self.channel_mode == 'exec':
+                # every command already runs on a channel of its own
+                run(self)
+                return
+            try:
+                session = self.open_channel()
+            except Exception as exc:
+                self.logger.warning(
+                    "SSHInteractive ssh_cmd_run_parallel: no additional channel to {}: {}".format(self.host, exc))
+                return
+            try:
+                run(session)
+            finally:
+                session.close()
+
+        extra_channels = min(len(cmdlists), self.max_channels) - 1
+        if extra_channels < 1:
+            run(self)
+            return results
+        with concurrent.futures.ThreadPoolExecutor(max_workers=extra_channels) as executor:
+            futures = [executor.submit(run_on_new_channel) for _ in range(extra_channels)]
+            try:
+                run(self)
+            finally:
+                errors = [future.exception() for future in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+        return results
+
     def ssh_cmd_action(self, cmdlist, replace_prompt=False, config=True, config_mode_command=None, stop_on_error=False,
                        save_config=False,
-                       prompt=""):
+                       prompt="", window=1):
         """
 
         Takes a list of (cmd, pattern) tuples and runs the commands on the device
@@ -218,10 +573,16 @@ class SSHInteractive(SshConnect):
         a ValueError
         :param save_config: boolean, save the configurtion if True
         :param prompt: alternative prompt to search for, used with the replace_prompt flag
+        :param window: int, commands sent ahead without waiting for the prompt of the previous one, see
+        _send_pipelined. With stop_on_error, up to window - 1 commands after the one that failed have already been
+        sent to the device when the error is seen.
         :return:
         """
 
         self.logger.info("SSHInteractive: ssh_cmd_action: {}".format(self.host))
+        if self.channel_mode == 'exec':
+            raise ValueError("SSHInteractive: ssh_cmd_action: {} is connected with channel_mode 'exec', interactive "
+                             "commands require channel_mode 'shell'".format(self.host))
         this_action_list = []
         if config:
             self.enable()
@@ -238,11 +599,12 @@ class SSHInteractive(SshConnect):
         buff = ''
         try:
             # if OPTS['cisco']:
-            for cmd, prompt in cmdlist:
-                response = self._send(cmd, prompt)
-                self.logger.debug("SSHInteractive ssh_cmd_action: Sending " + cmd + " on " + self.host)
-                self.logger.debug("SSHInteractive ssh_cmd_action: Waiting for {} on {} ".format(prompt, self.host))
-                self.logger.debug("SSHInteractive ssh_cmd_action: Response " + response)
+            actions = this_action_list if replace_prompt else cmdlist
+            if window > 1:
+                responses = self._send_pipelined(actions, window, stop_on_error=stop_on_error)
+            else:
+                responses = ((cmd, self._send(cmd, cmd_prompt)) for cmd, cmd_prompt in actions)
+            for cmd, response in responses:
                 buff += response
                 if stop_on_error and (re.search(r"%\s*Invalid", response) or re.search(r"%\s*Error", response)):
                     self.logger.error("SSHInteractive ssh_cmd_action: Error Sending " + cmd + " on " + self.host)
@@ -255,10 +617,88 @@ class SSHInteractive(SshConnect):
                 self.save_config()
         except:
             raise
-        self.logger.debug("SSHInteractive ssh_cmd_action: Sending response {}".format(buff))
+        self.trace("SSHInteractive ssh_cmd_action: Sending response %s", buff)
         return buff
 
-    def ssh_config_cmd_set(self, cmdlist, config_mode_command=None, stop_on_error=False, save_config=True, prompt=""):
+    def _send_pipelined(self, cmdlist, window, stop_on_error=False):
+        """
+        Sends commands without waiting for each one's prompt, keeping up to *window* of them in flight, and splits the
+        output back into one response per command at the prompts, see pipeline.CommandPipeline
+
+        :param cmdlist: list of (command, pattern of the prompt that follows it)
+        :param window: int
+        :param stop_on_error: boolean, send no more commands after a response with a device error
+        :return: list of (command, response)
+        """
+        pipeline = CommandPipeline(cmdlist, window, stop_on_error=stop_on_error, received=self._bytes_received)
+        responses = []
+        if not len(pipeline):
+            return responses
+        self.trace("SSHInteractive _send_pipelined: sending %s commands to %s, window %s", len(pipeline), self.host,
+                   window)
+        self.state.invalidate()
+        self.send(pipeline.next_batch())
+        try:
+            # reads until every command has its prompt, the pattern itself never matches
+            for text in self.rpexpect_iter(r"(?!)", timer=self.command_timeout * len(pipeline)):
+                for cmd, response, sent, nbytes in pipeline.feed(text, self._bytes_received):
+                    self.timing.add_command(cmd, sent, time.monotonic(), nbytes)
+                    self._log_response_errors(cmd, response)
+                    responses.append((cmd, response))
+                if pipeline.done:
+                    break
+                batch = pipeline.next_batch()
+                if batch:
+                    self.send(batch)
+        except:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            stacktrace = traceback.extract_tb(exc_traceback)
+            self.logger.error(
+                "SSHInteractive _send_pipelined: Error waiting for responses from {} after {} of {} commands: "
+                "{}".format(self.host, len(responses), len(responses) + len(pipeline), exc_value))
+            self.logger.debug(sys.exc_info())
+            self.logger.debug(stacktrace)
+            raise
+        self.state.update(responses[-1][1])
+        self.config_cache.invalidate()
+        return responses
+
+    def running_config(self, command=CISCO_RUNNING_CONFIG_COMMAND):
+        """
+        The running configuration snapshot of this connection, fetched with command if there is none
+
+        The snapshot is dropped when a command that may change the configuration is sent, see
+        running_config.RunningConfigCache.
+
+        :return: running_config.RunningConfigSnapshot
+        """
+        snapshot = self.config_cache.get()
+        if snapshot is None:
+            generation = self.config_cache.generation
+            snapshot = self.config_cache.store(self.ssh_cmd_run(command), generation)
+        return snapshot
+
+    def find_missing_config(self, cmdlist, command=CISCO_RUNNING_CONFIG_COMMAND):
+        """
+        Fetches the running configuration once and returns the commands of cmdlist it does not have yet, see
+        config_diff.missing_config
+
+        :param cmdlist: iterable of configuration commands, or a single command
+        :param command: str, command that shows the running configuration
+        :return: list of commands to send, empty if the device already has all of them
+        """
+        if isinstance(cmdlist, str):
+            cmdlist = (cmdlist,)
+        cmdlist = list(cmdlist)
+        self.enable()
+        self.exit_config_mode()
+        missing = missing_config(cmdlist, self.running_config(command).text)
+        self.logger.info("SSHInteractive: find_missing_config: {} of {} commands missing on {}".format(
+            len(missing), len(cmdlist), self.host))
+        return missing
+
+    def ssh_config_cmd_set(self, cmdlist, config_mode_command=None, stop_on_error=False, save_config=True, prompt="",
+                           window=1, only_missing=False):
         """
         Takes a  list of commands, automatically enters configuration mode,
         converts the command list to the [(command1, prompt), ...] form,
@@ -271,6 +711,12 @@ class SSHInteractive(SshConnect):
         :param config_mode_command: command for entering config mode, default is "config t"
         :param cmdlist: iterable with multiple configuration commands
         :param prompt: alternative pattern to previously provided or discovered prompts
+        :param window: int, if more than 1 the commands are pipelined, up to window of them are sent before their
+        prompts come back, see ssh_cmd_action. Only for commands that return to a configuration prompt: no banners,
+        no commands asking for confirmation, no exit or end.
+        :param only_missing: boolean, if True only send the commands the running configuration does not have, see
+        find_missing_config. If it has all of them nothing is sent, not even config mode or the save, and '' is
+        returned.
         :return:
         """
         self.logger.info("SSHInteractive: ssh_config_cmd_set: {}".format(self.host))
@@ -281,6 +727,12 @@ class SSHInteractive(SshConnect):
 
         if not hasattr(cmdlist, '__iter__'):
             raise ValueError("SSHInteractive: ssh_config_cmd_set: Invalid argument passed into ssh_config_cmd_set")
+        if only_missing:
+            cmdlist = self.find_missing_config(cmdlist)
+            if not cmdlist:
+                self.logger.info("SSHInteractive: ssh_config_cmd_set: {} already has the configuration".format(
+                    self.host))
+                return ''
 
         # Send config commands
         action_list = []
@@ -291,7 +743,8 @@ class SSHInteractive(SshConnect):
         output = ''
         try:
             output = self.ssh_cmd_action(action_list, config_mode_command=config_mode_command, replace_prompt=True,
-                                         stop_on_error=stop_on_error, save_config=save_config)
+                                         stop_on_error=stop_on_error, save_config=save_config, prompt=prompt,
+                                         window=window)
         except:
             self.logger.error("SSHInteractive ssh_config_cmd_set: error running command set")
             self.logger.debug("SSHInteractive ssh_config_cmd_set: error output {}".format(output))
@@ -302,7 +755,55 @@ class SSHInteractive(SshConnect):
         # exit configuration mode
         return output
 
-    def ssh_parse_test(self, parselist):
+    def push_config_file(self, cmdlist, method='scp', filesystem=PUSH_FILESYSTEM, stop_on_error=False,
+                         save_config=True, keep_file=False):
+        """
+        Applies configuration commands by uploading them as a file over the existing connection, see
+        ncssh.SshConnect.put_file, and merging it with a single copy <file> running-config
+
+        For large command sets this replaces one round trip per line with one upload and one command. The device
+        applies every line of the file and reports errors in the output of the copy, so the commands are not
+        stopped at the first error as with ssh_config_cmd_set.
+
+        :param cmdlist: iterable of configuration commands, or a single command
+        :param method: 'scp' or 'sftp', the device needs the matching server enabled, e.g. ip scp server enable
+        :param filesystem: str, device file system the file is written to
+        :param stop_on_error: boolean, if True raise a ValueError if the copy reports an error, before saving
+        :param save_config: boolean, if True, save the configuration
+        :param keep_file: boolean, if True, leave the uploaded file on the device
+        :return: str, output of the copy
+        """
+        self.logger.info("SSHInteractive: push_config_file: {}".format(self.host))
+        if self.channel_mode == 'exec':
+            raise ValueError("SSHInteractive: push_config_file: {} is connected with channel_mode 'exec', "
+                             "configuration requires channel_mode 'shell'".format(self.host))
+        if isinstance(cmdlist, str):
+            cmdlist = (cmdlist,)
+        config = ''.join(cmd.rstrip() + '\n' for cmd in cmdlist) + 'end\n'
+        remote_path = "{}ncssh{}_{}.cfg".format(filesystem, time.strftime("_%y%m%d%H%M%S", time.gmtime()),
+                                                next(_push_ids))
+        self.enable()
+        self.exit_config_mode()
+        self.put_file(config, remote_path, method=method)
+        self.config_cache.invalidate()
+        output = self._send("copy {} running-config".format(remote_path),
+                            tprompt="{}|{}".format(CISCO_COPY_CONFIG_MERGE_PATTERN, self.prompt))
+        if re.search(CISCO_COPY_CONFIG_MERGE_PATTERN, output):
+            output += self._send("\n")
+        self.logger.debug("SSHInteractive push_config_file: output {}".format(output))
+        if not keep_file:
+            self._send("delete /force {}".format(remote_path))
+        if stop_on_error and (re.search(r"%\s*Invalid", output) or re.search(r"%\s*Error", output)):
+            self.logger.error("SSHInteractive push_config_file: Error applying " + remote_path + " on " + self.host)
+            raise ValueError(
+                "SSHInteractive: push_config_file: Error applying " + remote_path + " on " + self.host +
+                ": command output " + output)
+        if save_config:
+            self.save_config()
+        return output
+
+    def ssh_parse_test(self, parselist, parallel=False, spool_threshold=None, config_snapshot=True,
+                       reuse_outputs=False):
         """
         parselist is a dictionary of the form:
         {command1:
@@ -317,7 +818,22 @@ class SSHInteractive(SshConnect):
         command2:...}
 
         allowed flags are existl, notexistl, cmpcountl
-        :param parselist: dictionary
+        :param parselist: dictionary, or a command_parser.CheckPlan of it to reuse the compiled checks across devices
+        :param parallel: boolean, if True run the commands concurrently on separate channels, see ssh_cmd_run_parallel
+        :param spool_threshold: int, if given, outputs larger than this many bytes are written to a temporary file and
+        tested through an mmap of it, see ssh_cmd_spool. Such outputs are left out of the returned command outputs,
+        and for commands without tests the parse result is the size of the output in bytes, an int, instead of the
+        output.
+        Ignored if parallel is True.
+        :param config_snapshot: boolean, if True show running-config commands with include, exclude, begin, section
+        or count filters are answered from one snapshot of the running configuration, see running_config, instead
+        of having the device generate the configuration for each of them
+        :param reuse_outputs: boolean, if True outputs are kept for the session and reused by later calls until the
+        configuration may have changed, see running_config.RunningConfigCache. Only for commands whose output does
+        not change on its own, unlike counters or show clock.
+
+        Commands that differ only in whitespace are run once and their output is tested against each of their
+        entries, and appears once in the command outputs.
         :return: dictionary
         """
 
@@ -325,31 +841,105 @@ class SSHInteractive(SshConnect):
         parseresults = {}
         passed = True
         command_outputs = ""
-        for cmdr in parselist:
-            self.logger.debug("SSHInteractive ssh_parse_test: Sending command {} to {}".format(cmdr, self.host))
-            response = self.ssh_cmd_run(cmdr)
+        plan = plan_commands(parselist)
+        outputs = self._show_from_snapshot(plan) if config_snapshot else {}
+        if reuse_outputs:
+            generation = self.config_cache.generation
+            for command in plan:
+                output = None if command in outputs else self.config_cache.output(command)
+                if output is not None:
+                    outputs[command] = output
+        fetched = {}
+        if parallel:
+            device_commands = [command for command in plan if command not in outputs]
+            fetched = dict(zip(device_commands, self.ssh_cmd_run_parallel([plan[command][0]
+                                                                             for command in device_commands])))
+        for command, cmdrs in plan.items():
+            if command in outputs:
+                response = outputs[command]
+            elif command in fetched:
+                response = fetched[command]
+            elif spool_threshold is not None:
+                spooled = self.ssh_cmd_spool(cmdrs[0], threshold=spool_threshold)
+                if spooled.spilled:
+                    self.logger.info("SSHInteractive ssh_parse_test: testing {} bytes of {} output from {} on "
+                                     "disk".format(spooled.size, command, self.host))
+                    parser = spooled.parser()
+                    for cmdr in cmdrs:
+                        if parselist[cmdr] is None:
+                            # the output is not kept, only its size
+                            parseresults[cmdr] = spooled.size
+                            continue
+                        parseresult, cmd_passed = self._parse_response(cmdr, parselist[cmdr], spooled, parser=parser)
+                        passed = passed and cmd_passed
+                        parseresults[cmdr] = parseresult
+                    spooled.close()
+                    continue
+                response = fetched[command] = spooled.getvalue()
+                spooled.close()
+            else:
+                self.logger.debug("SSHInteractive ssh_parse_test: Sending command {} to {}".format(cmdrs[0], self.host))
+                response = fetched[command] = self.ssh_cmd_run(cmdrs[0])
+            if reuse_outputs and command in fetched:
+                self.config_cache.store_output(command, response, generation)
             self.logger.debug("SSHInteractive ssh_parse_test: " + self.host + " - Results of {}".format(response))
-            self.logger.debug(
-                "SSHInteractive ssh_parse_test: " + self.host + " - Testing {} {}".format(response, parselist[cmdr]))
-            parseresult = response
             command_outputs += response
-            if parselist[cmdr] is not None:
-                parseresult = commandparse(ConfigParse(response), parselist[cmdr])
-                self.logger.debug("SSHInteractive ssh_parse_test: result of testing: {}".format(str(parseresult)))
-                for result in parseresult.values():
-                    if (False in result) or (None in result) or ('Error' in result) or re.search(r"%\s*Invalid",
-                                                                                                 response) or re.search(
-                            r"%\s*Error", response):
-                        self.logger.error(
-                            "SSHInteractive ssh_parse_test: {} has failed this test. Result {} for cmdr {}".format(
-                                self.host, result, cmdr))
-                        self.logger.debug("SSHInteractive ssh_parse_test: command output: {}".format(response))
-                        passed = False
-            parseresults[cmdr] = parseresult
+            for cmdr in cmdrs:
+                self.logger.debug(
+                    "SSHInteractive ssh_parse_test: " + self.host + " - Testing {} {}".format(response, parselist[cmdr]))
+                parseresult, cmd_passed = self._parse_response(cmdr, parselist[cmdr], response)
+                passed = passed and cmd_passed
+                parseresults[cmdr] = parseresult
+        self._log_parse_results(passed, parseresults)
+        return passed, parseresults, command_outputs
+
+    def _show_from_snapshot(self, plan):
+        """
+        :param plan: dictionary of command to the parselist keys it answers, see plan_commands
+        :return: dict of command to output for the commands that can be answered from the running configuration
+        snapshot, the snapshot is fetched if any can
+        """
+        if self.channel_mode == 'exec' or self.state.mode not in ('enable', 'user'):
+            return {}
+        commands = [command for command, cmdrs in plan.items() if parse_show_run(cmdrs[0]) is not None]
+        if not commands:
+            return {}
+        snapshot = self.running_config()
+        self.logger.debug("SSHInteractive ssh_parse_test: {} commands answered from the running configuration "
+                          "snapshot of {}".format(len(commands), self.host))
+        return dict((command, snapshot.show(plan[command][0])) for command in commands)
+
+    def _parse_response(self, cmdr, tests, response, parser=None):
+        """
+        Runs the ssh_parse_test tests for one command against its output
+
+        :param cmdr: str, command
+        :param tests: dictionary of flags and regexes for the command, or None to only collect the output
+        :param response: str, output of the command
+        :param parser: ConfigParse or command_parser.MappedConfigParse of the output, defaults to ConfigParse(response)
+        :return: (parse result, boolean True if all tests passed)
+        """
+        if tests is None:
+            return response, True
+        if parser is None:
+            parser = ConfigParse(response)
+        passed = True
+        parseresult = commandparse(parser, tests)
+        self.logger.debug("SSHInteractive ssh_parse_test: result of testing: {}".format(str(parseresult)))
+        for result in parseresult.values():
+            if (False in result) or (None in result) or ('Error' in result) or parser.exist(
+                    r"%\s*Invalid") or parser.exist(r"%\s*Error"):
+                self.logger.error(
+                    "SSHInteractive ssh_parse_test: {} has failed this test. Result {} for cmdr {}".format(
+                        self.host, result, cmdr))
+                self.logger.debug("SSHInteractive ssh_parse_test: command output: {}".format(response))
+                passed = False
+        return parseresult, passed
+
+    def _log_parse_results(self, passed, parseresults):
         if self.session_log:
             self.session_log.write("\nSSHInteractive ssh_parse_test: Test Result = {}\n".format(passed))
             self.session_log.write("SSHInteractive ssh_parse_test: Test Results: {}".format(parseresults))
-        return passed, parseresults, command_outputs
 
     def set_base_prompt(self, pri_prompt_terminator='#',
                         alt_prompt_terminator='>'):
@@ -371,16 +961,26 @@ class SSHInteractive(SshConnect):
         # Strip off trailing terminator
         self.prompt = prompt
         self.base_prompt = prompt[:-1]
+        self.state.update(prompt)
         self.logger.debug(
             "SSHInteractive: set_base_prompt: prompt: {}, base_prompt: {}".format(self.prompt, self.base_prompt))
         return self.base_prompt
 
-    def find_prompt(self):
+    def find_prompt(self, idle=None, timer=None):
         """Finds the current network device prompt, last line only.
+        Returns as soon as the output ends with a line ending in # or > and has been quiet for *idle* seconds.
+        :param idle: seconds of quiet output after a prompt-like line, defaults to self.prompt_idle_time
+        :type idle: float
+        :param timer: upper bound in seconds on waiting for the prompt, defaults to self.prompt_timeout
+        :type timer: float
         """
         self.logger.info("SSHInteractive: find_prompt: {}".format(self.host))
+        if idle is None:
+            idle = self.prompt_idle_time
+        if timer is None:
+            timer = self.prompt_timeout
         self.send("\n")
-        prompt = self.rpexpect('', code=5, timer=1.5)
+        prompt = self.rpexpect(PROMPT_SHAPE_PATTERN, code=6, timer=timer, idle=idle)
         prompt = prompt.strip()
         # Check if the only thing you received was a newline
 
@@ -471,7 +1071,13 @@ class SSHInteractive(SshConnect):
         return self._check_mode(check_string=check_string, pattern=pattern)
 
     def _check_mode(self, check_string=CISCO_CONFIG_PROMPT, pattern='', prompt_pattern=None):
-
+        """
+        Checks the mode against the prompt at the end of the last response if it is known, see SessionState, else by
+        sending a newline and searching the new prompt for check_string
+        """
+        known = self._known_mode(check_string, pattern, prompt_pattern)
+        if known is not None:
+            return known
         if prompt_pattern is None:
             prompt_pattern = r"{}|{}|{}".format(self.base_prompt, CISCO_BASE_PROMPT, CISCO_PRIV_PROMPT)
         self.logger.debug("SSHInteractive _check_mode: prompt_pattern: {}".format(prompt_pattern))
@@ -491,6 +1097,18 @@ class SSHInteractive(SshConnect):
             return True
         return False
 
+    def _known_mode(self, check_string, pattern, prompt_pattern):
+        """
+        @return: result of the mode check from the session state, None if it has to be asked from the device
+        """
+        if pattern or prompt_pattern is not None:
+            return None
+        known = self.state.check(check_string)
+        if known is not None:
+            self.logger.debug("SSHInteractive _check_mode: {} from prompt {}: {}".format(check_string, self.state.prompt,
+                                                                                         known))
+        return known
+
     def config_mode(self, config_command='config term', pattern=''):
         """Enter into config_mode.
         :param config_command: Configuration command to send to the device
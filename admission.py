@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+
+from nxos_XML_errors import TimeoutExpiredError
+
+__version__ = '2019.03.04.1'
+
+logger = logging.getLogger('admission')
+
+# new SSH logins per second and burst size of the shared controller, about what the 0-3 second random start-up
+# sleep used to give with the default thread pool
+DEFAULT_RATE = 10
+DEFAULT_BURST = 10
+
+
+class TokenBucket(object):
+    """
+    Thread safe token bucket, *rate* tokens per second up to *burst* tokens
+
+    Callers reserve a token and then sleep, outside the lock, until their reservation is due, so waiting callers are
+    admitted in the order they asked at exactly the configured rate.
+    """
+
+    def __init__(self, rate, burst):
+        """
+        @param rate: float, tokens added per second
+        @param burst: int, tokens that can be taken at once after the bucket has been idle
+        """
+        if rate <= 0:
+            raise ValueError("token bucket rate must be positive, got {}".format(rate))
+        self.rate = float(rate)
+        self.burst = max(float(burst), 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self):
+        """
+        @return: float, seconds until a token reserved now would be available
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+    def reserve(self):
+        """
+        Takes a token, the balance goes negative when there are callers waiting
+
+        @return: float, seconds the caller has to wait before using the token
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+
+class AdmissionController(object):
+    """
+    Limits the rate of new SSH logins, globally and for each AAA group
+
+    Every login takes a token from the global bucket and, if it names a group that has a limit, from the group's
+    bucket, and waits until both are available. Used by ncssh.SshConnect.sshconnect in place of a random sleep.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, groups=None):
+        """
+        @param rate: float, logins per second across all groups, None for no global limit
+        @param burst: int, logins allowed at once before the rate applies
+        @param groups: dict of AAA group name to (rate, burst) for groups with their own limit
+        """
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.wait_time = 0.0
+        self.configure(rate=rate, burst=burst, groups=groups)
+
+    def configure(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, groups=None):
+        """
+        Replaces the global limit and all group limits, see __init__ for the arguments
+        """
+        with self._lock:
+            self._global = TokenBucket(rate, burst) if rate is not None else None
+            self._groups = dict((group, TokenBucket(group_rate, group_burst))
+                                for group, (group_rate, group_burst) in (groups or {}).items())
+
+    def set_group_limit(self, group, rate, burst):
+        """
+        Sets or replaces the limit for one AAA group, e.g. the devices that authenticate against one TACACS+ cluster
+        """
+        with self._lock:
+            self._groups[group] = TokenBucket(rate, burst)
+
+    def admit(self, group=None, timeout=None):
+        """
+        Blocks until a new login is allowed
+
+        @param group: str, AAA group of the device, or None
+        @param timeout: float, maximum seconds to wait, None to wait as long as it takes
+        @return: float, seconds waited
+        @raise nxos_XML_errors.TimeoutExpiredError: if the login would have to wait longer than timeout, no token is
+        taken in that case
+        """
+        with self._lock:
+            buckets = [bucket for bucket in (self._global, self._groups.get(group)) if bucket is not None]
+            if not buckets:
+                return 0.0
+            if timeout is not None:
+                delay = max(bucket.delay() for bucket in buckets)
+                if delay > timeout:
+                    raise TimeoutExpiredError(
+                        "Login admission for group {} would take {:.1f} seconds, more than {} seconds".format(
+                            group, delay, timeout))
+            wait = max(bucket.reserve() for bucket in buckets)
+            self.admitted += 1
+            self.wait_time += wait
+        if wait:
+            logger.debug("AdmissionController: login for group {} waits {:.3f} seconds".format(group, wait))
+            time.sleep(wait)
+        return wait
+
+
+admission_controller = AdmissionController()
+
+
+def configure_admission(rate=DEFAULT_RATE, burst=DEFAULT_BURST, groups=None):
+    """
+    Replaces the limits of the controller shared by all connections
+
+    @param rate: float, logins per second across all groups, None for no global limit
+    @param burst: int
+    @param groups: dict of AAA group name to (rate, burst)
+    """
+    admission_controller.configure(rate=rate, burst=burst, groups=groups)
+    return admission_controller
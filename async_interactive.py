@@ -0,0 +1,573 @@
+import asyncio
+import functools
+import getpass
+import logging
+import re
+import socket
+import sys
+import time
+import traceback
+
+import nxos_XML_errors
+from SSHInteractive import SSHInteractive, CISCO_CONFIG_PROMPT, CISCO_BASE_PROMPT, CISCO_PRIV_PROMPT, \
+    CISCO_COPY_CONFIG_SAVE_PATTERN, CISCO_RUNNING_CONFIG_COMMAND, PUSH_FILESYSTEM, plan_commands
+from config_diff import missing_config
+from expect_buffer import ExpectBuffer
+from file_transfer import use_file_push
+from pipeline import CommandPipeline
+from running_config import parse_show_run
+
+__version__ = '2019.03.04.1'
+
+logger = logging.getLogger('async_interactive')
+
+# devices in flight at once when no semaphore is given
+DEFAULT_CONCURRENCY = 1000
+
+
+class AsyncSSHInteractive(object):
+    """
+    asyncio front end for SSHInteractive
+
+    sshconnect, ssh_cmd_run, ssh_cmd_action, ssh_config_cmd_set and ssh_parse_test are coroutines with the same
+    arguments and return values as the SSHInteractive methods. Waiting for the device is done on the event loop: the
+    channel's file descriptor is registered with loop.add_reader, so a session waiting for a prompt holds no thread.
+
+    Connecting, which includes key exchange, authentication, prompt discovery and enable, and exec channel commands
+    still run the blocking SSHInteractive code, in *executor*. Bound the executor to limit how many connections are
+    being set up at once. paramiko keeps one transport thread per connection for as long as the session is open.
+    """
+
+    def __init__(self, executor=None):
+        """
+        @param executor: concurrent.futures.Executor for the blocking parts, None for the loop's default executor
+        """
+        self.session = SSHInteractive()
+        self.executor = executor
+        self.logger = logging.getLogger('async_interactive.AsyncSSHInteractive')
+
+    def __getattr__(self, name):
+        # prompt, base_prompt, host, sshconnected, session_log ... come from the session
+        return getattr(self.session, name)
+
+    async def _run_blocking(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def sshconnect(self, host, *args, **kwargs):
+        """
+        Connects to the device, see SSHInteractive.sshconnect for the arguments
+        """
+        await self._run_blocking(self.session.sshconnect, host, *args, **kwargs)
+
+    async def close(self):
+        await self._run_blocking(self.session.close)
+
+    async def _wait_readable(self, timeout):
+        """
+        Waits on the event loop until the channel has data to read or has been closed
+
+        At the end of the stream this returns True at once and recv returns b'', _expect_chunks then raises
+        ServerClosedChannelError rather than waiting again, which would spin without yielding to the event loop.
+
+        @param timeout: float, seconds
+        @return: True if the channel can be read without blocking
+        """
+        channel = self.session._channel
+        if channel.recv_ready() or channel.closed or channel.eof_received:
+            return True
+        if timeout <= 0:
+            return False
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = channel.fileno()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(True))
+        try:
+            await asyncio.wait_for(ready, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_reader(fd)
+
+    async def rpexpect(self, reguexp, timer=None, bytes=9999):
+        """
+        Coroutine version of SshConnect.rpexpect with code 4: reads until reguexp is found and returns the output
+
+        Raises the same exceptions as rpexpect
+        socket.timeout                              nothing received for command_timeout seconds
+        nxos_XML_errors.TimeoutExpiredError         reguexp not found within timer, default command_timeout, seconds
+        nxos_XML_errors.ServerClosedChannelError    the server closed the channel
+        """
+        expect = ExpectBuffer(reguexp)
+        async for _ in self._expect_chunks(expect, timer, bytes):
+            pass
+        return expect.getvalue()
+
+    async def rpexpect_iter(self, reguexp, timer=None, bytes=9999):
+        """
+        Async generator version of SshConnect.rpexpect_iter, yields the output as it arrives until reguexp is found
+        """
+        async for text in self._expect_chunks(ExpectBuffer(reguexp, keep=False), timer, bytes):
+            yield text
+
+    async def _expect_chunks(self, expect, timer, bytes):
+        """
+        Read loop of rpexpect, feeds the output to *expect* until its pattern is found and yields the text decoded
+        from each chunk
+        """
+        session = self.session
+        trace = session.trace
+        reguexp = expect.pattern.pattern
+        looptimer = session.command_timeout if timer is None else timer
+        start = last_data = time.time()
+        while not expect.match:
+            deadline = start + looptimer
+            idle_deadline = last_data + session.command_timeout
+            resp = b''
+            if await self._wait_readable(min(deadline, idle_deadline) - time.time()):
+                resp = session.recv(bytes)
+            elif idle_deadline <= deadline:
+                buff = expect.getvalue()
+                self.logger.error(
+                    "rpexpect: Timedout waiting for response from {}.  Received response:  {}".format(session.host,
+                                                                                                     buff))
+                raise socket.timeout(
+                    "Socket Timedout waiting for expected response {}.  Received response:  {}".format(reguexp, buff))
+            if resp:
+                last_data = time.time()
+                expect.feed(resp)
+                trace("async rpexpect: received %s", resp)
+                if expect.latest:
+                    yield expect.latest
+            if expect.match:
+                break
+            if time.time() - start >= looptimer:
+                buff = expect.getvalue()
+                self.logger.error("rpexpect: Loop Timedout after {} seconds.".format(time.time() - start))
+                raise nxos_XML_errors.TimeoutExpiredError(
+                    "Loop Timedout waiting for expected response {}. Received response {}".format(reguexp, buff))
+            if session._channel.exit_status_ready() or (not resp and session._at_eof()):
+                buff = expect.getvalue()
+                self.logger.error(
+                    "rpexpect: Detected server closed channel while waiting for expected response {}. Received "
+                    "response {}".format(reguexp, buff))
+                session.close()
+                raise nxos_XML_errors.ServerClosedChannelError(
+                    "Detected server closed channel while waiting for expected response {}. Received response {}".format(
+                        reguexp, buff))
+
+    async def _send(self, cmd, tprompt=None):
+        """
+        Coroutine version of SSHInteractive._send
+        """
+        session = self.session
+        prompt = session.prompt if tprompt is None else tprompt
+        trace = session.trace
+        trace.start_command()
+        trace("AsyncSSHInteractive Send: Sending command %s to device %s: waiting for %s", cmd, session.host, prompt)
+        start = time.monotonic()
+        received = session._bytes_received
+        session.send(cmd.strip() + '\n')
+        session.state.invalidate()
+        try:
+            response = await self.rpexpect(prompt)
+        except nxos_XML_errors.ServerClosedChannelError:
+            self.logger.error(
+                "AsyncSSHInteractive Send: Server closed channel while waiting for response to {} to {}".format(
+                    cmd, session.host))
+            session.close()
+            raise
+        except:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            stacktrace = traceback.extract_tb(exc_traceback)
+            self.logger.error(
+                "AsyncSSHInteractive Send: Error waiting for response to {} to {}: {}".format(cmd, session.host,
+                                                                                            exc_value))
+            self.logger.debug(sys.exc_info())
+            self.logger.debug(stacktrace)
+            raise
+        trace("AsyncSSHInteractive Send: response from device %s: %s", session.host, response)
+        session.timing.add_command(cmd.strip(), start, time.monotonic(), session._bytes_received - received)
+        session.state.update(response)
+        session.config_cache.invalidate_for(cmd, session.state.mode)
+        session._log_response_errors(cmd, response)
+        return response
+
+    async def ssh_cmd_run(self, cmdlist, stop_on_error=False):
+        """
+        Coroutine version of SSHInteractive.ssh_cmd_run
+        """
+        session = self.session
+        self.logger.info("AsyncSSHInteractive: ssh_cmd_run: {}".format(session.host))
+        buff = ''
+        if isinstance(cmdlist, str):
+            cmdlist = [cmdlist]
+        if session.type == 'Cisco' and session.channel_mode != 'exec' and not session.state.terminal_ready:
+            await self._send('term len 0')
+            session.state.terminal_ready = True
+        for cmd in cmdlist:
+            if session.channel_mode == 'exec':
+                response = await self._run_blocking(session.exec_command, cmd)
+            else:
+                response = await self._send(cmd)
+            buff += response
+            if stop_on_error and (re.search(r"%\s*Invalid", response) or re.search(r"%\s*Error", response)):
+                self.logger.error("AsyncSSHInteractive ssh_cmd_run: Error Sending " + cmd + " on " + session.host)
+                raise ValueError(
+                    "SSHInteractive: ssh_cmd_run: Error Sending " + cmd + " on " + session.host + ": command output " +
+                    response)
+        return buff
+
+    async def _check_mode(self, check_string=CISCO_CONFIG_PROMPT, pattern='', prompt_pattern=None):
+        known = self.session._known_mode(check_string, pattern, prompt_pattern)
+        if known is not None:
+            return known
+        if prompt_pattern is None:
+            prompt_pattern = r"{}|{}|{}".format(self.session.base_prompt, CISCO_BASE_PROMPT, CISCO_PRIV_PROMPT)
+        output = await self._send("\n", tprompt=pattern or prompt_pattern)
+        return bool(re.search(check_string, output))
+
+    async def check_enable_mode(self, check_string=CISCO_PRIV_PROMPT, pattern=''):
+        return await self._check_mode(check_string=check_string, pattern=pattern)
+
+    async def check_config_mode(self, check_string=CISCO_CONFIG_PROMPT, pattern=''):
+        return await self._check_mode(check_string=check_string, pattern=pattern)
+
+    async def enable(self, cmd='enable', pattern='ssword'):
+        """
+        Coroutine version of SSHInteractive.enable
+        """
+        session = self.session
+        output = ""
+        msg = "Failed to enter enable mode. Please ensure you pass the 'secret' argument to ConnectHandler."
+        if not await self.check_enable_mode():
+            output = await self._send(cmd, tprompt=r"{}|{}".format(session.base_prompt + CISCO_PRIV_PROMPT, pattern))
+            if pattern in output:
+                if session.enable_password is None:
+                    session.enable_password = await self._run_blocking(
+                        getpass.getpass, "Enter enable password for " + session.username + " :  ")
+                output = await self._send(session.enable_password,
+                                          tprompt="{}{}".format(session.base_prompt, CISCO_PRIV_PROMPT))
+            if not await self.check_enable_mode():
+                self.logger.error(msg)
+                raise ValueError(msg)
+        session.prompt = session.base_prompt + CISCO_PRIV_PROMPT
+        return output
+
+    async def config_mode(self, config_command='config term', pattern=''):
+        """
+        Coroutine version of SSHInteractive.config_mode
+        """
+        output = ''
+        if not await self.check_config_mode():
+            output = await self._send(config_command, tprompt=pattern or CISCO_CONFIG_PROMPT)
+            if not await self.check_config_mode():
+                raise ValueError("Failed to enter configuration mode.")
+        self.session.prompt = CISCO_CONFIG_PROMPT
+        return output
+
+    async def exit_config_mode(self, exit_config='end', pattern=CISCO_PRIV_PROMPT):
+        """
+        Coroutine version of SSHInteractive.exit_config_mode
+        """
+        session = self.session
+        output = ''
+        if await self.check_config_mode():
+            output = await self._send(exit_config, tprompt="{}{}".format(session.base_prompt, pattern))
+            if await self.check_config_mode():
+                self.logger.error("AsyncSSHInteractive exit_config mode: Failed to exit configuration mode")
+                raise ValueError("Failed to exit configuration mode")
+        session.prompt = session.base_prompt + CISCO_PRIV_PROMPT
+        return output
+
+    async def save_config(self, cmd="copy running-config startup-config", pat=CISCO_COPY_CONFIG_SAVE_PATTERN,
+                          verification=r"\[OK\]"):
+        """
+        Coroutine version of SSHInteractive.save_config
+        """
+        await self.enable()
+        output = await self._send(cmd, tprompt="{}|{}".format(pat, self.session.prompt))
+        if re.search(CISCO_COPY_CONFIG_SAVE_PATTERN, output):
+            output += await self._send("\n")
+        if not re.search(verification, output) or (
+                re.search(r"%\s*Invalid", output) or re.search(r"%\s*Error", output)):
+            raise ValueError(
+                "An error occurred attempting to save the configuration: output returned: {}".format(output))
+        return output
+
+    async def ssh_cmd_action(self, cmdlist, replace_prompt=False, config=True, config_mode_command=None,
+                             stop_on_error=False, save_config=False, prompt="", window=1):
+        """
+        Coroutine version of SSHInteractive.ssh_cmd_action
+        """
+        session = self.session
+        self.logger.info("AsyncSSHInteractive: ssh_cmd_action: {}".format(session.host))
+        if session.channel_mode == 'exec':
+            raise ValueError("SSHInteractive: ssh_cmd_action: {} is connected with channel_mode 'exec', interactive "
+                             "commands require channel_mode 'shell'".format(session.host))
+        if config:
+            await self.enable()
+            await self.config_mode(*((config_mode_command,) if config_mode_command else tuple()))
+        if replace_prompt:
+            cmd_prompt = session.base_prompt + prompt if prompt else session.prompt
+            cmdlist = [(command, cmd_prompt) for command, prompt_pat in cmdlist]
+        buff = ''
+        if window > 1:
+            for cmd, response in await self._send_pipelined(cmdlist, window, stop_on_error=stop_on_error):
+                buff += response
+                await self._check_action_response(cmd, response, stop_on_error)
+        else:
+            for cmd, cmd_prompt in cmdlist:
+                response = await self._send(cmd, cmd_prompt)
+                buff += response
+                await self._check_action_response(cmd, response, stop_on_error)
+        if save_config:
+            await self.exit_config_mode()
+            await self.save_config()
+        return buff
+
+    async def _check_action_response(self, cmd, response, stop_on_error):
+        """
+        With stop_on_error, leaves config mode and raises ValueError if the response to cmd has a device error
+        """
+        if stop_on_error and (re.search(r"%\s*Invalid", response) or re.search(r"%\s*Error", response)):
+            self.logger.error("AsyncSSHInteractive ssh_cmd_action: Error Sending " + cmd + " on " + self.session.host)
+            await self.exit_config_mode()
+            raise ValueError(
+                "SSHInteractive: ssh_cmd_action: Error Sending " + cmd + " on " + self.session.host +
+                ": command output " + response)
+
+    async def _send_pipelined(self, cmdlist, window, stop_on_error=False):
+        """
+        Coroutine version of SSHInteractive._send_pipelined
+        """
+        session = self.session
+        pipeline = CommandPipeline(cmdlist, window, stop_on_error=stop_on_error, received=session._bytes_received)
+        responses = []
+        if not len(pipeline):
+            return responses
+        session.state.invalidate()
+        session.send(pipeline.next_batch())
+        chunks = self.rpexpect_iter(r"(?!)", timer=session.command_timeout * len(pipeline))
+        try:
+            async for text in chunks:
+                for cmd, response, sent, nbytes in pipeline.feed(text, session._bytes_received):
+                    session.timing.add_command(cmd, sent, time.monotonic(), nbytes)
+                    session._log_response_errors(cmd, response)
+                    responses.append((cmd, response))
+                if pipeline.done:
+                    break
+                batch = pipeline.next_batch()
+                if batch:
+                    session.send(batch)
+        except:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            self.logger.error(
+                "AsyncSSHInteractive _send_pipelined: Error waiting for responses from {} after {} of {} commands: "
+                "{}".format(session.host, len(responses), len(responses) + len(pipeline), exc_value))
+            self.logger.debug(traceback.extract_tb(exc_traceback))
+            raise
+        finally:
+            await chunks.aclose()
+        session.state.update(responses[-1][1])
+        session.config_cache.invalidate()
+        return responses
+
+    async def running_config(self, command=CISCO_RUNNING_CONFIG_COMMAND):
+        """
+        Coroutine version of SSHInteractive.running_config
+        """
+        cache = self.session.config_cache
+        snapshot = cache.get()
+        if snapshot is None:
+            generation = cache.generation
+            snapshot = cache.store(await self.ssh_cmd_run(command), generation)
+        return snapshot
+
+    async def find_missing_config(self, cmdlist, command=CISCO_RUNNING_CONFIG_COMMAND):
+        """
+        Coroutine version of SSHInteractive.find_missing_config
+        """
+        if isinstance(cmdlist, str):
+            cmdlist = (cmdlist,)
+        cmdlist = list(cmdlist)
+        await self.enable()
+        await self.exit_config_mode()
+        missing = missing_config(cmdlist, (await self.running_config(command)).text)
+        self.logger.info("AsyncSSHInteractive: find_missing_config: {} of {} commands missing on {}".format(
+            len(missing), len(cmdlist), self.session.host))
+        return missing
+
+    async def ssh_config_cmd_set(self, cmdlist, config_mode_command=None, stop_on_error=False, save_config=True,
+                                 prompt="", window=1, only_missing=False):
+        """
+        Coroutine version of SSHInteractive.ssh_config_cmd_set
+        """
+        self.logger.info("AsyncSSHInteractive: ssh_config_cmd_set: {}".format(self.session.host))
+        if cmdlist is None:
+            return ''
+        elif isinstance(cmdlist, str):
+            cmdlist = (cmdlist,)
+        if not hasattr(cmdlist, '__iter__'):
+            raise ValueError("SSHInteractive: ssh_config_cmd_set: Invalid argument passed into ssh_config_cmd_set")
+        if only_missing:
+            cmdlist = await self.find_missing_config(cmdlist)
+            if not cmdlist:
+                return ''
+        action_list = [(cmd, "") for cmd in cmdlist]
+        return await self.ssh_cmd_action(action_list, config_mode_command=config_mode_command, replace_prompt=True,
+                                         stop_on_error=stop_on_error, save_config=save_config, prompt=prompt,
+                                         window=window)
+
+    async def push_config_file(self, cmdlist, method='scp', filesystem=PUSH_FILESYSTEM, stop_on_error=False,
+                               save_config=True, keep_file=False):
+        """
+        SSHInteractive.push_config_file run in the executor, the upload and the copy are a few long steps
+        """
+        return await self._run_blocking(self.session.push_config_file, cmdlist, method=method, filesystem=filesystem,
+                                        stop_on_error=stop_on_error, save_config=save_config, keep_file=keep_file)
+
+    async def ssh_parse_test(self, parselist, config_snapshot=True, reuse_outputs=False):
+        """
+        Coroutine version of SSHInteractive.ssh_parse_test
+
+        :return: (passed, parse results, command outputs)
+        """
+        session = self.session
+        self.logger.info("AsyncSSHInteractive: ssh_parse_test: {}".format(session.host))
+        parseresults = {}
+        passed = True
+        command_outputs = ""
+        plan = plan_commands(parselist)
+        outputs = {}
+        if config_snapshot and session.channel_mode != 'exec' and session.state.mode in ('enable', 'user'):
+            commands = [command for command, cmdrs in plan.items() if parse_show_run(cmdrs[0]) is not None]
+            if commands:
+                snapshot = await self.running_config()
+                outputs = dict((command, snapshot.show(plan[command][0])) for command in commands)
+        generation = session.config_cache.generation
+        for command, cmdrs in plan.items():
+            response = outputs.get(command)
+            if response is None and reuse_outputs:
+                response = session.config_cache.output(command)
+            if response is None:
+                response = await self.ssh_cmd_run(cmdrs[0])
+                if reuse_outputs:
+                    session.config_cache.store_output(command, response, generation)
+            command_outputs += response
+            for cmdr in cmdrs:
+                parseresult, cmd_passed = session._parse_response(cmdr, parselist[cmdr], response)
+                passed = passed and cmd_passed
+                parseresults[cmdr] = parseresult
+        session._log_parse_results(passed, parseresults)
+        return passed, parseresults, command_outputs
+
+
+async def configure_device_async(device, user=None, passwd=None, enable_passwd=None, prompt=None, check_priv=True,
+                                 checkdict={"show version": None}, actionlist=None, action_config=True,
+                                 cfg_cmd_set=None, log_session_output=True, log_filename=None, semaphore=None,
+                                 executor=None, timing=False, config_window=1, file_push_threshold=None,
+                                 file_push_method='scp', only_missing=False, **kwargs):
+    """
+    Coroutine version of configure.configure_device, returns the same (device, passed, check results) tuples
+
+    :param semaphore: asyncio.Semaphore held while the device is being worked on
+    :param executor: concurrent.futures.Executor used to connect, see AsyncSSHInteractive
+    :param timing: if True, the session's session_timing.SessionTiming is appended to the result tuple
+    :param config_window: int, cfg_cmd_set commands sent ahead of their prompts, see SSHInteractive.ssh_config_cmd_set
+    :param file_push_threshold: int, cfg_cmd_set with at least this many lines is pushed as a file, see
+    configure.configure_device
+    :param file_push_method: 'scp' or 'sftp'
+    :param only_missing: if True, only send the cfg_cmd_set commands the running configuration does not have
+    :param kwargs: further arguments for SSHInteractive.sshconnect
+    :return: (device, True or False, check response), or (device, None, exception or message) on error
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(1)
+    async with semaphore:
+        device = device.strip()
+        logger.info(device)
+
+        response_filename = None
+        if log_session_output:
+            if log_filename is not None:
+                response_filename = log_filename
+            else:
+                response_filename = device + time.strftime("_%y%m%d%H%M%S", time.gmtime()) + '.txt'
+
+        devob = AsyncSSHInteractive(executor=executor)
+        try:
+            logger.info('Making ssh connection to {}'.format(device))
+            await devob.sshconnect(device, prompt=prompt, username=user, password=passwd, check_priv=check_priv,
+                                   enable_password=enable_passwd, log_session_file=response_filename, **kwargs)
+        except Exception as exc:
+            logger.info("Exception encountered during SSH to device {}".format(device))
+            logger.debug(exc)
+            await devob.close()
+            if timing:
+                return device, None, exc, getattr(devob.session, 'timing', None)
+            return device, None, exc
+        result = None
+        if devob.sshconnected:
+            try:
+                if actionlist is not None:
+                    # configure_device sends an empty action list, the same is done here so results match
+                    await devob.ssh_cmd_action([], replace_prompt=True, config=action_config, stop_on_error=True)
+                if cfg_cmd_set is not None:
+                    if only_missing:
+                        cfg_cmd_set = await devob.find_missing_config(cfg_cmd_set)
+                    if not cfg_cmd_set:
+                        logger.info("{} already has the configuration".format(device))
+                    elif use_file_push(cfg_cmd_set, file_push_threshold):
+                        await devob.push_config_file(cfg_cmd_set, method=file_push_method, stop_on_error=True)
+                    else:
+                        await devob.ssh_config_cmd_set(cfg_cmd_set, stop_on_error=True, window=config_window)
+                passed, check_response, check_outputs = await devob.ssh_parse_test(checkdict)
+                logger.info("Check response for {}: {}".format(device, check_response))
+                result = device, passed, check_response
+                if not passed:
+                    logger.info("{} has failed testing. ".format(device))
+            except Exception as exc:
+                logger.error("Exception encountered while sending commands to device {}".format(device))
+                logger.debug(exc)
+                message = exc
+                if "Invalid input detected at" in str(exc):
+                    message = "exc: {}, Error on device: {}".format(exc, exc)
+                await devob.close()
+                if timing:
+                    return device, None, message, devob.timing
+                return device, None, message
+        await devob.close()
+        if timing:
+            return result + (devob.timing,) if result is not None else (device, None, None, devob.timing)
+        return result
+
+
+async def run_this(fn, vars, max_concurrent=DEFAULT_CONCURRENCY, timeout=None, **kwargs):
+    """
+    asyncio counterpart of configure_threading.thread_this
+
+    :param fn: coroutine function taking a device and a semaphore keyword argument, e.g. configure_device_async
+    :param vars: list of devices
+    :param max_concurrent: int, devices in flight at once
+    :param timeout: float, seconds allowed for each device
+    :param kwargs: further keyword arguments for fn
+    :return: list of results, in the order of vars; errors are reported as "Error: ..." strings as thread_this does
+    """
+    logger.info(" starting asyncio: {} devices in flight".format(max_concurrent))
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def one(var):
+        try:
+            return await asyncio.wait_for(fn(var, semaphore=semaphore, **kwargs), timeout)
+        except asyncio.TimeoutError as err:
+            logger.error("Timeout waiting for result for {}.".format(var))
+            return "Error: Timeout: {}".format(err)
+        except Exception as err:
+            logger.debug("Exception: {}".format(err))
+            return "Error: future.exception: {}".format(err)
+
+    results = await asyncio.gather(*(one(var) for var in vars))
+    logger.info(" ran {} devices with up to {} in flight".format(len(results), max_concurrent))
+    return list(results)
@@ -0,0 +1,62 @@
+"""
+Benchmark for the incremental prompt matching used by ncssh.SshConnect.rpexpect (code 4)
+
+Simulates receiving a large command output, such as show tech or show running-config, in chunks the size of a
+channel read and compares the per-chunk cost of rescanning the whole buffer with the cost of ExpectBuffer.
+"""
+
+import re
+import time
+
+from expect_buffer import ExpectBuffer
+
+CHUNK_SIZE = 8192
+PROMPT = r"switch1#"
+LINE = b"interface GigabitEthernet1/0/1\r\n description some access port on the switch\r\n"
+SIZES_MB = [1, 2, 5, 10, 20]
+# rescanning the whole buffer is quadratic, above this size it takes too long to be worth measuring
+RESCAN_LIMIT_MB = 2
+
+
+def make_chunks(size_mb):
+    data = LINE * (size_mb * 1024 * 1024 // len(LINE)) + b"\r\nswitch1#"
+    return [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+
+
+def rescan(chunks):
+    buff = b''
+    for chunk in chunks:
+        buff += chunk
+        if re.search(PROMPT, buff.decode()):
+            return buff.decode()
+
+
+def incremental(chunks):
+    expect = ExpectBuffer(PROMPT)
+    for chunk in chunks:
+        if expect.feed(chunk):
+            return expect.getvalue()
+
+
+def measure(fn, chunks):
+    start = time.perf_counter()
+    output = fn(chunks)
+    elapsed = time.perf_counter() - start
+    assert output is not None and output.endswith("switch1#")
+    return elapsed, elapsed / len(chunks) * 1e6
+
+
+if __name__ == "__main__":
+    print("{:>8} {:>8} {:>14} {:>16} {:>14} {:>16}".format("size MB", "chunks", "rescan s", "rescan us/chunk",
+                                                            "expect s", "expect us/chunk"))
+    for size_mb in SIZES_MB:
+        chunks = make_chunks(size_mb)
+        if size_mb <= RESCAN_LIMIT_MB:
+            rescan_total, rescan_per_chunk = measure(rescan, chunks)
+            rescan_total, rescan_per_chunk = "{:.3f}".format(rescan_total), "{:.1f}".format(rescan_per_chunk)
+        else:
+            rescan_total, rescan_per_chunk = "-", "-"
+        expect_total, expect_per_chunk = measure(incremental, chunks)
+        print("{:>8} {:>8} {:>14} {:>16} {:>14.3f} {:>16.1f}".format(size_mb, len(chunks), rescan_total,
+                                                                       rescan_per_chunk, expect_total,
+                                                                       expect_per_chunk))
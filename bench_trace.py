@@ -0,0 +1,93 @@
+"""
+Micro-benchmark for the tracing overhead of SSHInteractive._send
+
+The session runs against an in-memory channel that answers every command immediately with an echo and the prompt,
+so the time measured is the per-command overhead of _send, checkconnection, sshconnected, rpexpect and recv.
+Each configuration is timed with tracing off (log level INFO), with tracing on (DEBUG sent to a null stream) and
+with tracing on for 1 in 10 commands.
+"""
+
+import io
+import logging
+import time
+
+from SSHInteractive import SSHInteractive
+from ncssh import SshConnect
+from ssh_trace import HotPathTracer
+
+COMMANDS = 20000
+PROMPT = "switch1#"
+
+
+class MemoryTransport(object):
+    def is_active(self):
+        return True
+
+    def is_authenticated(self):
+        return True
+
+
+class MemoryChannel(object):
+    """Answers each command with its echo, one line of output and the prompt"""
+
+    closed = False
+    eof_received = False
+
+    def __init__(self):
+        self._pending = b''
+
+    def send(self, message):
+        self._pending += message.encode() + b"some output\r\n" + PROMPT.encode()
+
+    def recv(self, nbytes):
+        data, self._pending = self._pending[:nbytes], self._pending[nbytes:]
+        return data
+
+    def recv_ready(self):
+        return bool(self._pending)
+
+    def exit_status_ready(self):
+        return False
+
+    def settimeout(self, timeout):
+        pass
+
+    def gettimeout(self):
+        return 10
+
+
+def memory_session(sample_rate=1):
+    session = SSHInteractive()
+    SshConnect.__init__(session, 'switch1')
+    session._transport = MemoryTransport()
+    session._channel = MemoryChannel()
+    session._sshconnected = True
+    session._command_timeout = 10
+    session.wait_mode = 'event'
+    session.session_log = None
+    session.type = 'Cisco'
+    session.prompt = PROMPT
+    session.trace = HotPathTracer(session.logger, sample_rate=sample_rate)
+    session.init_session_state()
+    return session
+
+
+def per_send(level, sample_rate=1):
+    logging.getLogger().setLevel(level)
+    session = memory_session(sample_rate)
+    start = time.perf_counter()
+    for _ in range(COMMANDS):
+        session._send("show clock")
+    return (time.perf_counter() - start) / COMMANDS * 1e6
+
+
+if __name__ == "__main__":
+    handler = logging.StreamHandler(io.StringIO())
+    logging.getLogger().addHandler(handler)
+    logging.getLogger('paramiko').setLevel(logging.WARNING)
+
+    results = [("tracing off", per_send(logging.INFO)),
+               ("tracing on", per_send(logging.DEBUG)),
+               ("tracing on, 1 in 10 commands", per_send(logging.DEBUG, sample_rate=10))]
+    for name, microseconds in results:
+        print("{:<32} {:>8.1f} us per _send".format(name, microseconds))
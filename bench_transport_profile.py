@@ -0,0 +1,153 @@
+"""
+Throughput of a large show command for each transport profile
+
+A local paramiko server answers any exec request with --size MB of show tech like text. The output is pulled
+with SSHInteractive.exec_command, once over loopback and once through a proxy that emulates a WAN link by delaying
+every packet by half the round trip time and limiting the bandwidth.
+
+    python bench_transport_profile.py [--size MB] [--rtt ms] [--bandwidth Mbit/s]
+"""
+
+import argparse
+import logging
+import queue
+import socket
+import threading
+import time
+
+import paramiko
+
+from SSHInteractive import SSHInteractive
+from transport_profile import PROFILES
+
+HOST_KEY = paramiko.RSAKey.generate(2048)
+LINES = ["interface GigabitEthernet1/0/{}".format(port) for port in range(1, 49)] + [
+    "  5 minute input rate 2000 bits/sec, 3 packets/sec",
+    "     1234567 packets input, 98765432 bytes, 0 no buffer",
+    "     0 input errors, 0 CRC, 0 frame, 0 overrun, 0 ignored",
+]
+
+
+def show_tech(size):
+    text = "\r\n".join(LINES) + "\r\n"
+    return (text * (size // len(text) + 1))[:size].encode()
+
+
+class BenchServer(paramiko.ServerInterface):
+    def __init__(self, output):
+        self.output = output
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        def run():
+            view = memoryview(self.output)
+            for offset in range(0, len(view), 32768):
+                channel.sendall(view[offset:offset + 32768])
+            channel.send_exit_status(0)
+            channel.close()
+
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+
+def serve(output):
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(16)
+
+    def accept():
+        while True:
+            sock, _ = listener.accept()
+            transport = paramiko.Transport(sock)
+            transport.add_server_key(HOST_KEY)
+            # offer compression, the client's profile decides whether it is used
+            transport.use_compression(True)
+            transport.start_server(server=BenchServer(output))
+
+    threading.Thread(target=accept, daemon=True).start()
+    return listener.getsockname()[1]
+
+
+def link(source, destination, delay, bandwidth):
+    """Forward one direction of a connection, delaying each read by delay seconds and pacing it to bandwidth"""
+    pending = queue.Queue()
+
+    def read():
+        while True:
+            data = source.recv(65536)
+            pending.put((time.time() + delay, data))
+            if not data:
+                return
+
+    def write():
+        free_at = 0.0
+        while True:
+            due, data = pending.get()
+            if not data:
+                destination.shutdown(socket.SHUT_WR)
+                return
+            free_at = max(free_at, due) + (len(data) / bandwidth if bandwidth else 0)
+            wait = free_at - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            destination.sendall(data)
+
+    threading.Thread(target=read, daemon=True).start()
+    threading.Thread(target=write, daemon=True).start()
+
+
+def wan_proxy(port, rtt, bandwidth):
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(16)
+
+    def accept():
+        while True:
+            client, _ = listener.accept()
+            server = socket.create_connection(('127.0.0.1', port))
+            link(client, server, rtt / 2, bandwidth)
+            link(server, client, rtt / 2, bandwidth)
+
+    threading.Thread(target=accept, daemon=True).start()
+    return listener.getsockname()[1]
+
+
+def pull(port, profile, host_key_filename):
+    session = SSHInteractive()
+    session.sshconnect('127.0.0.1', port=port, username='bench', password='bench', channel_mode='exec',
+                       host_key_filename=host_key_filename, transport_profile=profile, command_timeout=120)
+    try:
+        start = time.perf_counter()
+        output = session.exec_command('show tech-support', bytes=262144)
+        elapsed = time.perf_counter() - start
+    finally:
+        session.close()
+    return len(output), elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=32, help='show tech output in MB')
+    parser.add_argument('--rtt', type=float, default=200, help='emulated WAN round trip time in ms')
+    parser.add_argument('--bandwidth', type=float, default=100, help='emulated WAN bandwidth in Mbit/s, 0 for none')
+    args = parser.parse_args()
+    logging.getLogger('paramiko').setLevel(logging.WARNING)
+
+    port = serve(show_tech(args.size * 1024 * 1024))
+    links = [("loopback", port),
+             ("wan {:g} ms, {:g} Mbit/s".format(args.rtt, args.bandwidth),
+              wan_proxy(port, args.rtt / 1000, args.bandwidth * 1e6 / 8))]
+    host_key_filename = '/tmp/bench_transport_profile_known_hosts'
+    for link_name, link_port in links:
+        for name in PROFILES:
+            received, elapsed = pull(link_port, name, host_key_filename)
+            print("{:<26} {:<8} {:>6.1f} MB in {:>6.2f} s  {:>7.1f} MB/s".format(
+                link_name, name, received / 1e6, elapsed, received / 1e6 / elapsed))
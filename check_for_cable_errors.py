@@ -1,7 +1,6 @@
 import functools
 import logging
 import multiprocessing
-import random
 import re
 import sys
 import time
@@ -9,6 +8,7 @@ import traceback
 
 from SSHInteractive import SSHInteractive
 from configure_threading import thread_this
+from resolver import prefetch, qualify
 
 logger = logging.getLogger('check_for_cable_errors')
 
@@ -24,9 +24,10 @@ def get_switch_members(output):
     return switches
 
 
-def check_for_cable_errors(device, user="user", passwd="password", cmdlist1=[], cmdlist2=[]):
+def check_for_cable_errors(device, user="user", passwd="password", cmdlist1=[], cmdlist2=[], channel_mode='exec'):
     """
 
+    :param channel_mode: 'exec' runs each show command on its own exec channel, 'shell' uses an interactive shell
     :param device:
     :param user:
     :param passwd:
@@ -34,7 +35,6 @@ def check_for_cable_errors(device, user="user", passwd="password", cmdlist1=[],
     :param checkdict:
     :return:
     """
-    time.sleep(3 * random.random())
     device = device.strip()
     logger.info(device)
     logger.info("=" * 40)
@@ -47,12 +47,12 @@ def check_for_cable_errors(device, user="user", passwd="password", cmdlist1=[],
         preprompt = device.replace('example.com', '')
         prompt = preprompt + "#"
     logger.debug(prompt)
-    devob = SSHInteractive(device, prompt)
+    devob = SSHInteractive()
 
     # SSH
     try:
         logger.info('Making ssh connection to {}'.format(device))
-        devob.sshconnect(username=user, password=passwd)
+        devob.sshconnect(device, prompt=prompt, username=user, password=passwd, channel_mode=channel_mode)
     except Exception as exc:
         logger.info("Exception encountered during SSH to device {}".format(device))
         logger.debug(exc)
@@ -61,12 +61,11 @@ def check_for_cable_errors(device, user="user", passwd="password", cmdlist1=[],
         try:
             result_cmdlist1 = devob.ssh_cmd_run(cmdlist1)
             switches = get_switch_members(result_cmdlist1)
-            errors = {}
-            for switch in switches:
-                result_errors = devob.ssh_cmd_run(
-                    'show platform port-asic 0 read register SifRacRwCrcErrorCnt switch ' + switch)
-                errors[switch] = result_errors
-                logger.debug("device {} switch {} error result {}".format(device, switch, result_errors))
+            # the register reads for each stack member are independent, run them on separate channels
+            result_errors = devob.ssh_cmd_run_parallel(
+                ['show platform port-asic 0 read register SifRacRwCrcErrorCnt switch ' + switch for switch in switches])
+            errors = dict(zip(switches, result_errors))
+            logger.debug("device {} error results {}".format(device, errors))
             result_cmdlist2 = devob.ssh_cmd_run(cmdlist2)
         except:
             exc_type, exc_value, exc_traceback = sys.exc_info()
@@ -129,6 +128,8 @@ if __name__ == "__main__":
     num_threads = min(len(devices), multiprocessing.cpu_count() * 4)
 
     start = time.time()
+    # the workers connect to the FQDN, resolve them all before dispatching
+    prefetch(qualify(device, ".example.com") for device in devices if device.strip())
     results = thread_this(check_for_cable_errors_partial, devices, max_threads=num_threads)
     print("{} threads total time : {}".format(num_threads, time.time() - start))
 
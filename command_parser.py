@@ -1,6 +1,15 @@
+import ast
+import functools
 import logging
+import math
+import operator
 import re
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 __version__ = '2019.02.22.1'
 
 logger = logging.getLogger('command_parser')
@@ -25,9 +34,7 @@ class ConfigParse(str):
             return False
 
     def existl(self, list_pat):
-        self._result = []
-        for pat in list_pat:
-            self._result.append(self.exist(pat))
+        self._result = pattern_scanner(list_pat).exist(self)
         return self._result
 
     def notexist(self, pat):
@@ -37,18 +44,14 @@ class ConfigParse(str):
             return True
 
     def notexistl(self, list_pat):
-        self._result = []
-        for pat in list_pat:
-            self._result.append(self.notexist(pat))
+        self._result = pattern_scanner(list_pat).notexist(self)
         return self._result
 
     def count(self, pat):
         return len(re.findall(pat, self))
 
     def countl(self, list_pat):
-        self._result = []
-        for pat in list_pat:
-            self._result.append(self.count(pat))
+        self._result = pattern_scanner(list_pat).count(self)
         return self._result
 
     def countcmpl(self, list_pat, mult=1):
@@ -74,6 +77,156 @@ class ConfigParse(str):
         return re.findall(pat, self)
 
 
+@functools.lru_cache(maxsize=1024)
+def _compile_bytes(pat):
+    return re.compile(pat.encode() if isinstance(pat, str) else pat)
+
+
+class MappedConfigParse(object):
+    """
+    ConfigParse over bytes, e.g. an mmap of a spooled command output, so the output never has to be a Python str
+
+    Has the same methods as ConfigParse and can be passed to commandparse. str patterns are encoded and compiled as
+    bytes patterns, so \\d, \\w and \\s only match ASCII characters. searchall returns str, as ConfigParse does,
+    searchpat returns a bytes match object.
+    """
+
+    def __init__(self, data, encoding='utf-8'):
+        """
+        :param data: bytes, bytearray or mmap.mmap
+        :param encoding: str, used to decode searchall results
+        """
+        self.data = data
+        self.encoding = encoding
+
+    def _decode(self, found):
+        if isinstance(found, tuple):
+            return tuple(self._decode(group) for group in found)
+        return found.decode(self.encoding, 'replace')
+
+    def exist(self, pat):
+        return _compile_bytes(pat).search(self.data) is not None
+
+    def existl(self, list_pat):
+        self._result = [self.exist(pat) for pat in list_pat]
+        return self._result
+
+    def notexist(self, pat):
+        return not self.exist(pat)
+
+    def notexistl(self, list_pat):
+        self._result = [self.notexist(pat) for pat in list_pat]
+        return self._result
+
+    def count(self, pat):
+        return sum(1 for match in _compile_bytes(pat).finditer(self.data))
+
+    def countl(self, list_pat):
+        self._result = [self.count(pat) for pat in list_pat]
+        return self._result
+
+    def countcmpl(self, list_pat, mult=1):
+        self._count = self.count(list_pat[0])
+        self._result = []
+        try:
+            for pat in list_pat[1:]:
+                if self.count(pat) * mult != self._count:
+                    self._result.append(False)
+                    return self._result
+            if self._count == 0:
+                self._result.append(None)
+            else:
+                self._result.append(True)
+            return self._result
+        except:
+            return "Error:  Problem in the Pattern List"
+
+    def searchpat(self, pat):
+        return _compile_bytes(pat).search(self.data)
+
+    def searchall(self, pat):
+        return [self._decode(found) for found in _compile_bytes(pat).findall(self.data)]
+
+    def __len__(self):
+        return len(self.data)
+
+
+# expressions of countcmpnuml, countcmpnumzl and numcmpl that are a single comparison with a number
+COMPARISON_PATTERN = re.compile(r"^\s*(<=|>=|==|!=|<|>)\s*"
+                                r"([-+]?(?:\d[\d_]*(?:\.[\d_]*)?|\.\d[\d_]*)(?:[eE][-+]?\d+)?)\s*$")
+COMPARISON_OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '==': operator.eq,
+                        '!=': operator.ne}
+# numcmpl compares this many extracted numbers or more as a numpy array, when numpy is installed
+VECTORIZE_THRESHOLD = 256
+
+
+class NumericComparison(object):
+    """
+    The expression of a countcmpnuml, countcmpnumzl or numcmpl tuple, e.g. '> 16000000', parsed once
+
+    A number is tested as commandparse always did, by evaluating str(float(number)) + expression. An expression that
+    is a single comparison with a number literal is turned into the operator and its operand, anything else is still
+    evaluated with eval, as are numbers that are not finite, whose str is not a Python literal.
+    """
+
+    def __init__(self, expression):
+        """
+        @param expression: str, e.g. '> 16000000'
+        """
+        self.expression = expression
+        self.compare = None
+        self.operand = None
+        match = COMPARISON_PATTERN.match(expression) if isinstance(expression, str) else None
+        if match:
+            try:
+                self.operand = ast.literal_eval(match.group(2))
+                self.compare = COMPARISON_OPERATORS[match.group(1)]
+            except (ValueError, SyntaxError):
+                logger.debug("NumericComparison: {} left to eval".format(expression))
+
+    def __call__(self, number):
+        """
+        @param number: float
+        @return: boolean
+        """
+        if self.compare is None or not math.isfinite(number):
+            return eval(str(number) + self.expression)
+        return self.compare(number, self.operand)
+
+    def all(self, numbers):
+        """
+        Tests every number, as numcmpl does, without stopping at the first one that fails
+
+        @param numbers: list of float
+        @return: boolean, True if every number satisfies the comparison
+        """
+        if (numpy is not None and self.compare is not None and len(numbers) >= VECTORIZE_THRESHOLD and
+                (isinstance(self.operand, float) or abs(self.operand) <= 2 ** 53)):
+            array = numpy.array(numbers, dtype=float)
+            if numpy.isfinite(array).all():
+                return bool(self.compare(array, self.operand).all())
+        return all([self(number) for number in numbers])
+
+    def __repr__(self):
+        return "NumericComparison({!r})".format(self.expression)
+
+
+@functools.lru_cache(maxsize=1024)
+def _cached_comparison(expression):
+    return NumericComparison(expression)
+
+
+def comparison(expression):
+    """
+    @param expression: str, e.g. '> 1'
+    @return: NumericComparison of expression, parsed expressions are kept for reuse
+    """
+    try:
+        return _cached_comparison(expression)
+    except TypeError:
+        return NumericComparison(expression)
+
+
 def commandparse(output, pattern_dic):
     """
     Version 1.1
@@ -88,8 +241,16 @@ def commandparse(output, pattern_dic):
     Added numcmpl - extract a number from the output object and compare to a logical expression supplied in a
     tuple of form (r'\((\d+) bytes free\)', '> 16000000').  The method should be given a list of tuples.
     Returns true if the expression evaluates to true.
+
+    The expressions are parsed once into NumericComparison, see comparison. countcmpnuml and countcmpnumzl return
+    lists.
+
+    pattern_dic may also be a CompiledChecks, from a CheckPlan, which gives the same result without interpreting the
+    flags and patterns again.
     """
 
+    if isinstance(pattern_dic, CompiledChecks):
+        return pattern_dic(output)
     # print pattern_dic
     resultd = {}
     for flag in pattern_dic.keys():
@@ -121,7 +282,7 @@ def commandparse(output, pattern_dic):
             nums = [j for i, j in pat]
             resultp = output.countl(pats)
             try:
-                result = map((lambda r, op: eval(str(float(r)) + op)), resultp, nums)
+                result = [comparison(op)(float(r)) for r, op in zip(resultp, nums)]
             except:
                 result = ["Error in List or Regular Expression"]
         elif flag == 'countcmpnumzl':
@@ -130,7 +291,7 @@ def commandparse(output, pattern_dic):
             nums = [j for i, j in pat]
             resultp = output.countl(pats)
             try:
-                result = map((lambda r, op: eval(str(float(r)) + op) or r == 0), resultp, nums)
+                result = [comparison(op)(float(r)) or r == 0 for r, op in zip(resultp, nums)]
             except:
                 result = ["Error in List or Regular Expression"]
         elif flag == 'numcmpl':
@@ -145,10 +306,8 @@ def commandparse(output, pattern_dic):
             fail = 0
             m = 0
             for rl in resultp:
-                op = nums[m]
-                for r in rl:
-                    if not eval(str(float(r)) + op):
-                        fail = 1
+                if not comparison(nums[m]).all([float(r) for r in rl]):
+                    fail = 1
                 m += 1
                 if fail:
                     result.append(False)
@@ -158,3 +317,308 @@ def commandparse(output, pattern_dic):
             result = "Error:  " + flag + " =Unsupported Flag"
         resultd[flag] = result
     return resultd
+
+
+# a pattern without regular expression syntax, other than punctuation escaped with a backslash
+LITERAL_PATTERN = re.compile(r"(?:[^\\.^$*+?{}\[\]|()]|\\[^A-Za-z0-9])*\Z")
+
+
+class _LiteralPattern(object):
+    """
+    A pattern that is plain text, searched for and counted with str methods, which give the same results as re and
+    are faster at it
+    """
+
+    def __init__(self, pat):
+        self.pat = pat
+        self.text = re.sub(r"\\(.)", r"\1", pat, flags=re.DOTALL)
+
+    def exists(self, string):
+        return self.text in string
+
+    # str.count, ConfigParse.count takes a regular expression
+    def count(self, string):
+        return str.count(string, self.text)
+
+    def findall(self, string):
+        return [self.text] * str.count(string, self.text)
+
+
+class _RegexPattern(object):
+
+    def __init__(self, pat):
+        self.pat = pat
+        self.regex = re.compile(pat)
+        self.findall = self.regex.findall
+
+    def exists(self, string):
+        return self.regex.search(string) is not None
+
+    def count(self, string):
+        return len(self.regex.findall(string))
+
+
+class _UncompiledPattern(object):
+    """
+    Stands in for a pattern that does not compile, so the error is raised when the pattern is used, as it is by
+    commandparse
+    """
+
+    def __init__(self, pat):
+        self.pat = pat
+
+    def _raise(self, string):
+        re.compile(self.pat)
+
+    exists = count = findall = _raise
+
+
+def _make_pattern(pat):
+    if isinstance(pat, str) and LITERAL_PATTERN.match(pat):
+        return _LiteralPattern(pat)
+    try:
+        return _RegexPattern(pat)
+    except (re.error, TypeError):
+        return _UncompiledPattern(pat)
+
+
+def _compile_pattern(pat, patterns):
+    try:
+        return patterns[pat]
+    except KeyError:
+        pass
+    except TypeError:
+        return _UncompiledPattern(pat)
+    compiled = patterns[pat] = _make_pattern(pat)
+    return compiled
+
+
+class PatternScanner(object):
+    """
+    A list of patterns compiled once, giving the results of existl, notexistl and countl
+
+    Patterns that are plain text are searched for with str methods, the others are compiled regular expressions.
+    Each pattern is still a scan of its own: combined into one alternation, the re module tries every branch at
+    every position of the output and loses the fast search for each pattern's literal prefix, which made a single
+    pass slower than one pass per pattern.
+    """
+
+    def __init__(self, list_pat, patterns=None):
+        """
+        @param list_pat: list of patterns
+        @param patterns: dictionary of pattern to compiled pattern, shared by the checks of a CheckPlan
+        """
+        if patterns is None:
+            patterns = {}
+        self.list_pat = list_pat
+        self._patterns = [_compile_pattern(pat, patterns) for pat in list_pat]
+
+    def exist(self, output):
+        """
+        @param output: str
+        @return: list of boolean, True for each pattern found in output
+        """
+        return [pattern.exists(output) for pattern in self._patterns]
+
+    def notexist(self, output):
+        return [not pattern.exists(output) for pattern in self._patterns]
+
+    def count(self, output):
+        """
+        @return: list of int, the non-overlapping matches of each pattern, as re.findall
+        """
+        return [pattern.count(output) for pattern in self._patterns]
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_scanner(list_pat):
+    return PatternScanner(list_pat)
+
+
+def pattern_scanner(list_pat):
+    """
+    @param list_pat: list of patterns
+    @return: PatternScanner of list_pat, scanners are kept for reuse
+    """
+    try:
+        return _cached_scanner(tuple(list_pat))
+    except TypeError:
+        return PatternScanner(list_pat)
+
+
+def _compile_exist(pat, patterns):
+    return _compile_pattern(pat, patterns).exists
+
+
+def _compile_existl(pat, patterns):
+    return PatternScanner(pat, patterns).exist
+
+
+def _compile_notexist(pat, patterns):
+    pattern = _compile_pattern(pat, patterns)
+    return lambda output: not pattern.exists(output)
+
+
+def _compile_notexistl(pat, patterns):
+    return PatternScanner(pat, patterns).notexist
+
+
+def _compile_count(pat, patterns):
+    return _compile_pattern(pat, patterns).count
+
+
+def _compile_countl(pat, patterns):
+    return PatternScanner(pat, patterns).count
+
+
+def _compile_countcmpl(pat, patterns):
+    list_pat, mult = pat[0], pat[1]
+    first = _compile_pattern(list_pat[0], patterns)
+    rest = [_compile_pattern(i, patterns) for i in list_pat[1:]]
+
+    def countcmpl(output):
+        count = first.count(output)
+        try:
+            for pattern in rest:
+                if pattern.count(output) * mult != count:
+                    return [False]
+            return [None] if count == 0 else [True]
+        except:
+            return "Error:  Problem in the Pattern List"
+
+    return countcmpl
+
+
+def _compile_countcmpnuml(pat, patterns, zero=False):
+    compiled = [_compile_pattern(i, patterns) for i, j in pat]
+    comparisons = [comparison(j) for i, j in pat]
+
+    def countcmpnuml(output):
+        resultp = [pattern.count(output) for pattern in compiled]
+        try:
+            if zero:
+                return [compare(float(r)) or r == 0 for r, compare in zip(resultp, comparisons)]
+            return [compare(float(r)) for r, compare in zip(resultp, comparisons)]
+        except:
+            return ["Error in List or Regular Expression"]
+
+    return countcmpnuml
+
+
+def _compile_countcmpnumzl(pat, patterns):
+    return _compile_countcmpnuml(pat, patterns, zero=True)
+
+
+def _compile_numcmpl(pat, patterns):
+    compiled = [_compile_pattern(i, patterns) for i, k in pat]
+    comparisons = [comparison(k) for i, k in pat]
+
+    def numcmpl(output):
+        result = []
+        # as in commandparse, one failing pattern fails every pattern after it
+        fail = 0
+        for pattern, compare in zip(compiled, comparisons):
+            if not compare.all([float(r) for r in pattern.findall(output)]):
+                fail = 1
+            result.append(not fail)
+        return result
+
+    return numcmpl
+
+
+# flag -> function of (pattern, compiled pattern cache) returning the evaluator of the flag
+FLAG_COMPILERS = {
+    'exist': _compile_exist,
+    'existl': _compile_existl,
+    'notexist': _compile_notexist,
+    'notexistl': _compile_notexistl,
+    'count': _compile_count,
+    'countl': _compile_countl,
+    'countcmpl': _compile_countcmpl,
+    'countcmpnuml': _compile_countcmpnuml,
+    'countcmpnumzl': _compile_countcmpnumzl,
+    'numcmpl': _compile_numcmpl,
+}
+
+
+class CompiledChecks(object):
+    """
+    The tests of one command, a commandparse pattern_dic, with every pattern compiled and every flag resolved to its
+    evaluator once
+
+    Calling it with the output of the command returns what commandparse(output, pattern_dic) returns, including the
+    error results and the exceptions raised for bad patterns, which are raised when the output is tested rather
+    than when the tests are compiled. Flags whose patterns do not have the shape the flag expects are left to
+    commandparse. It holds no state between calls and can be shared by threads.
+    """
+
+    def __init__(self, pattern_dic, patterns=None):
+        """
+        @param pattern_dic: dictionary of flag to patterns, as for commandparse
+        @param patterns: dictionary of pattern to compiled pattern, shared by the checks of a CheckPlan
+        """
+        self.pattern_dic = pattern_dic
+        if patterns is None:
+            patterns = {}
+        self._evaluators = []
+        for flag, pat in pattern_dic.items():
+            compiler = FLAG_COMPILERS.get(flag)
+            if compiler is None:
+                result = "Error:  " + flag + " =Unsupported Flag"
+                evaluator = lambda output, result=result: result
+            else:
+                try:
+                    evaluator = compiler(pat, patterns)
+                except Exception:
+                    logger.debug("CompiledChecks: {} {} left to commandparse".format(flag, pat))
+                    evaluator = functools.partial(self._interpret, {flag: pat}, flag)
+            self._evaluators.append((flag, evaluator))
+
+    @staticmethod
+    def _interpret(pattern_dic, flag, output):
+        if not isinstance(output, (ConfigParse, MappedConfigParse)):
+            output = ConfigParse(output)
+        return commandparse(output, pattern_dic)[flag]
+
+    def __call__(self, output):
+        """
+        @param output: str, ConfigParse or MappedConfigParse
+        @return: dictionary of flag to result, as commandparse
+        """
+        if isinstance(output, MappedConfigParse):
+            # bytes patterns, commandparse compiles and caches them
+            return commandparse(output, self.pattern_dic)
+        return dict((flag, evaluator(output)) for flag, evaluator in self._evaluators)
+
+    def __repr__(self):
+        return repr(self.pattern_dic)
+
+
+class CheckPlan(dict):
+    """
+    A checkdict, as given to SSHInteractive.ssh_parse_test, compiled once, so the same checks can be run against
+    every device of a thread_this run without interpreting them again for each device
+
+    It is a dictionary of command to CompiledChecks, or None for commands whose output is only collected, and can be
+    passed anywhere a checkdict is. A pattern used by several commands is compiled once.
+
+    checkdict = CheckPlan({'show run | in snmp': {'existl': [r'snmp-server community public RO']}})
+    """
+
+    def __init__(self, checkdict):
+        """
+        @param checkdict: dictionary of command to a commandparse pattern_dic, or None
+        """
+        patterns = {}
+        dict.__init__(self, ((command, tests if tests is None or isinstance(tests, CompiledChecks)
+                              else CompiledChecks(tests, patterns)) for command, tests in checkdict.items()))
+        logger.debug("CheckPlan: {} commands, {} patterns".format(len(self), len(patterns)))
+
+    def evaluate(self, command, output):
+        """
+        @param command: str, a command of the plan
+        @param output: str, ConfigParse or MappedConfigParse, output of the command
+        @return: dictionary of flag to result, as commandparse, or None if the command has no tests
+        """
+        checks = self[command]
+        return None if checks is None else checks(output)
@@ -0,0 +1,142 @@
+import logging
+
+__version__ = '2019.03.04.1'
+
+logger = logging.getLogger('config_diff')
+
+
+def _normalise(line):
+    return ' '.join(line.split())
+
+
+def _indent(line):
+    return len(line) - len(line.lstrip(' '))
+
+
+def config_paths(running):
+    """
+    Paths of all lines of a running configuration, a line's path is the tuple of its parents' lines and its own
+
+    Lines are nested by indentation, as in show running-config, and compared with whitespace collapsed.
+
+    @param running: str, output of show running-config
+    @return: set of tuples of str
+    """
+    paths = set()
+    stack = []
+    for line in running.splitlines():
+        text = _normalise(line)
+        if not text or text.startswith('!'):
+            continue
+        indent = _indent(line.expandtabs())
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        path = tuple(parent for _, parent in stack) + (text,)
+        paths.add(path)
+        stack.append((indent, text))
+    return paths
+
+
+def _modes(paths):
+    """
+    @return: function of an unindented line, True if the line enters a mode: it has lines under it in the running
+    configuration, or a line that differs from it only in the last word does, as interface Loopback0 with nothing
+    under it next to interface Gi1
+    """
+    modes = set(path[0] for path in paths if len(path) > 1)
+    prefixes = set(mode.rsplit(' ', 1)[0] for mode in modes if ' ' in mode)
+    return lambda text: text in modes or (' ' in text and text.rsplit(' ', 1)[0] in prefixes)
+
+
+def _present(path, paths):
+    if path in paths:
+        return True
+    # a no command is in effect when the line it negates is absent, unless the device lists the no form itself
+    if path[-1].startswith('no ') and (len(path) == 1 or path[:-1] in paths):
+        return path[:-1] + (path[-1][3:],) not in paths
+    return False
+
+
+def missing_config(cmdlist, running):
+    """
+    The configuration commands in cmdlist that are not in the running configuration, with the lines needed to reach
+    the mode they are entered in
+
+    Commands are compared as they appear in show running-config, an abbreviated command is never found and is
+    always sent. Indented commands belong to the unindented command above them, as in the running configuration,
+    which is exact and is the form to use when the list mixes modes.
+
+    A flat list, without indentation, is read as the device reads it: an unindented command is a child of the
+    unindented command before it in cmdlist when the running configuration has it there, so
+    ['interface Gi1', 'description uplink'] works as well. Otherwise a command the running configuration has at the
+    top level ends that mode, and starts a new one if it enters a mode, see _modes. When a command is missing, the
+    command whose mode it was entered in is sent before it, even if that one is present. A no command in the flat
+    form is checked against the mode of the command above it before the top level, so it is sent when it negates a
+    line of that mode:
+
+    >>> missing_config(['interface Gi1', 'no shutdown'], 'interface Gi1\\n shutdown\\n')
+    ['interface Gi1', 'no shutdown']
+    >>> missing_config(['interface Gi1', 'no shutdown'], 'interface Gi1\\n description uplink\\n')
+    []
+    >>> running = 'interface Gi1\\n description uplink\\nsnmp-server community public RO\\n'
+    >>> missing_config(['interface Gi1', ' description uplink', ' shutdown', 'snmp-server community public RO'],
+    ...                running)
+    ['interface Gi1', ' shutdown']
+    >>> missing_config(['interface Gi1', 'description uplink', 'snmp-server community public RO', 'shutdown'],
+    ...                running)
+    ['shutdown']
+
+    @param cmdlist: iterable of configuration commands
+    @param running: str, output of show running-config
+    @return: list of str, the commands to send, in their original order and form, empty if there is nothing to do
+    """
+    paths = config_paths(running)
+    is_mode = _modes(paths)
+    missing = []
+    # (indent, text, index in cmdlist) of the indented parents of the current line
+    stack = []
+    # index of the last unindented command, the mode for unindented commands that are children of it
+    context = None
+    sent = set()
+    cmdlist = [cmd for cmd in cmdlist if _normalise(cmd)]
+
+    def send(index):
+        if index is not None and index not in sent:
+            sent.add(index)
+            missing.append(cmdlist[index])
+
+    for index, cmd in enumerate(cmdlist):
+        text = _normalise(cmd)
+        indent = _indent(cmd.expandtabs())
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        if stack:
+            if not _present(tuple(parent for _, parent, _ in stack) + (text,), paths):
+                for _, _, parent_index in stack:
+                    send(parent_index)
+                send(index)
+        elif context is None:
+            if not _present((text,), paths):
+                send(index)
+            context = index
+        else:
+            parent = _normalise(cmdlist[context])
+            if (parent, text) in paths:
+                pass
+            elif (text,) in paths:
+                # back at the top level, snmp-server community after interface Gi1 leaves the interface
+                context = index if is_mode(text) else None
+            elif text.startswith('no ') and (parent, text[3:]) in paths:
+                # negates a line of the mode it is entered in
+                send(context)
+                send(index)
+            elif text.startswith('no ') and (parent,) in paths and (text[3:],) not in paths:
+                # the line it negates is in neither the mode nor the top level, the no command is in effect
+                pass
+            else:
+                send(context)
+                send(index)
+                context = index
+        stack.append((indent, text, index))
+    logger.debug("missing_config: {} of {} commands to send".format(len(missing), len(cmdlist)))
+    return missing
@@ -1,12 +1,14 @@
 import functools
 import logging
 import multiprocessing
-import random
 import sys
 import time
 
 from SSHInteractive import SSHInteractive
+from command_parser import CheckPlan
 from configure_threading import thread_this
+from file_transfer import use_file_push
+from resolver import prefetch
 
 __version__ = '2019.02.22.1'
 
@@ -15,7 +17,9 @@ logger = logging.getLogger('configure')
 
 def configure_device(device, user=None, passwd=None, enable_passwd=None, prompt=None, check_priv=True,
                      checkdict={"show version": None}, actionlist=None, action_config=True, cfg_cmd_set=None,
-                     log_session_output=True, log_filename=None):
+                     log_session_output=True, log_filename=None, pool=None, timing=False,
+                     admission_group=None, config_window=1, file_push_threshold=None, file_push_method='scp',
+                     only_missing=False):
     """
 
     :param prompt:
@@ -28,9 +32,21 @@ def configure_device(device, user=None, passwd=None, enable_passwd=None, prompt=
     :param checkdict:
     :param enable_passwd: str, enable password
     :param check_priv: if True, check if in privilege mode and attempt to put into privilege mode
+    :param pool: connection_pool.ConnectionPool, if given the session is borrowed from and returned to the pool
+    instead of connecting and closing it
+    :param admission_group: AAA group the device authenticates against, new logins are rate limited per group, see
+    admission.AdmissionController
+    :param timing: if True, the session's session_timing.SessionTiming, or None if there is no session, is appended to
+    the result tuple
+    :param config_window: int, cfg_cmd_set commands sent ahead of their prompts, see SSHInteractive.ssh_config_cmd_set
+    :param file_push_threshold: int, cfg_cmd_set with at least this many lines is uploaded as a file and merged with
+    copy to running-config instead of being entered line by line, see SSHInteractive.push_config_file. None to always
+    enter it line by line
+    :param file_push_method: 'scp' or 'sftp', used for the upload
+    :param only_missing: if True, fetch the running configuration once and only send the cfg_cmd_set commands it does
+    not have, nothing is sent or saved if it has all of them, see SSHInteractive.find_missing_config
     :return:
     """
-    time.sleep(3 * random.random())
     device = device.strip()
     logger.info(device)
     logger.info("=" * 40)
@@ -47,14 +63,23 @@ def configure_device(device, user=None, passwd=None, enable_passwd=None, prompt=
     # SSH
     devob = None
     try:
-        devob = SSHInteractive()
         logger.info('Making ssh connection to {}'.format(device))
-        devob.sshconnect(device, prompt=prompt, username=user, password=passwd, check_priv=check_priv,
-                         enable_passwd=enable_passwd, log_session_file=response_filename)
+        if pool is not None:
+            devob = pool.acquire(device, prompt=prompt, username=user, password=passwd, check_priv=check_priv,
+                                 enable_password=enable_passwd, log_session_file=response_filename,
+                                 admission_group=admission_group)
+        else:
+            devob = SSHInteractive()
+            devob.sshconnect(device, prompt=prompt, username=user, password=passwd, check_priv=check_priv,
+                             enable_password=enable_passwd, log_session_file=response_filename,
+                             admission_group=admission_group)
     except Exception as exc:
         logger.info("Exception encountered during SSH to device {}".format(device))
         logger.debug(exc)
-        devob.close()
+        if devob is not None and pool is None:
+            devob.close()
+        if timing:
+            return device, None, exc, getattr(devob, 'timing', None)
         return device, None, exc
     action_response, cmd_response, check_response, result, check_outputs = None, None, None, None, None
     if devob.sshconnected:
@@ -66,7 +91,15 @@ def configure_device(device, user=None, passwd=None, enable_passwd=None, prompt=
                 logger.debug("action responsed for {}: {}".format(device, action_response))
             if cfg_cmd_set is not None:
                 logger.info("Config Set!!!!! for device {}".format(device))
-                cmd_response = devob.ssh_config_cmd_set(cfg_cmd_set, stop_on_error=True)
+                if only_missing:
+                    cfg_cmd_set = devob.find_missing_config(cfg_cmd_set)
+                if not cfg_cmd_set:
+                    logger.info("{} already has the configuration".format(device))
+                    cmd_response = ''
+                elif use_file_push(cfg_cmd_set, file_push_threshold):
+                    cmd_response = devob.push_config_file(cfg_cmd_set, method=file_push_method, stop_on_error=True)
+                else:
+                    cmd_response = devob.ssh_config_cmd_set(cfg_cmd_set, stop_on_error=True, window=config_window)
                 logger.debug("action responsed for {}: {}".format(device, cmd_response))
             logger.info("Check!!!! for device {}".format(device))
             passed, check_response, check_outputs = devob.ssh_parse_test(checkdict)
@@ -82,12 +115,22 @@ def configure_device(device, user=None, passwd=None, enable_passwd=None, prompt=
             exc_type, exc_value, exc_traceback = sys.exc_info()
             if "Invalid input detected at" in str(exc_value):
                 message = "exc: {}, Error on device: {}".format(exc, exc_value)
-            devob.close()
+            if pool is not None:
+                pool.release(devob, discard=True)
+            else:
+                devob.close()
+            if timing:
+                return device, None, message, devob.timing
             return device, None, message
 
     logger.debug("result: {}".format(result))
-    devob.close()
+    if pool is not None:
+        pool.release(devob)
+    else:
+        devob.close()
 
+    if timing:
+        return result + (devob.timing,) if result is not None else (device, None, None, devob.timing)
     return result
 
 
@@ -137,7 +180,7 @@ switch1##wr mem
     print(devices)
     actionlist = [('config t', r'\(config\)#'), ('authentication mac-move permit', r'\(config\)#'), ('end', '#'),
                   ('wr mem', '#')]
-    checkdict = {'show run | in authentication mac-move': {'existl': [r'authentication mac-move permit']}}
+    checkdict = CheckPlan({'show run | in authentication mac-move': {'existl': [r'authentication mac-move permit']}})
     username = 'username'
     password = 'password'
 
@@ -146,6 +189,7 @@ switch1##wr mem
     num_threads = min(len(devices), multiprocessing.cpu_count() * 4)
 
     start = time.time()
+    prefetch(devices)
     results = thread_this(change_mac_partial, devices, max_threads=num_threads)
     print("{} threads total time : {}".format(num_threads, time.time() - start))
 
@@ -5,6 +5,7 @@ from copy import deepcopy
 
 from configure import configure_device
 from configure_threading import thread_this
+from resolver import prefetch
 
 logger = logging.getLogger('configure_multi_config')
 
@@ -50,6 +51,7 @@ if __name__ == "__main__":
     num_threads = min(len(device_vars), multiprocessing.cpu_count() * 4)
 
     start = time.time()
+    prefetch(device_vars)
     results = thread_this(configure_device, max_threads=num_threads, args=device_vars)
     print("{} threads total time : {}".format(num_threads, time.time() - start))
 
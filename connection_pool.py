@@ -0,0 +1,230 @@
+import contextlib
+import hashlib
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from SSHInteractive import SSHInteractive, CISCO_CONFIG_PROMPT
+
+__version__ = '2019.03.04.1'
+
+logger = logging.getLogger('connection_pool')
+
+
+class ConnectionPool(object):
+    """
+    Thread safe pool of connected SSHInteractive sessions, keyed by host, port, username, password, enable password,
+    channel mode, prompt and check_priv
+
+    acquire hands out an idle session for the key if there is a healthy one, otherwise it connects a new one.
+    release returns the session to the pool instead of closing it, so a later job against the same device skips
+    the TCP connection, key exchange, authentication, prompt discovery and enable.
+
+    Sessions are closed rather than reused once they have been idle for more than *max_idle_time* seconds or were
+    connected more than *max_age* seconds ago. SSH keepalives are sent every *keepalive* seconds so idle sessions are
+    not dropped by the device or by firewalls along the way.
+
+    Sessions are only matched on the key, the other sshconnect arguments of the first connection are kept. The key
+    has every argument that decides what a borrower can do with the session, so an exec-mode session or one left in
+    user mode is never handed to a caller that asked for an interactive shell or privileged mode. A reused
+    session's running configuration snapshot and kept outputs are dropped, see running_config.RunningConfigCache.
+    """
+
+    def __init__(self, max_idle_time=300, max_age=3600, keepalive=30, max_idle_per_key=1, factory=SSHInteractive):
+        """
+        @param max_idle_time: float, seconds an unused session is kept
+        @param max_age: float, seconds after connecting that a session is no longer reused
+        @param keepalive: int, seconds between SSH keepalive messages, 0 disables keepalives
+        @param max_idle_per_key: int, number of idle sessions kept for each host and credentials
+        @param factory: class used to create new sessions
+        """
+        self.max_idle_time = max_idle_time
+        self.max_age = max_age
+        self.keepalive = keepalive
+        self.max_idle_per_key = max_idle_per_key
+        self.factory = factory
+        self._lock = threading.Lock()
+        # key -> list of (released at, session)
+        self._idle = {}
+        # session -> (key, connected at)
+        self._sessions = {}
+        self.hits = 0
+        self.misses = 0
+        # set by close_all, sessions released afterwards are closed
+        self._closed = False
+
+    @staticmethod
+    def _digest(password):
+        return hashlib.sha256(password.encode()).hexdigest() if password is not None else None
+
+    @classmethod
+    def _key(cls, host, port, username, password, enable_password=None, channel_mode='shell', prompt=None,
+             check_priv=True, **kwargs):
+        """
+        The defaults are those of SSHInteractive.sshconnect, other sshconnect arguments are not part of the key
+        """
+        return (host, port, username, cls._digest(password), cls._digest(enable_password), channel_mode, prompt,
+                check_priv)
+
+    def acquire(self, host, username=None, password=None, port=22, log_session_file=None, log_file_mode='w',
+                **kwargs):
+        """
+        Borrow a connected session for host
+
+        :param host: str, device to connect to
+        :param username: str
+        :param password: str
+        :param port: int
+        :param log_session_file: session log for this borrower, a reused session's previous log is closed
+        :param log_file_mode: str
+        :param kwargs: further arguments for SSHInteractive.sshconnect, enable_password, channel_mode, prompt and
+        check_priv have to match those of a pooled session for it to be reused, the others are only used if a new
+        session is connected
+        :return: SSHInteractive
+        """
+        key = self._key(host, port, username, password, **kwargs)
+        self.evict()
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                session = idle.pop()[1] if idle else None
+            if session is None:
+                break
+            if self._healthy(session):
+                with self._lock:
+                    self.hits += 1
+                logger.debug("ConnectionPool: reusing session to {}".format(host))
+                # the configuration may have been changed by others since the session was released
+                session.config_cache.invalidate()
+                if log_session_file is not None:
+                    session.open_session_log(log_session_file, log_file_mode)
+                return session
+            self._discard(session)
+
+        with self._lock:
+            self.misses += 1
+        logger.debug("ConnectionPool: connecting new session to {}".format(host))
+        session = self.factory()
+        try:
+            session.sshconnect(host, port=port, username=username, password=password,
+                               log_session_file=log_session_file, log_file_mode=log_file_mode, **kwargs)
+            if self.keepalive:
+                session._transport.set_keepalive(self.keepalive)
+        except:
+            session.close()
+            raise
+        with self._lock:
+            self._sessions[session] = (key, time.time())
+        return session
+
+    def release(self, session, discard=False):
+        """
+        Return a borrowed session to the pool
+
+        :param session: SSHInteractive returned by acquire
+        :param discard: bool, close the session instead of keeping it, e.g. after an error
+        """
+        with self._lock:
+            key, connected_at = self._sessions.get(session, (None, None))
+            closed = self._closed
+        if key is None or discard or closed or time.time() - connected_at > self.max_age or not self._healthy(session):
+            self._discard(session)
+            return
+        try:
+            if session.prompt == CISCO_CONFIG_PROMPT:
+                session.exit_config_mode()
+        except:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            logger.debug("ConnectionPool: could not leave config mode on {}: {}".format(session.host, exc_value))
+            logger.debug(traceback.extract_tb(exc_traceback))
+            self._discard(session)
+            return
+        session.close_session_log()
+        extra = []
+        with self._lock:
+            if self._closed:
+                extra.append(session)
+            else:
+                idle = self._idle.setdefault(key, [])
+                idle.append((time.time(), session))
+                while len(idle) > self.max_idle_per_key:
+                    extra.append(idle.pop(0)[1])
+        for session in extra:
+            self._discard(session)
+
+    @contextlib.contextmanager
+    def session(self, host, **kwargs):
+        """
+        Context manager that acquires a session and releases it on exit, discarding it if an exception was raised
+        """
+        session = self.acquire(host, **kwargs)
+        try:
+            yield session
+        except:
+            self.release(session, discard=True)
+            raise
+        else:
+            self.release(session)
+
+    def evict(self):
+        """
+        Close idle sessions that have been unused longer than max_idle_time or are older than max_age
+        """
+        now = time.time()
+        expired = []
+        with self._lock:
+            for key, idle in self._idle.items():
+                keep = []
+                for released_at, session in idle:
+                    connected_at = self._sessions[session][1]
+                    if now - released_at > self.max_idle_time or now - connected_at > self.max_age:
+                        expired.append(session)
+                    else:
+                        keep.append((released_at, session))
+                idle[:] = keep
+        for session in expired:
+            logger.debug("ConnectionPool: evicting session to {}".format(session.host))
+            self._discard(session)
+
+    def close_all(self):
+        """
+        Close every idle session, borrowed sessions are closed when they are released
+
+        The pool is not used again afterwards, acquire still connects new sessions but they are not kept.
+        """
+        with self._lock:
+            self._closed = True
+            sessions = [session for idle in self._idle.values() for released_at, session in idle]
+            self._idle.clear()
+        for session in sessions:
+            self._discard(session)
+
+    @staticmethod
+    def _healthy(session):
+        """
+        Cheap health check without a round trip to the device: the transport and channel are still open and an
+        SSH_MSG_IGNORE can be sent
+        """
+        try:
+            if not session.sshconnected:
+                return False
+            session._transport.send_ignore()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, session):
+        with self._lock:
+            self._sessions.pop(session, None)
+        try:
+            session.close()
+        except Exception:
+            logger.debug("ConnectionPool: error closing session to {}".format(session.host))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close_all()
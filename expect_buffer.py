@@ -0,0 +1,89 @@
+import codecs
+import logging
+import re
+
+__version__ = '2019.03.04.1'
+
+logger = logging.getLogger('expect_buffer')
+
+# Number of characters of already searched output that are searched again when a new chunk arrives.
+# A match must end in the newest chunk and begin no more than this many characters before it.
+DEFAULT_WINDOW = 4096
+
+
+class ExpectBuffer(object):
+    """
+    Incremental matching engine for expect-like reads from a channel
+
+    The pattern is compiled once. Each chunk of raw bytes received from the channel is decoded incrementally
+    (multibyte characters split across chunks are handled by the decoder) and appended to a list of decoded chunks.
+    Only the tail of the output, the last *window* characters plus the newly received chunk, is searched for the
+    pattern, so the cost of each chunk is independent of how much output has already been received.
+
+    The complete output is only joined when it is requested with getvalue. With *keep* False the output is not
+    kept at all, only the tail and the text decoded from the latest chunk, for callers that stream the output.
+    """
+
+    def __init__(self, pattern, window=DEFAULT_WINDOW, encoding='utf-8', errors='strict', keep=True):
+        """
+        @param pattern: str or compiled regular expression to look for in the output
+        @param window: int, number of characters before the newest chunk that are searched again
+        @param encoding: str, encoding used to decode the bytes received from the channel
+        @param errors: str, error handling scheme passed to the decoder
+        @param keep: bool, keep all of the output for getvalue
+        """
+        if isinstance(pattern, (str, bytes)):
+            pattern = re.compile(pattern)
+        self.pattern = pattern
+        self.window = window
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+        self.keep = keep
+        self._chunks = []
+        self._tail = ''
+        # text decoded from the most recent chunk
+        self.latest = ''
+        self.match = None
+        self.bytes_received = 0
+
+    def feed(self, data):
+        """
+        Add bytes received from the channel and search the tail of the output for the pattern
+
+        @param data: bytes
+        @return: match object if the pattern has been found, otherwise None
+        """
+        self.bytes_received += len(data)
+        text = self.latest = self._decoder.decode(data)
+        if not text:
+            return self.match
+        if self.keep:
+            self._chunks.append(text)
+        self._tail = self._tail[-self.window:] + text
+        if self.match is None:
+            self.match = self.pattern.search(self._tail)
+        return self.match
+
+    @property
+    def tail(self):
+        """
+        The most recently received output, at most *window* characters plus the newest chunk
+        """
+        return self._tail
+
+    def getvalue(self):
+        """
+        @return: str, all of the output decoded so far, or only the tail if the output is not kept
+        """
+        if not self.keep:
+            return self._tail
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else ''
+
+    def __len__(self):
+        if not self.keep:
+            return len(self._tail)
+        return sum(len(chunk) for chunk in self._chunks)
+
+    def __str__(self):
+        return self.getvalue()
@@ -0,0 +1,88 @@
+import io
+import logging
+import posixpath
+import re
+
+import paramiko
+
+from nxos_XML_errors import OperationError
+
+__version__ = '2019.03.04.1'
+
+logger = logging.getLogger('file_transfer')
+
+TRANSFER_METHODS = ('scp', 'sftp')
+
+
+def remote_basename(remote_path):
+    """
+    @return: str, the file name at the end of a device path such as flash:/dir/name or bootflash:name
+    """
+    return posixpath.basename(re.sub(r"^[\w-]+:", "", remote_path)) or remote_path
+
+
+def use_file_push(cfg_cmd_set, file_push_threshold):
+    """
+    @param cfg_cmd_set: list of configuration commands, or a str for a single command
+    @param file_push_threshold: int, commands from which the set is pushed as a file, None to never push as a file
+    @return: boolean, True if cfg_cmd_set is large enough to be pushed as a file
+    """
+    if file_push_threshold is None:
+        return False
+    lines = 1 if isinstance(cfg_cmd_set, str) else len(cfg_cmd_set)
+    return lines >= file_push_threshold
+
+
+def _scp_ack(channel, remote_path):
+    """
+    Reads the one byte reply of an scp sink, 0 means ok, 1 and 2 are followed by an error message
+    """
+    reply = channel.recv(1)
+    if reply == b'\x00':
+        return
+    message = reply
+    while reply and not message.endswith(b'\n'):
+        reply = channel.recv(1)
+        message += reply
+    message = message.lstrip(b'\x01\x02').decode(errors='replace').strip()
+    logger.error("scp_put: {} refused: {}".format(remote_path, message or 'channel closed'))
+    raise OperationError("scp to {} failed: {}".format(remote_path, message or 'channel closed'))
+
+
+def scp_put(channel, data, remote_path, mode='0644'):
+    """
+    Writes data to remote_path with the scp sink protocol, as scp would for a single file
+
+    @param channel: paramiko.Channel, a new session channel, it is used for the exec of scp -t and closed
+    @param data: bytes
+    @param remote_path: str, path on the device, e.g. flash:/name
+    @param mode: str, octal permissions sent with the file
+    @raise nxos_XML_errors.OperationError: if the device refuses the transfer
+    """
+    try:
+        channel.exec_command("scp -t {}".format(remote_path))
+        _scp_ack(channel, remote_path)
+        channel.sendall("C{} {} {}\n".format(mode, len(data), remote_basename(remote_path)).encode())
+        _scp_ack(channel, remote_path)
+        channel.sendall(data)
+        channel.sendall(b'\x00')
+        _scp_ack(channel, remote_path)
+    finally:
+        channel.close()
+
+
+def sftp_put(channel, data, remote_path):
+    """
+    Writes data to remote_path over SFTP
+
+    @param channel: paramiko.Channel, a new session channel, the sftp subsystem is started on it and it is closed
+    @param data: bytes
+    @param remote_path: str, path on the device
+    """
+    try:
+        channel.invoke_subsystem('sftp')
+        sftp = paramiko.SFTPClient(channel)
+        # devices do not all support stat, the size is checked by the copy that follows the upload
+        sftp.putfo(io.BytesIO(data), remote_path, file_size=len(data), confirm=False)
+    finally:
+        channel.close()
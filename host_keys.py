@@ -0,0 +1,146 @@
+import atexit
+import binascii
+import logging
+import os
+import threading
+
+import paramiko
+from paramiko.hostkeys import HostKeyEntry
+
+__version__ = '2019.03.04.1'
+
+logger = logging.getLogger('host_keys')
+
+# seconds newly accepted host keys are collected before they are appended to the known_hosts file
+FLUSH_INTERVAL = 2.0
+
+
+class HostKeyStore(object):
+    """
+    Process wide cache of parsed known_hosts files
+
+    Each file is parsed once and kept here, it is parsed again only when the modification time of the file
+    changes. Connections do not share the parsed object, load_into copies its entries into the connection's own
+    paramiko.HostKeys under the store's lock, so keys added by other threads are never read half-written.
+
+    Host keys accepted for unknown hosts are added to the shared object straight away and appended to the file in
+    batches, every FLUSH_INTERVAL seconds and at exit, instead of every connection rewriting the whole file.
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # filename -> (mtime, paramiko.HostKeys)
+        self._files = {}
+        # filename -> list of HostKeyEntry not yet written
+        self._pending = {}
+        self._timer = None
+
+    def get(self, filename):
+        """
+        Return the parsed host keys of a known_hosts file, see load_into
+
+        @param filename: str
+        @return: paramiko.HostKeys, owned by the store, it must only be read while holding its lock
+        @raise IOError: if the file can not be read
+        """
+        mtime = os.stat(filename).st_mtime
+        with self._lock:
+            cached = self._files.get(filename)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        logger.debug("HostKeyStore: loading {}".format(filename))
+        keys = paramiko.HostKeys(filename)
+        with self._lock:
+            cached = self._files.get(filename)
+            if cached is not None and cached[0] == mtime:
+                # another thread loaded it first
+                return cached[1]
+            for entry in self._pending.get(filename, []):
+                keys.add(entry.hostnames[0], entry.key.get_name(), entry.key)
+            self._files[filename] = (mtime, keys)
+        return keys
+
+    def load_into(self, filename, host_keys):
+        """
+        Add the keys of a known_hosts file to the host keys of one connection
+
+        @param filename: str
+        @param host_keys: paramiko.HostKeys of the connection, i.e. paramiko.SSHClient.get_host_keys()
+        @raise IOError: if the file can not be read
+        """
+        keys = self.get(filename)
+        with self._lock:
+            # copies the list of parsed entries, HostKeys can only be bulk loaded by parsing the file again and add
+            # is linear in the number of keys
+            host_keys._entries.extend(keys._entries)
+
+    def add(self, filename, hostname, key):
+        """
+        Record a newly accepted host key, it is visible to other connections at once and written to the file later
+
+        @param filename: str, known_hosts file the key belongs in
+        @param hostname: str, as passed to the missing host key policy, i.e. "[host]:port" for ports other than 22
+        @param key: paramiko.PKey
+        """
+        with self._lock:
+            pending = self._pending.setdefault(filename, [])
+            if any(entry.hostnames[0] == hostname and entry.key == key for entry in pending):
+                # several connections to a new host were started at the same time
+                return
+            cached = self._files.get(filename)
+            if cached is not None:
+                cached[1].add(hostname, key.get_name(), key)
+            pending.append(HostKeyEntry([hostname], key))
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """
+        Append all pending host keys to their known_hosts files
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._timer = None
+        for filename, entries in pending.items():
+            try:
+                with open(filename, 'a') as known_hosts:
+                    known_hosts.write(''.join(entry.to_line() for entry in entries))
+            except (IOError, OSError):
+                logger.error("HostKeyStore: unable to write {} host keys to {}".format(len(entries), filename),
+                             exc_info=True)
+                continue
+            logger.debug("HostKeyStore: wrote {} host keys to {}".format(len(entries), filename))
+            with self._lock:
+                cached = self._files.get(filename)
+                if cached is not None:
+                    # our own write does not make the cached copy stale
+                    self._files[filename] = (os.stat(filename).st_mtime, cached[1])
+
+
+host_key_store = HostKeyStore()
+atexit.register(host_key_store.flush)
+
+
+class StoreAutoAddPolicy(paramiko.MissingHostKeyPolicy):
+    """
+    Like paramiko.AutoAddPolicy, but records new host keys in a HostKeyStore instead of rewriting the known_hosts
+    file from every connection
+    """
+
+    def __init__(self, filename, store=host_key_store):
+        """
+        @param filename: str, known_hosts file new keys are added to, or None to only accept them for this connection
+        @param store: HostKeyStore
+        """
+        self.filename = filename
+        self.store = store
+
+    def missing_host_key(self, client, hostname, key):
+        client.get_host_keys().add(hostname, key.get_name(), key)
+        if self.filename is not None:
+            self.store.add(self.filename, hostname, key)
+        logger.debug("Adding {} host key for {}: {}".format(key.get_name(), hostname,
+                                                             binascii.hexlify(key.get_fingerprint()).decode()))
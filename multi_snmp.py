@@ -3,8 +3,10 @@ import multiprocessing
 import time
 from pprint import pprint
 
+from command_parser import CheckPlan
 from configure import configure_device
 from configure_threading import thread_this
+from resolver import prefetch
 
 logger = logging.getLogger('multi_snmp')
 
@@ -42,10 +44,10 @@ if __name__ == "__main__":
     logger.critical("Started")
 
     stores = [('st1111', '172.16.1.129'), ('st2222', '172.16.1.130')]
-    checkdict = {'show run | in snmp': {
+    checkdict = CheckPlan({'show run | in snmp': {
         'existl': [r'snmp-server trap-source GigabitEthernet1', r'snmp-server community public RO',
                    r'snmp-server host 10.10.10.10 vrf mgmt public', 'snmp-server host 11.11.11.11 vrf mgmt public',
-                   r'snmp-server host 12.12.12.12 vrf mgmt public', r'rtr\d_st\d\d\d\d_CSR']}}
+                   r'snmp-server host 12.12.12.12 vrf mgmt public', r'rtr\d_st\d\d\d\d_CSR']}})
     device_vars = {}
     # with open("device_file.txt") as f:
     #     for device in f.readline():
@@ -59,12 +61,14 @@ if __name__ == "__main__":
         device_vars[ip] = {'user': 'cisco',
                            'passwd': 'cisco',
                            'cfg_cmd_set': generate_snmp(store)[0],
+                           'only_missing': True,
                            'checkdict': checkdict}
     print(device_vars)
 
     num_threads = min(len(device_vars), multiprocessing.cpu_count() * 4)
 
     start = time.time()
+    prefetch(device_vars)
     results = thread_this(configure_device, max_threads=num_threads, args=device_vars)
     print("{} threads total time : {}".format(num_threads, time.time() - start))
 
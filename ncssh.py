@@ -10,11 +10,15 @@ __version__ = '2019.02.27.1'
 """
 
 import abc
+import codecs
+import copy
 import functools
 import getpass
+import inspect
 import logging
 import os
 import re
+import select
 import socket
 import sys
 import time
@@ -22,7 +26,16 @@ import traceback
 
 import paramiko
 
+from admission import admission_controller
+from expect_buffer import ExpectBuffer
+from file_transfer import scp_put, sftp_put, TRANSFER_METHODS
+from host_keys import host_key_store, StoreAutoAddPolicy
 from nxos_XML_errors import TimeoutExpiredError, ServerClosedChannelError, NotConnectedError
+from resolver import resolver_cache
+from session_log import SessionLogWriter
+from session_timing import SessionTiming
+from ssh_trace import HotPathTracer
+from transport_profile import get_profile
 
 # Static Variables, global for now
 
@@ -30,6 +43,12 @@ DEBUG = False
 KEYFILE = "paramikolocalhostkeys"
 LOGFILE = "netconflog.log"
 LOGLEVEL = logging.DEBUG
+# seconds between recv_ready checks when select can not be used on a channel
+POLL_INTERVAL = .01
+# seconds of silence after a prompt-like line before rpexpect code 6 returns
+IDLE_TIME = .2
+# characters at the end of an exec command's output kept for error messages
+EXEC_TAIL = 4096
 
 # Set up the logger - I love me some loggers
 
@@ -39,28 +58,48 @@ logger.info("Starting SSH")
 
 
 def checkconnection(func):
-    @functools.wraps(func)
-    def decorator(self, *args, **kwargs):
-        self.logger.debug('checkconnection: instance %s of class %s is now decorated with checkconnection, whee!' % (
-            self, self.__class__))
+    def check(self):
+        self.trace('checkconnection: %s.%s', self.__class__.__name__, func.__name__)
         if not self.sshconnected:
             self.logger.error(
                 "checkconnection: The ssh connection to {} is currently closed. Please reconnect and try again.".format(
                     self.host))
             raise NotConnectedError(
                 "The ssh connection to {} is currently closed. Please reconnect and try again.".format(self.host))
-        else:
+
+    def log_error(self):
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        stacktrace = traceback.extract_tb(exc_traceback)
+        self.logger.debug("checkconnection: Error with the SSH message")
+        self.logger.debug(sys.exc_info())
+        self.logger.debug(stacktrace)
+
+    if inspect.isgeneratorfunction(func):
+        # the body of a generator only runs on the first next(), check the connection then rather than when the
+        # generator is created
+        @functools.wraps(func)
+        def generator(self, *args, **kwargs):
+            check(self)
             try:
-                result = func(self, *args, **kwargs)
+                return (yield from func(self, *args, **kwargs))
+            except GeneratorExit:
+                raise
             except:
-                exc_type, exc_value, exc_traceback = sys.exc_info()
-                stacktrace = traceback.extract_tb(exc_traceback)
-                self.logger.debug("checkconnection: Error with the SSH message")
-                self.logger.debug(sys.exc_info())
-                self.logger.debug(stacktrace)
+                log_error(self)
                 raise
-            else:
-                return result
+
+        return generator
+
+    @functools.wraps(func)
+    def decorator(self, *args, **kwargs):
+        check(self)
+        try:
+            result = func(self, *args, **kwargs)
+        except:
+            log_error(self)
+            raise
+        else:
+            return result
 
     return decorator
 
@@ -81,6 +120,7 @@ class SshConnect(object):
         """
 
         self.logger = logging.getLogger('ncssh.SshConnect')
+        self.trace = HotPathTracer(self.logger)
 
         self.host = host
 
@@ -88,12 +128,19 @@ class SshConnect(object):
 
         self._transport = None
         self._sshconnected = False
+        self._subsystem = None
+        # set on the copies returned by open_channel to the session that owns the transport
+        self._parent = None
+        self.timing = SessionTiming()
+        self._bytes_received = 0
 
         self.known_hosts = None
 
     def sshconnect(self, port=22, timeout=None, unknown_host_cb='autoaddpolicy',
                    username=None, password=None, host_key_filename=None, key_filename=None, allow_agent=True,
-                   look_for_keys=False, command_timeout=30, log_session_file=None, log_file_mode='w', **kwargs):
+                   look_for_keys=False, command_timeout=30, log_session_file=None, log_file_mode='w',
+                   log_session_compress=False, wait_mode='event', trace_sample_rate=1, max_channels=4,
+                   transport_profile='default', admission_group=None, admission=None, **kwargs):
         """
         Connect via SSH and initialize a session. First attempts the publickey
         authentication method and then password authentication.
@@ -123,6 +170,27 @@ class SshConnect(object):
 
         -    *command_timeout* time in seconds to wait for expected output from server, default is 30 seconds
 
+        -    *log_session_file* path of a file, or an open binary file handle, that all output received from the
+             server is written to. The output is queued and written in batches by a background thread
+
+        -    *log_session_compress* gzip the session log file
+
+        -    *wait_mode* how rpexpect waits for output. 'event' wakes up as soon as the channel is readable, 'poll'
+             is the original behaviour of sleeping .1 seconds between reads
+
+        -    *max_channels* maximum number of session channels open to the device at once, including the first one,
+             see open_channel
+
+        -    *trace_sample_rate* when debug logging is enabled, only trace the send and receive of 1 in every
+             *trace_sample_rate* commands
+
+        -    *transport_profile* compression, window and packet sizes and cipher preferences of the SSH transport,
+             one of 'default', 'wan' or 'bulk', or a transport_profile.TransportProfile
+
+        -    *admission_group* AAA group the device authenticates against, logins are rate limited per group as well
+             as globally, see admission.AdmissionController
+
+        -    *admission* admission.AdmissionController to use instead of the one shared by all connections
 
         -    @type port: int
         -    @type timeout: float
@@ -134,6 +202,12 @@ class SshConnect(object):
         -    @type allow_agent: bool
         -    @type look_for_keys: bool
         -    @type command_timeout: float
+        -    @type max_channels: int
+        -    @type log_session_compress: bool
+        -    @type wait_mode: str
+        -    @type trace_sample_rate: int
+        -    @type transport_profile: str
+        -    @type admission_group: str
 
         This method relies on the self.setup_channel method for defining the channel characteristics
         This is defined as an abstract method
@@ -158,10 +232,17 @@ class SshConnect(object):
         self.allow_agent = allow_agent
         self.look_for_keys = look_for_keys
         self._command_timeout = command_timeout
+        self.wait_mode = wait_mode
+        self.trace = HotPathTracer(self.logger, sample_rate=trace_sample_rate)
         self.ssh_client = None
         self._transport = None
         self._sshconnected = False
         self._channel = None
+        self.max_channels = max_channels
+        self.transport_profile = get_profile(transport_profile)
+        self.timing = SessionTiming()
+        self._bytes_received = 0
+        self._channel_slots = threading.BoundedSemaphore(max(max_channels - 1, 0))
 
         if self.username is None:
             self.username = getpass.getuser()
@@ -174,11 +255,13 @@ class SshConnect(object):
         self.logger.debug("SSHConnect: Checking for session file.")
         if log_session_file is not None:
             self.logger.debug("SSHConnect: log_session_file: {}".format(log_session_file))
-            self.open_session_log(log_session_file, log_file_mode)
+            self.open_session_log(log_session_file, log_file_mode, compress=log_session_compress)
 
         self.ssh_object()
         self.logger.debug("SSH object instantiated")
         self.ssh_client.set_log_channel(self.logger.name)
+        with self.timing.phase('admission'):
+            (admission if admission is not None else admission_controller).admit(admission_group)
         self.ssh_connect()
         self.logger.debug("Connected to host " + self.host)
         self.logger.debug("Setting up channel to {}".format(self.host))
@@ -204,42 +287,43 @@ class SshConnect(object):
             self.logger.debug(sys.exc_info())
             self.logger.debug(stacktrace)
             raise
-        if self.unknown_host_cb == 'autoaddpolicy':
-            self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        else:
+        if self.unknown_host_cb != 'autoaddpolicy':
             self.logger.critical("Unsupported Unknown Host Policy for " + self.host)
             raise NotImplementedError
+        # known_hosts files are parsed once per process and copied into each client's host keys, see
+        # host_keys.HostKeyStore
+        filename = None
         if self.host_key_filename is None:
-            filename = os.path.expanduser('~/.ssh/known_hosts')
             self.logger.debug("Looking for system known_hosts keys file for " + self.host)
-            try:
-                self.ssh_client.load_host_keys(filename)
-            except IOError:
-                # for windows
-                filename = os.path.expanduser('~/ssh/known_hosts')
+            # second one for windows
+            for candidate in (os.path.expanduser('~/.ssh/known_hosts'), os.path.expanduser('~/ssh/known_hosts')):
                 try:
-                    self.ssh_client.load_host_keys(filename)
+                    host_key_store.load_into(candidate, self.ssh_client.get_host_keys())
+                    filename = candidate
+                    break
                 except IOError:
                     exc_type, exc_value, exc_traceback = sys.exc_info()
                     stacktrace = traceback.extract_tb(exc_traceback)
-                    self.logger.critical("Unable to open system host keys file for " + self.host)
                     self.logger.debug(sys.exc_info())
                     self.logger.debug(stacktrace)
-                    pass
+            if filename is None:
+                self.logger.critical("Unable to open system host keys file for " + self.host)
         else:
             try:
                 self.logger.debug("Attempting to load local_hosts keys file " + self.host)
-                self.ssh_client.load_host_keys(self.host_key_filename)
+                host_key_store.load_into(self.host_key_filename, self.ssh_client.get_host_keys())
             except IOError:
                 # print "Unable to open host keys file"
                 self.logger.debug("Unable to open local host keys file for " + self.host)
                 keyfile = open(self.host_key_filename, 'w+')
                 keyfile.close()
                 try:
-                    self.ssh_client.load_host_keys(self.host_key_filename)
+                    host_key_store.load_into(self.host_key_filename, self.ssh_client.get_host_keys())
                 except IOError:
                     self.logger.debug("Unable to create and load local_hosts keys file for " + self.host)
                     raise
+            filename = self.host_key_filename
+        self.ssh_client.set_missing_host_key_policy(StoreAutoAddPolicy(filename))
         # needed to compensate for a bug in some versions of paramiko
         self.ssh_client.known_hosts = None
 
@@ -256,10 +340,14 @@ class SshConnect(object):
 
         try:
             self.logger.debug("Opening Connection to " + self.host)
+            sock = self._open_socket()
+            connect_kwargs = self.transport_profile.connect_kwargs()
+            connect_kwargs['transport_factory'] = self._timed_transport_factory(connect_kwargs['transport_factory'])
             self.ssh_client.connect(self.host, port=self.port, timeout=self.timeout, username=self.username,
                                     password=self.password,
                                     key_filename=self.key_filename, allow_agent=self.allow_agent,
-                                    look_for_keys=self.look_for_keys)
+                                    look_for_keys=self.look_for_keys, sock=sock, **connect_kwargs)
+            self.timing.end('auth')
         except socket.gaierror:
             exc_type, exc_value, exc_traceback = sys.exc_info()
             stacktrace = traceback.extract_tb(exc_traceback)
@@ -293,6 +381,55 @@ class SshConnect(object):
             self.ssh_client.close()
             raise
 
+    def _open_socket(self):
+        """
+        Resolves the host and opens the TCP connection for ssh_connect, so that both are timed on their own
+
+        Addresses come from the process wide resolver.resolver_cache, fill it with resolver.prefetch before starting
+        a large run. If none of the cached addresses can be connected to they are dropped from the cache.
+
+        @return: connected socket
+        @raise socket.gaierror: if the DNS lookup fails
+        @raise socket.error: if none of the addresses can be connected to
+        """
+        with self.timing.phase('dns'):
+            addresses = resolver_cache.getaddrinfo(self.host, self.port)
+        with self.timing.phase('tcp_connect'):
+            error = None
+            for family, socktype, proto, canonname, address in addresses:
+                sock = socket.socket(family, socktype, proto)
+                try:
+                    sock.settimeout(self.timeout)
+                    sock.connect(address)
+                    return sock
+                except socket.error as exc:
+                    sock.close()
+                    error = exc
+            resolver_cache.invalidate(self.host)
+            raise error
+
+    def _timed_transport_factory(self, factory):
+        """
+        Wraps a paramiko transport factory so the key exchange, done in Transport.start_client, and the
+        authentication that follows it are recorded as the 'kex' and 'auth' phases
+        """
+        timing = self.timing
+
+        def transport_factory(sock, **kwargs):
+            transport = factory(sock, **kwargs)
+            start_client = transport.start_client
+
+            def timed_start_client(*args, **kwargs):
+                with timing.phase('kex'):
+                    result = start_client(*args, **kwargs)
+                timing.start('auth')
+                return result
+
+            transport.start_client = timed_start_client
+            return transport
+
+        return transport_factory
+
     @abc.abstractmethod
     def setup_channel(self):
         """Can't do much without a channel.
@@ -346,7 +483,50 @@ class SshConnect(object):
             raise
 
     @checkconnection
-    def rpexpect(self, reguexp, code=4, characters=20, timer=None, bytes=9999):
+    def open_channel(self):
+        """
+        Opens another session channel on the existing transport, of the same kind as the first one (shell or
+        subsystem), without another TCP connection, key exchange or authentication
+
+        Returns a copy of this object that sends and receives on the new channel and shares the transport, session log
+        and settings, so independent commands can be run on the copies from separate threads. Closing the copy
+        closes only its channel.
+
+        At most max_channels channels, including the first one, are open at once. If they are all in use this waits
+        up to command_timeout for one to be closed.
+
+        @raise nxos_XML_errors.TimeoutExpiredError: if no channel became available
+        @return: copy of this object using the new channel
+        """
+        if not self._channel_slots.acquire(timeout=self.command_timeout):
+            self.logger.error("open_channel: all {} channels to {} are in use".format(self.max_channels, self.host))
+            raise TimeoutExpiredError("All {} channels to {} are in use".format(self.max_channels, self.host))
+        self.logger.debug("open_channel: opening additional channel to {}".format(self.host))
+        try:
+            channel = self._transport.open_session()
+            if self._subsystem is not None:
+                channel.set_name(self._subsystem)
+                channel.invoke_subsystem(self._subsystem)
+            else:
+                channel.get_pty()
+                channel.invoke_shell()
+        except:
+            self._channel_slots.release()
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            stacktrace = traceback.extract_tb(exc_traceback)
+            self.logger.error("open_channel: failed to open additional channel to " + self.host)
+            self.logger.debug(sys.exc_info())
+            self.logger.debug(stacktrace)
+            raise
+        session = copy.copy(self)
+        session._channel = channel
+        session._parent = self
+        session._holds_slot = True
+        session.trace = HotPathTracer(self.logger, sample_rate=self.trace.sample_rate)
+        return session
+
+    @checkconnection
+    def rpexpect(self, reguexp, code=4, characters=20, timer=None, bytes=9999, idle=IDLE_TIME):
         """
 
         Method to provide expect-like functionality
@@ -362,6 +542,9 @@ class SshConnect(object):
 
         -    code = 5:  collect characters from channel until timeout is reached
 
+        -    code = 6:  collect characters from channel until the end of the buffer matches reguexp and nothing more
+                    has been received for *idle* seconds. The timeout is only an upper bound.
+
         reguexp:    string representing the delimiter to look for in the channel
 
         Looks for the delimeter and returns the preceding string from the socket
@@ -377,7 +560,8 @@ class SshConnect(object):
 
         Content received on the channel is checked for the specified pattern match. If found, the content is returned.
 
-        If not found, the channel will be rechecked periodically for the duration of the command_timeout
+        If not found, the channel will be rechecked for the duration of the command_timeout. With the default
+        wait_mode of 'event' the channel is read as soon as it becomes readable, with 'poll' it is rechecked periodically
 
         If still not found, or if the remote side closed the channel, one of the following exceptions may be raised
         socket.timeout
@@ -392,21 +576,15 @@ class SshConnect(object):
             looptimer = self.command_timeout
         else:
             looptimer = timer
-        self.logger.debug("rpexpect first block: Timeout is configured as {0}".format(str(self.command_timeout)))
-        socket_timeout = socket.getdefaulttimeout()
+        trace = self.trace
         self._channel.settimeout(self.command_timeout)
-        paramiko_timeout = self._channel.gettimeout()
-        self.logger.debug(
-            "rpexpect first block: Socket timeout is {0}, {1}".format(str(socket_timeout), str(paramiko_timeout)))
-        self.logger.debug(
-            "rpexpect first block: looptimer is {}".format(looptimer)
-        )
+        if trace.active:
+            trace("rpexpect first block: Timeout is configured as %s, socket timeout is %s, %s, looptimer is %s",
+                  self.command_timeout, socket.getdefaulttimeout(), self._channel.gettimeout(), looptimer)
         try:
-            self.logger.debug("rpexpect first block: Checking buffer for {}".format(reguexp))
+            trace("rpexpect first block: Checking buffer for %s", reguexp)
             buff = self.recv(bytes)
-            self.logger.debug(
-                "rpexpect first block: First buff check in thread {0}, {1}".format(
-                    str(threading.currentThread().getName()), str(buff)))
+            trace("rpexpect first block: First buff check in thread %s, %s", threading.current_thread().name, buff)
         except socket.timeout:
             self.logger.debug(
                 "rpexpect first block: First Timeout waiting for intial response.  Received response:  {0}".format(
@@ -428,60 +606,29 @@ class SshConnect(object):
             else:
                 return False
         elif int(code) == 4:
-            start = time.time()
-            self.logger.debug("rpexpect type 4 block: Beginning Loop. Buffer so far {}".format(buff))
-            while not re.search(reguexp, buff.decode()):
-                # self.logger.debug("Code 4: Inside while loop in rpexpect in thread ")
-                try:
-                    resp = self.recv(bytes)
-                except socket.timeout:
-                    self.logger.error(
-                        "rpexpect type 4 block: Timedout waiting for intial response.  Received response:  {0}".format(
-                            buff))
-                    raise socket.timeout(
-                        "Socket Timedout waiting for expected response {}.  Received response:  {}".format(reguexp,
-                                                                                                           buff))
-                buff += resp
-                # self.logger.debug("Second buff check in thread {0}".format(buff))
-                stend = time.time()
-                if stend - start < 5:
-                    pass
-                elif stend - start < looptimer:
-                    time.sleep(.1)
-                    pass
-                else:
-                    self.logger.error(
-                        "rpexpect first type 4 block: Loop Timedout after {} seconds.".format(str(stend - start)))
-                    self.logger.debug(
-                        "rpexpect type 4 block: Loop Timedout waiting for expected response {}. Received response {}".format(
-                            reguexp, buff))
-                    raise TimeoutExpiredError(
-                        "Loop Timedout waiting for expected response {}. Received response {}".format(reguexp, buff))
-                if self._channel.exit_status_ready():
-                    self.logger.error(
-                        "rpexpect type 4 block: Detected server closed channel while waiting for expected response {}. Received response {:s}".format(
-                            reguexp, buff))
-                    self.close()
-                    raise ServerClosedChannelError(
-                        "Detected server closed channel while waiting for expected response. Received response {}".format(
-                            reguexp, buff))
+            trace("rpexpect type 4 block: Beginning Loop. Buffer so far %s", buff)
+            # the pattern is compiled once and only the tail of the output is searched after each chunk
+            expect = ExpectBuffer(reguexp)
+            for _ in self._expect_chunks(expect, buff, looptimer, bytes):
+                pass
+            buff = expect.getvalue()
+            trace("rpexpect final block: Returning %s", buff)
+            return buff
 
         elif int(code) == 5:
-            self.logger.debug("rpexpect type 5 block: Starting Type 5 Processing. Beginning Loop. ")
+            trace("rpexpect type 5 block: Starting Type 5 Processing. Beginning Loop. ")
             start = time.time()
             stend = time.time()
-            self.logger.debug("rpexpect type 5 block: Timeout is configured as {0}".format(str(self.command_timeout)))
-            self.logger.debug(
-                "rpexpect type 5 block: Socket timeout is {0}, {1}".format(str(socket_timeout), str(paramiko_timeout)))
-            self.logger.debug(
-                "rpexpect type 5 block: looptimer is {}".format(looptimer)
-            )
             while stend - start < looptimer:
-                time.sleep(.1)
+                if self.wait_mode != 'event':
+                    time.sleep(.1)
                 # self.logger.debug("Code 5: Inside while loop in rpexpect in thread ")
                 resp = ''
                 try:
-                    resp = self.recv(bytes)
+                    if self.wait_mode == 'event':
+                        resp = self._recv_when_ready(bytes, start + looptimer, time.time() + self.command_timeout)
+                    else:
+                        resp = self.recv(bytes)
                 except socket.timeout:
                     self.logger.error(
                         "rpexpect type 5 block: Socket Timed out waiting for response.  Received response:  {0}: Buffer "
@@ -498,7 +645,7 @@ class SshConnect(object):
                     )
                 if resp:
                     buff += resp
-                if self._channel.exit_status_ready():
+                if self._channel.exit_status_ready() or (not resp and self._at_eof()):
                     self.logger.error(
                         "rpexpect type 5 block: Detected server closed channel while waiting for expected response. Received response buffer {0:s}".format(
                             buff))
@@ -509,14 +656,292 @@ class SshConnect(object):
 
                 stend = time.time()
 
-        self.logger.debug("rpexpect final block: Returning {}".format(buff))
+        elif int(code) == 6:
+            trace("rpexpect type 6 block: Starting Type 6 Processing. Idle time is %s", idle)
+            start = time.time()
+            prompt_shape = re.compile(reguexp)
+            expect = ExpectBuffer(prompt_shape)
+            expect.feed(buff)
+            last_data = start
+            while True:
+                stend = time.time()
+                if stend - start >= looptimer:
+                    trace("rpexpect type 6 block: looptimer %s expired", looptimer)
+                    break
+                wait_until = start + looptimer
+                if prompt_shape.search(expect.tail):
+                    # the output ends with something that looks like a prompt, return once it has gone quiet
+                    if stend - last_data >= idle:
+                        break
+                    wait_until = min(wait_until, last_data + idle)
+                if not self._wait_for_data(wait_until - stend):
+                    continue
+                resp = self.recv(bytes)
+                if resp:
+                    expect.feed(resp)
+                    last_data = time.time()
+                elif self._channel.exit_status_ready() or self._at_eof():
+                    buff = expect.getvalue()
+                    self.logger.error(
+                        "rpexpect type 6 block: Detected server closed channel while waiting for expected response. Received response buffer {}".format(
+                            buff))
+                    self.close()
+                    raise ServerClosedChannelError(
+                        "Detected server closed channel while waiting for expected response. Received response buffer {}".format(
+                            buff))
+            buff = expect.getvalue()
+            trace("rpexpect final block: Returning %s", buff)
+            return buff
+
+        trace("rpexpect final block: Returning %s", buff)
         return buff.decode()
 
+    @checkconnection
+    def rpexpect_iter(self, reguexp, timer=None, bytes=9999):
+        """
+        Streaming version of rpexpect code 4
+
+        Yields the decoded output as it arrives, until reguexp is found in it; the last chunk yielded is the one that
+        completed the match. The output is not kept, only a window at its end where reguexp is searched for, so
+        memory use does not grow with the size of the output. Raises the same exceptions as rpexpect.
+
+        @param reguexp: str, pattern marking the end of the output, usually the prompt
+        @param timer: float, seconds to wait for reguexp, defaults to command_timeout
+        @param bytes: int, maximum bytes per read
+        """
+        looptimer = self.command_timeout if timer is None else timer
+        self._channel.settimeout(self.command_timeout)
+        first = self.recv(bytes)
+        for text in self._expect_chunks(ExpectBuffer(reguexp, keep=False), first, looptimer, bytes):
+            yield text
+
+    def _expect_chunks(self, expect, first, looptimer, bytes):
+        """
+        Read loop of rpexpect code 4, also used to stream output
+
+        Feeds the output to *expect* until its pattern is found, yielding the text decoded from each chunk as it
+        arrives. The pattern is searched for in the tail of the output, so it is found even if it is split across
+        chunks. Raises the same exceptions as rpexpect.
+
+        @param expect: expect_buffer.ExpectBuffer
+        @param first: bytes, output already read from the channel
+        @param looptimer: float, seconds to wait for the pattern
+        @param bytes: int, maximum bytes per read
+        """
+        reguexp = expect.pattern.pattern
+        trace = self.trace
+        start = time.time()
+        expect.feed(first)
+        if expect.latest:
+            yield expect.latest
+        last_data = start
+        while not expect.match:
+            # self.logger.debug("Code 4: Inside while loop in rpexpect in thread ")
+            try:
+                if self.wait_mode == 'event':
+                    resp = self._recv_when_ready(bytes, start + looptimer, last_data + self.command_timeout)
+                else:
+                    resp = self.recv(bytes)
+            except socket.timeout:
+                buff = expect.getvalue()
+                self.logger.error(
+                    "rpexpect type 4 block: Timedout waiting for intial response.  Received response:  {0}".format(
+                        buff))
+                raise socket.timeout(
+                    "Socket Timedout waiting for expected response {}.  Received response:  {}".format(reguexp,
+                                                                                                       buff))
+            expect.feed(resp)
+            text = expect.latest
+            # self.logger.debug("Second buff check in thread {0}".format(buff))
+            stend = time.time()
+            if resp:
+                last_data = stend
+            if stend - start < 5 and self.wait_mode != 'event':
+                pass
+            elif stend - start < looptimer:
+                if self.wait_mode != 'event':
+                    time.sleep(.1)
+            else:
+                buff = expect.getvalue()
+                self.logger.error(
+                    "rpexpect first type 4 block: Loop Timedout after {} seconds.".format(str(stend - start)))
+                self.logger.debug(
+                    "rpexpect type 4 block: Loop Timedout waiting for expected response {}. Received response {}".format(
+                        reguexp, buff))
+                raise TimeoutExpiredError(
+                    "Loop Timedout waiting for expected response {}. Received response {}".format(reguexp, buff))
+            if self._channel.exit_status_ready() or (not resp and self._at_eof()):
+                buff = expect.getvalue()
+                self.logger.error(
+                    "rpexpect type 4 block: Detected server closed channel while waiting for expected response {}. Received response {:s}".format(
+                        reguexp, buff))
+                self.close()
+                raise ServerClosedChannelError(
+                    "Detected server closed channel while waiting for expected response. Received response {}".format(
+                        reguexp, buff))
+            if text:
+                yield text
+
+    def _wait_for_data(self, timeout):
+        """
+        Waits until the channel has data to read or has been closed by the server
+
+        It also returns True once the server has ended the stream, when recv returns b''; the callers check _at_eof
+        then and stop reading instead of waiting again.
+
+        The channel's file descriptor is passed to select, so the thread wakes up as soon as data arrives instead of
+        sleeping between reads. If the channel can not be used with select, recv_ready is polled until the timeout
+        expires.
+
+        @param timeout: float, maximum number of seconds to wait
+        @return: True if the channel can be read without blocking
+        """
+        timeout = max(timeout, 0)
+        if self._channel.recv_ready() or self._channel.closed or self._channel.eof_received:
+            return True
+        try:
+            readable, _, _ = select.select([self._channel], [], [], timeout)
+            return bool(readable)
+        except (OSError, ValueError, TypeError):
+            self.logger.debug("_wait_for_data: select not available for channel to {}, polling".format(self.host))
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self._channel.recv_ready() or self._channel.closed or self._channel.eof_received:
+                return True
+            time.sleep(POLL_INTERVAL)
+        return False
+
+    def _at_eof(self):
+        """
+        @return: True if the channel is closed, or the server has ended the stream and everything it sent has been
+        read, so recv returns b'' at once and waiting for more output would spin until the timeout
+        """
+        return self._channel.closed or (self._channel.eof_received and not self._channel.recv_ready())
+
+    def _recv_when_ready(self, bytes, deadline, idle_deadline):
+        """
+        Reads from the channel as soon as data is available, used by rpexpect when wait_mode is 'event'
+
+        @param deadline: float, time.time() value at which the rpexpect loop gives up
+        @param idle_deadline: float, time.time() value at which the channel has been silent for the command timeout
+        @return: bytes read from the channel, or b'' if *deadline* was reached first
+        @raise socket.timeout: if *idle_deadline* was reached, as a blocking recv would have done
+        """
+        if self._wait_for_data(min(deadline, idle_deadline) - time.time()):
+            return self.recv(bytes)
+        if idle_deadline <= deadline:
+            raise socket.timeout("timed out")
+        return b''
+
+    @checkconnection
+    def exec_command(self, command, bytes=32768):
+        """
+        Runs a single command on its own exec channel and reads its output until the server closes the channel
+
+        There is no shell, so there is no prompt to wait for and the output contains neither the echoed command nor
+        a prompt. Exec channels count towards max_channels.
+
+        @param command: str, command to run
+        @return: str, output of the command
+        @raise socket.timeout: if the server sends nothing for command_timeout seconds
+        @raise nxos_XML_errors.TimeoutExpiredError: if no channel became available
+        """
+        output = ''.join(self.exec_command_iter(command, bytes))
+        self.trace("exec_command: output of %s from %s: %s", command, self.host, output)
+        return output
+
+    @checkconnection
+    def exec_command_iter(self, command, bytes=32768):
+        """
+        Streaming version of exec_command, yields the decoded output as it arrives
+
+        The channel is opened when iteration starts and closed when the output ends or the generator is closed.
+        """
+        self.logger.info("ssh: exec %s on %s", command, self.host)
+        if not self._channel_slots.acquire(timeout=self.command_timeout):
+            self.logger.error("exec_command: all {} channels to {} are in use".format(self.max_channels, self.host))
+            raise TimeoutExpiredError("All {} channels to {} are in use".format(self.max_channels, self.host))
+        channel = None
+        start = time.monotonic()
+        received = 0
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        # the end of the output, for the error message
+        tail = ''
+        try:
+            channel = self._transport.open_session()
+            channel.settimeout(self.command_timeout)
+            channel.set_combine_stderr(True)
+            channel.exec_command(command)
+            while True:
+                try:
+                    data = channel.recv(bytes)
+                except socket.timeout:
+                    self.logger.error("exec_command: Timed out waiting for output of {} from {}".format(command,
+                                                                                                     self.host))
+                    raise socket.timeout(
+                        "Socket Timedout waiting for output of {}.  Received response:  {}".format(command, tail))
+                if not data:
+                    break
+                received += len(data)
+                if self.session_log:
+                    self.session_log.write(data)
+                text = decoder.decode(data)
+                if text:
+                    tail = (tail[-EXEC_TAIL:] + text)[-EXEC_TAIL:]
+                    yield text
+        finally:
+            if channel is not None:
+                channel.close()
+            self._channel_slots.release()
+            self.timing.add_command(command, start, time.monotonic(), received)
+
+    @checkconnection
+    def put_file(self, data, remote_path, method='scp'):
+        """
+        Uploads a file to the device on its own channel of the existing transport, see file_transfer
+
+        The channel counts towards max_channels. The upload is recorded in timing as a command.
+
+        @param data: str or bytes, contents of the file
+        @param remote_path: str, path on the device, e.g. flash:/name
+        @param method: 'scp' or 'sftp', the device has to have the matching server enabled
+        @raise nxos_XML_errors.OperationError: if the device refuses an scp transfer
+        @raise nxos_XML_errors.TimeoutExpiredError: if no channel became available
+        """
+        if method not in TRANSFER_METHODS:
+            raise ValueError("put_file: unknown transfer method {}, expected one of {}".format(method,
+                                                                                           TRANSFER_METHODS))
+        if isinstance(data, str):
+            data = data.encode()
+        self.logger.info("ssh: {} {} bytes to {} on {}".format(method, len(data), remote_path, self.host))
+        if not self._channel_slots.acquire(timeout=self.command_timeout):
+            self.logger.error("put_file: all {} channels to {} are in use".format(self.max_channels, self.host))
+            raise TimeoutExpiredError("All {} channels to {} are in use".format(self.max_channels, self.host))
+        start = time.monotonic()
+        try:
+            channel = self._transport.open_session()
+            channel.settimeout(self.command_timeout)
+            if method == 'scp':
+                scp_put(channel, data, remote_path)
+            else:
+                sftp_put(channel, data, remote_path)
+        except:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            stacktrace = traceback.extract_tb(exc_traceback)
+            self.logger.error("put_file: {} of {} to {} failed: {}".format(method, remote_path, self.host, exc_value))
+            self.logger.debug(sys.exc_info())
+            self.logger.debug(stacktrace)
+            raise
+        finally:
+            self._channel_slots.release()
+        self.timing.add_command("{} put {}".format(method, remote_path), start, time.monotonic(), 0)
+
     def recv(self, bytes):
         buffer = self._channel.recv(bytes)
+        self._bytes_received += len(buffer)
         if self.session_log:
-            self.logger.debug("recv: writing to session file: {}".format(self.session_log))
-            self.session_log.write(buffer.decode())
+            # raw bytes are queued for the background writer, see session_log.SessionLogWriter
+            self.session_log.write(buffer)
         return buffer
 
     @checkconnection
@@ -528,7 +953,7 @@ class SshConnect(object):
         Checks if channel is still open before trying to send.
         """
 
-        self.logger.info("ssh: sending " + message + " to " + self.host)
+        self.logger.info("ssh: sending %s to %s", message, self.host)
         try:
             self._channel.send(message)
         except:
@@ -546,6 +971,14 @@ class SshConnect(object):
 
         """
         self.logger.debug("SSH: Close ssh session for {}".format(self.host))
+        if self._parent is not None:
+            # channel opened by open_channel, the transport and session log belong to the parent
+            self._channel.close()
+            self._sshconnected = False
+            if self._holds_slot:
+                self._holds_slot = False
+                self._parent._channel_slots.release()
+            return
         if self._transport is None:
             return
         if self._transport.is_active():
@@ -562,20 +995,17 @@ class SshConnect(object):
         @return: Boolean, Status of current connection
         """
         if self._transport is not None:
-            self.logger.debug("Prior connection check status:")
-            self.logger.debug("sshconnected {} ".format(self._sshconnected))
-            self.logger.debug("transport is active {} ".format(self._transport.is_active()))
-            self.logger.debug("transport is authenticated {} ".format(self._transport.is_authenticated()))
-            self.logger.debug("exit status ready {} ".format(self._channel.exit_status_ready()))
-            _sshconnected = self._transport.is_active() and self._transport.is_authenticated() and not self._channel.exit_status_ready()
+            prior = self._sshconnected
+            active = self._transport.is_active()
+            authenticated = active and self._transport.is_authenticated()
+            # there is no long lived channel when commands are run with exec_command
+            exit_status_ready = authenticated and self._channel is not None and self._channel.exit_status_ready()
+            _sshconnected = authenticated and not exit_status_ready
             if self._sshconnected and not _sshconnected:
                 self.close()
             self._sshconnected = _sshconnected
-            self.logger.debug("Post connection check status:")
-            self.logger.debug("sshconnected {} ".format(self._sshconnected))
-            self.logger.debug("transport is active {} ".format(self._transport.is_active()))
-            self.logger.debug("transport is authenticated {} ".format(self._transport.is_authenticated()))
-            self.logger.debug("exit status ready {} ".format(self._channel.exit_status_ready()))
+            self.trace("sshconnected: prior %s, post %s: transport is active %s, authenticated %s, exit status ready %s",
+                       prior, self._sshconnected, active, authenticated, exit_status_ready)
         return self._sshconnected
 
     @property
@@ -598,16 +1028,19 @@ class SshConnect(object):
         assert isinstance(command_timeout, float) or isinstance(command_timeout, int)
         self._command_timeout = command_timeout
 
-    def open_session_log(self, log_session_file, log_file_mode):
+    def open_session_log(self, log_session_file, log_file_mode, compress=False):
+        """
+        Session output is written by a background thread, see session_log.SessionLogWriter
+
+        @param log_session_file: str, path of the session log, or an open binary file handle
+        @param log_file_mode: str, 'a' or 'append' to append to an existing file
+        @param compress: bool, gzip the session log file
+        """
         self.logger.info("ncssh: open_session_log: filename: {}, filemode: {}".format(log_session_file, log_file_mode))
         if isinstance(log_session_file, str):
             try:
                 # If session_log is a string, open a file corresponding to string name.
-                if log_file_mode == "append" or log_file_mode == "a":
-                    self.session_log = open(log_session_file, mode="a")
-                else:
-                    self.session_log = open(log_session_file, mode="w")
-                self._session_log_close = True
+                self.session_log = SessionLogWriter(log_session_file, mode=log_file_mode, compress=compress)
             except:
                 exc_type, exc_value, exc_traceback = sys.exc_info()
                 stacktrace = traceback.extract_tb(exc_traceback)
@@ -617,8 +1050,8 @@ class SshConnect(object):
                     "ncssh: open_session_log: For some reason the session log output file, " + log_session_file + " for " + self.host + " cannot be created or opened.")
                 self.session_log = None
         elif isinstance(log_session_file, io.BufferedIOBase):
-            # In-memory buffer or an already open file handle
-            self.session_log = log_session_file
+            # In-memory buffer or an already open file handle, flushed but not closed by close_session_log
+            self.session_log = SessionLogWriter(fileobj=log_session_file)
         else:
             self.logger.warning(
                 "session_log must be a path to a file, a file handle, "
@@ -628,7 +1061,7 @@ class SshConnect(object):
         self.logger.info("ncssh: open_session_log: file: {}".format(self.session_log))
 
     def close_session_log(self):
-        """Close the session_log file (if it is a file that we opened)."""
-        if self.session_log is not None and self._session_log_close:
+        """Write out any queued session output and close the session_log file (if it is a file that we opened)."""
+        if self.session_log is not None:
             self.session_log.close()
         self.session_log = None
@@ -0,0 +1,109 @@
+import collections
+import re
+import time
+
+__version__ = '2019.03.04.1'
+
+# device errors that stop_on_error stops on, as checked by SSHInteractive.ssh_cmd_action
+DEVICE_ERROR_PATTERN = re.compile(r"%\s*Invalid|%\s*Error")
+# characters at the end of the unassigned output searched again after a new chunk, so a prompt split across chunks is
+# still found
+SCAN_OVERLAP = 256
+
+
+class CommandPipeline(object):
+    """
+    Keeps up to *window* commands in flight on an interactive shell and splits the output back into one response per
+    command
+
+    The device prints a prompt after each command, so the output is cut after the first match of the oldest command's
+    pattern after the command's echo, which becomes that command's response, and so on. The echo is the first line
+    of the response, so a command that contains its prompt, such as description rtr1(config)#, is not cut short.
+    Every command has to end with exactly one match of its pattern: commands that ask for input or confirmation, or
+    that leave the mode the pattern describes, cannot be pipelined.
+
+    The caller sends what next_batch returns, feeds the output to feed as it arrives, and sends the next batch after
+    each chunk until done. With stop_on_error no more commands are released after a response containing a device
+    error, but commands already sent still have their responses collected.
+
+    The bytes received since the previous response are attributed to the responses completed by a chunk, split by
+    their length when one chunk completes several commands.
+    """
+
+    def __init__(self, cmdlist, window, stop_on_error=False, received=0):
+        """
+        @param cmdlist: list of (command, pattern), pattern is the regex of the prompt that follows the command
+        @param window: int, commands sent but not yet answered at any time
+        @param stop_on_error: boolean, stop releasing commands after a response with a device error
+        @param received: int, bytes received from the device before the first command is sent
+        """
+        if window < 1:
+            raise ValueError("pipeline window must be at least 1, got {}".format(window))
+        self.window = window
+        self.stop_on_error = stop_on_error
+        patterns = {}
+        self._pending = collections.deque(
+            (command.strip(), patterns.setdefault(pattern, re.compile(pattern))) for command, pattern in cmdlist)
+        # (command, compiled pattern, time.monotonic() when sent)
+        self._in_flight = collections.deque()
+        self._text = ''
+        self._scan = 0
+        self._received = received
+        # (command, response) of the first response with a device error, when stop_on_error is set
+        self.failed = None
+
+    def next_batch(self):
+        """
+        @return: str, the commands to send now, each followed by a newline, empty if there are none
+        """
+        batch = []
+        now = time.monotonic()
+        while self._pending and len(self._in_flight) < self.window and self.failed is None:
+            command, pattern = self._pending.popleft()
+            self._in_flight.append((command, pattern, now))
+            batch.append(command + '\n')
+        return ''.join(batch)
+
+    def feed(self, text, received=0):
+        """
+        @param text: str, output received from the device
+        @param received: int, bytes received from the device so far, text included
+        @return: list of (command, response, time.monotonic() when the command was sent, bytes received) completed by
+        text
+        """
+        self._text += text
+        completed = []
+        while self._in_flight:
+            command, pattern, sent = self._in_flight[0]
+            echo_end = self._text.find('\n') + 1
+            match = pattern.search(self._text, max(self._scan, echo_end)) if echo_end else None
+            if match is None:
+                self._scan = max(0, len(self._text) - SCAN_OVERLAP)
+                break
+            self._in_flight.popleft()
+            response = self._text[:match.end()]
+            self._text = self._text[match.end():]
+            self._scan = 0
+            if self.stop_on_error and self.failed is None and DEVICE_ERROR_PATTERN.search(response):
+                self.failed = (command, response)
+            completed.append((command, response, sent))
+        if not completed:
+            return completed
+        size = remaining = received - self._received
+        self._received = received
+        chars = sum(len(response) for command, response, sent in completed)
+        counted = []
+        for command, response, sent in completed[:-1]:
+            nbytes = size * len(response) // chars if chars else 0
+            remaining -= nbytes
+            counted.append((command, response, sent, nbytes))
+        command, response, sent = completed[-1]
+        counted.append((command, response, sent, remaining))
+        return counted
+
+    @property
+    def done(self):
+        return not self._in_flight and (not self._pending or self.failed is not None)
+
+    def __len__(self):
+        return len(self._pending) + len(self._in_flight)
@@ -0,0 +1,158 @@
+import concurrent.futures
+import logging
+import socket
+import threading
+import time
+
+__version__ = '2019.03.04.1'
+
+logger = logging.getLogger('resolver')
+
+# seconds a successful lookup is reused, getaddrinfo does not return the record TTL so this is the upper bound
+DEFAULT_TTL = 300
+# seconds a failed lookup is remembered, so a missing name fails fast instead of asking the resolver again
+NEGATIVE_TTL = 30
+# concurrent lookups during prefetch
+PREFETCH_WORKERS = 64
+
+
+class ResolverCache(object):
+    """
+    Thread safe, in-process cache of getaddrinfo results
+
+    Addresses are cached for *ttl* seconds and failures for *negative_ttl* seconds. Concurrent lookups of the same
+    host share one call to getaddrinfo. prefetch resolves a whole inventory concurrently before the work is
+    dispatched, so the connections start with the answers already cached.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, negative_ttl=NEGATIVE_TTL):
+        """
+        @param ttl: float, seconds addresses are cached
+        @param negative_ttl: float, seconds a failed lookup is cached
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        # host -> (expires, list of getaddrinfo tuples or socket.gaierror)
+        self._cache = {}
+        # host -> concurrent.futures.Future of a lookup in progress
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, host):
+        """
+        @return: list of getaddrinfo tuples with port 0, or the socket.gaierror raised by getaddrinfo
+        """
+        start = time.time()
+        try:
+            result = socket.getaddrinfo(host, None, socket.AF_UNSPEC, socket.SOCK_STREAM)
+            ttl = self.ttl
+        except socket.gaierror as exc:
+            result = exc
+            ttl = self.negative_ttl
+        logger.debug("ResolverCache: resolved {} in {:.3f} seconds: {}".format(host, time.time() - start, result))
+        return time.time() + ttl, result
+
+    def resolve(self, host):
+        """
+        @param host: str, hostname or address
+        @return: list of (family, type, proto, canonname, sockaddr) as returned by getaddrinfo, with port 0
+        @raise socket.gaierror: if the name does not resolve, from the cache if it failed recently
+        """
+        with self._lock:
+            entry = self._cache.get(host)
+            if entry is not None and entry[0] > time.time():
+                self.hits += 1
+                result = entry[1]
+                future = None
+            else:
+                self.misses += 1
+                future = self._pending.get(host)
+                owner = future is None
+                if owner:
+                    future = self._pending[host] = concurrent.futures.Future()
+        if future is not None:
+            if owner:
+                try:
+                    entry = self._lookup(host)
+                    with self._lock:
+                        self._cache[host] = entry
+                except Exception as exc:
+                    # not a failed lookup, e.g. UnicodeError for a label longer than 63 characters: nothing is
+                    # cached, the threads waiting for this lookup get the error too
+                    future.set_exception(exc)
+                    raise
+                else:
+                    future.set_result(entry[1])
+                finally:
+                    with self._lock:
+                        del self._pending[host]
+            result = future.result()
+        if isinstance(result, Exception):
+            # a new exception each time, raising the cached one would keep extending its traceback
+            raise socket.gaierror(*result.args)
+        return result
+
+    def getaddrinfo(self, host, port):
+        """
+        Cached equivalent of socket.getaddrinfo(host, port, AF_UNSPEC, SOCK_STREAM)
+        """
+        return [(family, socktype, proto, canonname, (sockaddr[0], port) + tuple(sockaddr[2:]))
+                for family, socktype, proto, canonname, sockaddr in self.resolve(host)]
+
+    def prefetch(self, hosts, max_workers=PREFETCH_WORKERS):
+        """
+        Resolves hosts concurrently and caches the results
+
+        @param hosts: iterable of hostnames
+        @param max_workers: int, lookups in flight at once
+        @return: dict of host to list of addresses, or to the socket.gaierror for hosts that do not resolve
+        """
+        hosts = list(dict.fromkeys(host.strip() for host in hosts if host and host.strip()))
+        if not hosts:
+            return {}
+        start = time.time()
+
+        def resolve(host):
+            try:
+                return sorted(set(sockaddr[0] for family, socktype, proto, canonname, sockaddr in self.resolve(host)))
+            except socket.gaierror as exc:
+                return exc
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(hosts))) as executor:
+            results = dict(zip(hosts, executor.map(resolve, hosts)))
+        failed = [host for host, result in results.items() if isinstance(result, Exception)]
+        logger.info("ResolverCache: resolved {} hosts in {:.3f} seconds, {} failed".format(
+            len(hosts), time.time() - start, len(failed)))
+        for host in failed:
+            logger.error("ResolverCache: unable to resolve {}: {}".format(host, results[host]))
+        return results
+
+    def invalidate(self, host=None):
+        """
+        Forget the cached result for host, or for all hosts
+        """
+        with self._lock:
+            if host is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(host, None)
+
+
+resolver_cache = ResolverCache()
+
+
+def prefetch(hosts, max_workers=PREFETCH_WORKERS):
+    """
+    Resolves an inventory into the cache used by ncssh.SshConnect, see ResolverCache.prefetch
+    """
+    return resolver_cache.prefetch(hosts, max_workers=max_workers)
+
+
+def qualify(host, domain):
+    """
+    @return: str, host with domain appended unless it already ends with it, as the example scripts build FQDNs
+    """
+    host = host.strip()
+    return host if host.lower().endswith(domain) else host + domain
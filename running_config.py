@@ -0,0 +1,227 @@
+import logging
+import re
+import threading
+import time
+
+__version__ = '2019.03.04.1'
+
+logger = logging.getLogger('running_config')
+
+# commands that may change the running configuration, the snapshot is dropped when one is sent, also when run
+# with do from configuration mode
+CONFIG_CHANGE_PATTERN = re.compile(r"^\s*(do\s+)?(conf|copy|rollback|archive)", re.IGNORECASE)
+# last line of the output, the prompt
+PROMPT_LINE_PATTERN = re.compile(r"[#>]\s*$")
+# seconds a snapshot or a kept output is used, changes made by other tools or people are not seen before that
+MAX_AGE = 300
+
+
+def _abbreviates(word, full, minimum):
+    """
+    @return: boolean, True if word is an abbreviation of full at least minimum characters long, as the CLI accepts
+    """
+    return len(word) >= minimum and full.startswith(word.lower())
+
+
+def _include(lines, pattern):
+    return [line for line in lines if pattern.search(line)]
+
+
+def _exclude(lines, pattern):
+    return [line for line in lines if not pattern.search(line)]
+
+
+def _begin(lines, pattern):
+    for index, line in enumerate(lines):
+        if pattern.search(line):
+            return lines[index:]
+    return []
+
+
+def _section(lines, pattern):
+    """
+    Sections, an unindented line and the indented lines under it, in which any line matches
+    """
+    selected = []
+    section = []
+    for line in lines + ['']:
+        if line[:1] not in (' ', '\t') and section:
+            if any(pattern.search(member) for member in section):
+                selected.extend(section)
+            section = []
+        section.append(line)
+    return selected
+
+
+def _count(lines, pattern):
+    return ["Number of lines which match regexp = {}".format(len(_include(lines, pattern)))]
+
+
+# output modifier, minimum abbreviation, filter
+FILTERS = (
+    ('include', 1, _include),
+    ('exclude', 1, _exclude),
+    ('begin', 1, _begin),
+    ('section', 1, _section),
+    ('count', 1, _count),
+)
+
+
+def parse_show_run(command):
+    """
+    Splits show running-config | filter pattern | ... into its filters
+
+    @param command: str
+    @return: list of (filter function, compiled pattern), empty for the whole configuration, or None if the command
+    is not show running-config with filters that can be applied to a snapshot
+    """
+    parts = command.split('|')
+    words = parts[0].split()
+    if len(words) != 2 or not _abbreviates(words[0], 'show', 2) or not _abbreviates(words[1], 'running-config', 3):
+        return None
+    filters = []
+    for part in parts[1:]:
+        name, _, pattern = part.strip().partition(' ')
+        pattern = pattern.strip()
+        matches = [function for full, minimum, function in FILTERS if _abbreviates(name, full, minimum)]
+        # the device's regex treats _ as a delimiter, those patterns are left to the device
+        if len(matches) != 1 or not pattern or '_' in pattern:
+            return None
+        try:
+            filters.append((matches[0], re.compile(pattern)))
+        except re.error:
+            return None
+    return filters
+
+
+class RunningConfigSnapshot(object):
+    """
+    The output of show running-config at one point in time, from which filtered show running-config commands are
+    answered without asking the device
+    """
+
+    def __init__(self, lines, prompt=''):
+        """
+        @param lines: list of str, the output lines without the echoed command and the prompt
+        @param prompt: str, the prompt that followed the output
+        """
+        self.lines = lines
+        self.prompt = prompt
+        self.taken = time.monotonic()
+
+    @classmethod
+    def from_output(cls, output):
+        """
+        @param output: str, output of show running-config on an interactive shell, with the echoed command and the
+        prompt
+        """
+        lines = output.splitlines()
+        prompt = lines.pop().strip() if lines and PROMPT_LINE_PATTERN.search(lines[-1]) else ''
+        return cls(lines[1:], prompt)
+
+    @property
+    def text(self):
+        return '\n'.join(self.lines)
+
+    def show(self, command):
+        """
+        The output the device would give for a show running-config command with include, exclude, begin, section
+        or count filters, with the echoed command and the prompt
+
+        Patterns are Python regular expressions, which agree with the device's for the patterns used in checks.
+        Patterns with _, which the device treats as a delimiter, are not answered from the snapshot.
+
+        @param command: str
+        @return: str, or None if the command can not be answered from the snapshot
+        """
+        filters = parse_show_run(command)
+        if filters is None:
+            return None
+        lines = self.lines
+        for function, pattern in filters:
+            lines = function(lines, pattern)
+        return command.strip() + '\r\n' + ''.join(line + '\r\n' for line in lines) + self.prompt
+
+
+class RunningConfigCache(object):
+    """
+    Running configuration snapshot, and outputs of show commands kept for reuse, shared by all channels of a
+    connection
+
+    Everything is dropped by invalidate whenever the configuration may have changed. Output fetched while it was
+    being invalidated is used for the request that fetched it but not kept. Changes made outside the session are not
+    seen, so nothing is used once it is more than *max_age* seconds old.
+    """
+
+    def __init__(self, max_age=MAX_AGE):
+        """
+        @param max_age: float, seconds a snapshot or output is used after it was fetched
+        """
+        self.max_age = max_age
+        self.snapshot = None
+        # command -> (time.monotonic() when fetched, output)
+        self.outputs = {}
+        self.generation = 0
+        self.fetches = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        @return: RunningConfigSnapshot, or None if there is none or it is older than max_age
+        """
+        snapshot = self.snapshot
+        if snapshot is None or time.monotonic() - snapshot.taken > self.max_age:
+            return None
+        self.hits += 1
+        return snapshot
+
+    def store(self, output, generation):
+        """
+        @param output: str, output of show running-config
+        @param generation: int, value of generation before the output was fetched
+        @return: RunningConfigSnapshot of output
+        """
+        snapshot = RunningConfigSnapshot.from_output(output)
+        with self._lock:
+            self.fetches += 1
+            if generation == self.generation:
+                self.snapshot = snapshot
+        logger.debug("RunningConfigCache: snapshot of {} lines".format(len(snapshot.lines)))
+        return snapshot
+
+    def output(self, command):
+        """
+        @return: str, the kept output of command, or None if there is none or it is older than max_age
+        """
+        taken, output = self.outputs.get(command, (None, None))
+        if output is None or time.monotonic() - taken > self.max_age:
+            return None
+        self.hits += 1
+        return output
+
+    def store_output(self, command, output, generation):
+        """
+        @param generation: int, value of generation before the output was fetched
+        """
+        taken = time.monotonic()
+        with self._lock:
+            if generation == self.generation:
+                self.outputs[command] = (taken, output)
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self.snapshot = None
+            self.outputs = {}
+
+    def invalidate_for(self, command, mode):
+        """
+        Drops the snapshot if command may have changed the configuration
+
+        @param command: str, command sent to the device
+        @param mode: str, mode of the session after the command, None if not known, see
+        SSHInteractive.SessionState.mode
+        """
+        if mode not in ('enable', 'user') or CONFIG_CHANGE_PATTERN.match(command):
+            self.invalidate()
@@ -0,0 +1,229 @@
+import atexit
+import collections
+import gzip
+import logging
+import threading
+import time
+
+__version__ = '2019.03.04.1'
+
+logger = logging.getLogger('session_log')
+
+# bytes that may be waiting to be written, across all session logs, before writers have to wait for the disk
+MAX_BUFFERED_BYTES = 64 * 1024 * 1024
+# the background thread writes at most this many bytes between checks of the queue
+BATCH_BYTES = 1024 * 1024
+
+
+class BackgroundWriter(object):
+    """
+    A single background thread that writes session log data for all sessions
+
+    Data is held in a queue bounded by MAX_BUFFERED_BYTES. The thread takes everything that is queued, up to
+    BATCH_BYTES, and writes it with one write call per session log. If the disk falls behind and the queue is full,
+    the thread adding data waits for space, and the wait is counted as backpressure on the session log and on the
+    writer.
+    """
+
+    def __init__(self, max_buffered=MAX_BUFFERED_BYTES, batch_bytes=BATCH_BYTES):
+        self.max_buffered = max_buffered
+        self.batch_bytes = batch_bytes
+        self._queue = collections.deque()
+        self._buffered = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stalls = 0
+        self.stall_time = 0.0
+
+    def put(self, sink, data):
+        """
+        Queue data for a session log, waiting for space if the queue is full
+
+        @param sink: SessionLogWriter
+        @param data: bytes, or None to close the session log once its queued data has been written
+        """
+        size = len(data) if data is not None else 0
+        with self._cond:
+            if self._buffered and self._buffered + size > self.max_buffered:
+                self.stalls += 1
+                sink.stalls += 1
+                if self.stalls == 1 or self.stalls % 100 == 0:
+                    logger.warning("session log writer is falling behind, {} bytes queued, {} stalls so far".format(
+                        self._buffered, self.stalls))
+                start = time.time()
+                while self._buffered and self._buffered + size > self.max_buffered:
+                    self._cond.wait()
+                waited = time.time() - start
+                self.stall_time += waited
+                sink.stall_time += waited
+            self._queue.append((sink, data))
+            self._buffered += size
+            sink._queued += size
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='session_log_writer', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def wait_for(self, sink):
+        """
+        Block until all of the data queued for *sink* has been written
+        """
+        with self._cond:
+            while sink._queued:
+                self._cond.wait()
+
+    def drain(self):
+        """
+        Block until everything that has been queued has been written
+        """
+        with self._cond:
+            while self._queue or self._buffered:
+                self._cond.wait()
+
+    @property
+    def buffered(self):
+        """
+        Number of bytes queued but not yet written
+        """
+        return self._buffered
+
+    def _run(self):
+        while True:
+            batch = []
+            size = 0
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                while self._queue and size < self.batch_bytes:
+                    sink, data = self._queue.popleft()
+                    batch.append((sink, data))
+                    size += len(data) if data is not None else 0
+
+            # the accounting is done whatever happens to the writes, or close, flush and drain would wait forever
+            try:
+                pending = collections.OrderedDict()
+                for sink, data in batch:
+                    if data is not None:
+                        pending.setdefault(sink, []).append(data)
+                    else:
+                        sink._write_batch(pending.pop(sink, []))
+                        sink._finish()
+                for sink, chunks in pending.items():
+                    sink._write_batch(chunks)
+            finally:
+                with self._cond:
+                    self._buffered -= size
+                    for sink, data in batch:
+                        if data is not None:
+                            sink._queued -= len(data)
+                    self._cond.notify_all()
+
+
+_writer = BackgroundWriter()
+atexit.register(_writer.drain)
+
+
+class SessionLogWriter(object):
+    """
+    Session log sink used by ncssh.SshConnect
+
+    write takes the raw bytes received from the channel, or str, and queues them for the shared background writer,
+    so the thread waiting for a prompt never touches the disk. The file can optionally be gzip compressed.
+
+    If the disk falls behind, write waits for the queue to drain. The number of waits and the time spent waiting are
+    reported by the backpressure property.
+    """
+
+    def __init__(self, filename=None, mode='w', compress=False, fileobj=None, writer=None):
+        """
+        @param filename: str, path of the session log, '.gz' is appended if compress is True
+        @param mode: str, 'a' or 'append' to append to an existing file, otherwise the file is overwritten
+        @param compress: bool, gzip the session log
+        @param fileobj: an already open binary file object to write to instead of filename, it is flushed but not
+        closed by close
+        @param writer: BackgroundWriter, defaults to the writer shared by all session logs
+        """
+        self._writer = writer if writer is not None else _writer
+        self.stalls = 0
+        self.stall_time = 0.0
+        self._queued = 0
+        self._failed = False
+        self.closed = False
+        self._done = threading.Event()
+        if fileobj is not None:
+            self.name = getattr(fileobj, 'name', repr(fileobj))
+            self._file = fileobj
+            self._close_file = False
+        else:
+            file_mode = 'ab' if mode in ('a', 'append') else 'wb'
+            if compress:
+                if not filename.endswith('.gz'):
+                    filename += '.gz'
+                self._file = gzip.open(filename, file_mode)
+            else:
+                self._file = open(filename, file_mode)
+            self.name = filename
+            self._close_file = True
+
+    def write(self, data):
+        """
+        Queue data to be written to the session log
+
+        @param data: bytes or str
+        """
+        if self.closed:
+            raise ValueError("write to closed session log {}".format(self.name))
+        if isinstance(data, str):
+            data = data.encode()
+        if data:
+            self._writer.put(self, data)
+
+    def flush(self):
+        """
+        Wait until everything written so far is on disk
+        """
+        self._writer.wait_for(self)
+
+    def close(self):
+        """
+        Write out anything still queued and close the file
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self._writer.put(self, None)
+        self._done.wait()
+
+    @property
+    def backpressure(self):
+        """
+        @return: dict with the number of times write had to wait for the disk and the total seconds spent waiting
+        """
+        return {'stalls': self.stalls, 'stall_time': self.stall_time}
+
+    def _write_batch(self, chunks):
+        if not chunks or self._failed:
+            return
+        try:
+            self._file.write(b''.join(chunks))
+            self._file.flush()
+        except Exception:
+            # e.g. ValueError when the caller closed the fileobj it gave us
+            self._failed = True
+            logger.error("session log {} could not be written, further output is discarded".format(self.name),
+                         exc_info=True)
+
+    def _finish(self):
+        try:
+            if self._close_file:
+                self._file.close()
+            else:
+                self._file.flush()
+        except Exception:
+            self._failed = True
+            logger.error("session log {} could not be closed".format(self.name), exc_info=True)
+        finally:
+            self._done.set()
+
+    def __repr__(self):
+        return "<SessionLogWriter {}>".format(self.name)
@@ -0,0 +1,112 @@
+import collections
+import contextlib
+import threading
+import time
+
+__version__ = '2019.03.04.1'
+
+# connection phases in the order they happen, SshConnect and SSHInteractive record the ones they go through
+PHASES = ('admission', 'dns', 'tcp_connect', 'kex', 'auth', 'setup_channel', 'find_prompt', 'enable')
+
+
+class CommandTiming(collections.namedtuple('CommandTiming', 'command start end bytes_received')):
+    """
+    Timing of one command: time.monotonic() values for when it was sent and when the response was complete, and the
+    number of bytes received for it
+    """
+    __slots__ = ()
+
+    @property
+    def seconds(self):
+        return self.end - self.start
+
+
+class SessionTiming(object):
+    """
+    Where the time of a session went: the connection phases and every command
+
+    Phases are recorded with time.monotonic() start and end values, see PHASES for the names used by SshConnect and
+    SSHInteractive. Commands sent on additional channels of the same connection are recorded on the same object.
+    """
+
+    def __init__(self):
+        self.created = time.monotonic()
+        # name -> [start, end]
+        self.phases = collections.OrderedDict()
+        self.commands = []
+        self._lock = threading.Lock()
+
+    def start(self, name):
+        self.phases[name] = [time.monotonic(), None]
+
+    def end(self, name):
+        self.phases[name][1] = time.monotonic()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Context manager recording the time spent in the block as phase *name*, also when the block raises
+        """
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def add_command(self, command, start, end, bytes_received):
+        """
+        @param command: str
+        @param start: float, time.monotonic() when the command was sent
+        @param end: float, time.monotonic() when the response was complete
+        @param bytes_received: int
+        """
+        with self._lock:
+            self.commands.append(CommandTiming(command, start, end, bytes_received))
+
+    @property
+    def durations(self):
+        """
+        @return: OrderedDict of phase name to seconds, None for a phase that did not finish
+        """
+        return collections.OrderedDict(
+            (name, end - start if end is not None else None) for name, (start, end) in self.phases.items())
+
+    @property
+    def connect_time(self):
+        """
+        @return: float, seconds from the start of the first phase to the end of the last finished one
+        """
+        ends = [end for start, end in self.phases.values() if end is not None]
+        if not ends:
+            return 0.0
+        return max(ends) - min(start for start, end in self.phases.values())
+
+    @property
+    def command_time(self):
+        return sum(command.seconds for command in self.commands)
+
+    @property
+    def bytes_received(self):
+        return sum(command.bytes_received for command in self.commands)
+
+    def as_dict(self):
+        """
+        @return: dict that can be logged or serialised, times in seconds
+        """
+        return {
+            'phases': dict(self.durations),
+            'connect_time': self.connect_time,
+            'commands': [{'command': command.command, 'seconds': command.seconds,
+                          'bytes_received': command.bytes_received} for command in self.commands],
+            'command_time': self.command_time,
+            'bytes_received': self.bytes_received,
+        }
+
+    def __str__(self):
+        phases = ", ".join("{} {:.3f}s".format(name, seconds) if seconds is not None else "{} -".format(name)
+                           for name, seconds in self.durations.items())
+        return "connect {:.3f}s ({}), {} commands {:.3f}s, {} bytes".format(
+            self.connect_time, phases, len(self.commands), self.command_time, self.bytes_received)
+
+    def __repr__(self):
+        return "<SessionTiming {}>".format(self)
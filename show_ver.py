@@ -1,7 +1,6 @@
 import functools
 import logging
 import multiprocessing
-import random
 import re
 import sys
 import time
@@ -9,12 +8,16 @@ import traceback
 
 from SSHInteractive import SSHInteractive
 from configure_threading import thread_this
+from resolver import prefetch
 
 logger = logging.getLogger('show_ver')
 
-def simple_configure(device, prompt=None, user="user", passwd="password", checkdict={"show version" : None}, actionlist=None):
+def simple_configure(device, prompt=None, user="user", passwd="password", checkdict={"show version" : None}, actionlist=None,
+                     channel_mode='shell'):
     """
 
+    :param channel_mode: 'exec' runs the checkdict commands on exec channels without prompt discovery or enable,
+    only for collection jobs without an actionlist
     :param device:
     :param user:
     :param passwd:
@@ -22,7 +25,6 @@ def simple_configure(device, prompt=None, user="user", passwd="password", checkd
     :param checkdict:
     :return:
     """
-    time.sleep(3 * random.random())
     device = device.strip()
     logger.info(device)
     logger.info("="*40)
@@ -51,7 +53,7 @@ def simple_configure(device, prompt=None, user="user", passwd="password", checkd
     action_response = check_response = result = None
     try:
         logger.info('Making ssh connection to {}'.format(device))
-        devob.sshconnect(device, username=user, password=passwd)
+        devob.sshconnect(device, username=user, password=passwd, channel_mode=channel_mode)
     except Exception as exc:
         logger.info("Exception encountered during SSH to device {}".format(device))
         logger.debug(exc)
@@ -116,10 +118,12 @@ if __name__ == "__main__":
     username = 'cisco'
     password = 'cisco'
 
-    simple_configure_partial = functools.partial(simple_configure, prompt="csr1000v-1#", user=username, passwd=password)
+    simple_configure_partial = functools.partial(simple_configure, prompt="csr1000v-1#", user=username, passwd=password,
+                                                 channel_mode='exec')
     num_threads = min(len(devices), multiprocessing.cpu_count() * 4)
 
     start = time.time()
+    prefetch(devices)
     results = thread_this(simple_configure_partial, devices, max_threads=num_threads)
     print("{} threads total time : {}".format(num_threads, time.time() - start))
 
@@ -0,0 +1,100 @@
+import io
+import logging
+import mmap
+import tempfile
+
+from command_parser import ConfigParse, MappedConfigParse
+
+__version__ = '2019.03.04.1'
+
+logger = logging.getLogger('spool')
+
+# outputs up to this many bytes stay in memory
+SPOOL_THRESHOLD = 8 * 1024 * 1024
+
+
+class SpooledOutput(object):
+    """
+    Command output that is kept in memory up to *threshold* bytes and written to a temporary file beyond that
+
+    Once the output is complete, parser returns a ConfigParse for output that stayed in memory and a
+    MappedConfigParse over an mmap of the file for output that was spilled, so checks on very large outputs are run
+    without the output ever being a Python str. The temporary file is deleted by close.
+    """
+
+    def __init__(self, threshold=SPOOL_THRESHOLD, encoding='utf-8', dir=None):
+        """
+        @param threshold: int, bytes kept in memory before switching to a temporary file
+        @param encoding: str, used to encode str written to the output and to decode it again
+        @param dir: str, directory for the temporary file, defaults to the system temporary directory
+        """
+        self.threshold = threshold
+        self.encoding = encoding
+        self.dir = dir
+        self.size = 0
+        self.spilled = False
+        self._file = io.BytesIO()
+        self._map = None
+
+    def write(self, data):
+        """
+        @param data: str or bytes
+        """
+        if isinstance(data, str):
+            data = data.encode(self.encoding)
+        if not self.spilled and self.size + len(data) > self.threshold:
+            self._spill()
+        self._file.write(data)
+        self.size += len(data)
+
+    def _spill(self):
+        spooled = tempfile.TemporaryFile(dir=self.dir, prefix='ncssh_spool_')
+        spooled.write(self._file.getbuffer())
+        self._file = spooled
+        self.spilled = True
+        logger.debug("SpooledOutput: output larger than {} bytes spilled to {}".format(self.threshold, spooled.name))
+
+    def getbuffer(self):
+        """
+        @return: memoryview of the output in memory, or an mmap of the temporary file
+        """
+        if not self.spilled:
+            return self._file.getbuffer()
+        if self._map is None:
+            self._file.flush()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def parser(self):
+        """
+        @return: ConfigParse of the output if it is in memory, MappedConfigParse over the mmap if it was spilled
+        """
+        if not self.spilled:
+            return ConfigParse(self.getvalue())
+        return MappedConfigParse(self.getbuffer(), encoding=self.encoding)
+
+    def getvalue(self):
+        """
+        @return: str, the whole output; for spilled output this reads the file into memory
+        """
+        if not self.spilled:
+            return self._file.getvalue().decode(self.encoding, 'replace')
+        return bytes(self.getbuffer()).decode(self.encoding, 'replace')
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def __repr__(self):
+        return "<SpooledOutput {} bytes{}>".format(self.size, ", spilled" if self.spilled else "")
@@ -0,0 +1,46 @@
+import logging
+
+__version__ = '2019.03.04.1'
+
+
+class HotPathTracer(object):
+    """
+    Debug tracing for the send and receive paths of ncssh.SshConnect and SSHInteractive
+
+    Messages use logging's lazy %-style arguments, so nothing is formatted unless the message is emitted, and
+    the tracer checks logger.isEnabledFor(DEBUG) once per command rather than once per message. Callers that need
+    to do extra work to produce a message can test the *active* attribute first.
+
+    With a *sample_rate* of N only 1 in N commands is traced, start_command is called at the beginning of each
+    command to decide whether it is one of them.
+    """
+
+    def __init__(self, logger, sample_rate=1):
+        """
+        @param logger: logging.Logger the trace messages are sent to
+        @param sample_rate: int, trace 1 in every sample_rate commands
+        """
+        self.logger = logger
+        self.sample_rate = max(int(sample_rate), 1)
+        self._commands = 0
+        self.active = self.logger.isEnabledFor(logging.DEBUG)
+
+    def start_command(self):
+        """
+        Decide whether the command that is about to be sent is traced
+
+        @return: bool, True if trace messages for this command will be logged
+        """
+        self._commands += 1
+        self.active = self.logger.isEnabledFor(logging.DEBUG) and (self._commands - 1) % self.sample_rate == 0
+        return self.active
+
+    def __call__(self, msg, *args):
+        """
+        Log a debug message for the current command if it is being traced
+
+        @param msg: str, %-style format string
+        @param args: arguments for msg, only formatted if the message is logged
+        """
+        if self.active:
+            self.logger.debug(msg, *args, stacklevel=2)
@@ -0,0 +1,295 @@
+import random
+import unittest
+
+import command_parser
+from SSHInteractive import SSHInteractive
+from command_parser import (CheckPlan, CompiledChecks, ConfigParse, FLAG_COMPILERS, MappedConfigParse,
+                            NumericComparison, commandparse, comparison)
+from ncssh import SshConnect
+
+OUTPUT = ConfigParse("""show flash
+Directory of flash:/
+    1  -rw-    33591768  <no date>  c2960-lanbasek9-mz.150-2.SE11.bin
+    2  -rw-        2048  <no date>  config.text
+32514048 bytes total (16000000 bytes free)
+Gi1/0/1 is up, line protocol is up
+     0 input errors, 0 CRC, 0 frame
+Gi1/0/2 is up, line protocol is up
+     12 input errors, 3 CRC, 0 frame
+Gi1/0/3 is down, line protocol is down
+     0 input errors, 0 CRC, 0 frame
+temperature 41.5 C
+switch1#""")
+
+EXPRESSIONS = ['> 1', '>1', '>= 1', '< 0', '<= 2.5', '== 3', '!= 3', '== 3.0', '> -2', '> +2', '< .5', '> 5.',
+               '> 1e3', '< 1E-3', '> 1_000', '== 0x10', '> 1 and True', '> 1 or False', '== 9007199254740993',
+               '< 9007199254740993', '> 1e400', ' >  16000000 ', '>', '> 1 >', 'not a comparison']
+NUMBERS = [0, 1, 2, 3, 2.5, -2, 0.0001, 1000, 1000.5, 16000000, 9007199254740992.0, 9007199254740994.0,
+           float('inf'), float('-inf'), float('nan')]
+
+
+def eval_compare(number, expression):
+    """How commandparse tested a number before NumericComparison"""
+    return eval(str(float(number)) + expression)
+
+
+def eval_commandparse(output, pattern_dic):
+    """
+    The countcmpnuml, countcmpnumzl and numcmpl branches of commandparse before NumericComparison, with the results
+    of map made lists, as they were under Python 2
+    """
+    resultd = {}
+    for flag, pat in pattern_dic.items():
+        if flag == 'countcmpnuml':
+            pats = [i for i, j in pat]
+            nums = [j for i, j in pat]
+            resultp = output.countl(pats)
+            try:
+                result = list(map((lambda r, op: eval(str(float(r)) + op)), resultp, nums))
+            except:
+                result = ["Error in List or Regular Expression"]
+        elif flag == 'countcmpnumzl':
+            pats = [i for i, j in pat]
+            nums = [j for i, j in pat]
+            resultp = output.countl(pats)
+            try:
+                result = list(map((lambda r, op: eval(str(float(r)) + op) or r == 0), resultp, nums))
+            except:
+                result = ["Error in List or Regular Expression"]
+        elif flag == 'numcmpl':
+            result = []
+            pats = [i for i, k in pat]
+            nums = [k for i, k in pat]
+            resultp = map((lambda pat: output.searchall(pat)), pats)
+            fail = 0
+            m = 0
+            for rl in resultp:
+                op = nums[m]
+                for r in rl:
+                    if not eval(str(float(r)) + op):
+                        fail = 1
+                m += 1
+                if fail:
+                    result.append(False)
+                else:
+                    result.append(True)
+        resultd[flag] = result
+    return resultd
+
+
+def outcome(function, *args):
+    """The result of function, or the type of the exception it raised"""
+    try:
+        return function(*args)
+    except Exception as exc:
+        return type(exc)
+
+
+class TestNumericComparison(unittest.TestCase):
+
+    def test_same_as_eval(self):
+        for expression in EXPRESSIONS:
+            compare = NumericComparison(expression)
+            for number in NUMBERS:
+                self.assertEqual(outcome(compare, float(number)), outcome(eval_compare, number, expression),
+                                 (number, expression))
+
+    def test_single_comparisons_are_not_evaluated(self):
+        for expression in ('> 1', '<= 2.5', '== 9007199254740993', '> 1_000', ' >  16000000 '):
+            self.assertIsNotNone(NumericComparison(expression).compare, expression)
+        for expression in ('== 0x10', '> 1 and True', '>', 'not a comparison', 7):
+            self.assertIsNone(NumericComparison(expression).compare, expression)
+
+    def test_comparisons_are_reused(self):
+        self.assertIs(comparison('> 1'), comparison('> 1'))
+        self.assertEqual(comparison(['> 1']).expression, ['> 1'])
+
+    def test_all_same_as_eval(self):
+        numbers = [number for number in NUMBERS if number == number and abs(number) != float('inf')]
+        for expression in EXPRESSIONS:
+            compare = NumericComparison(expression)
+            for count in (0, 1, len(numbers)):
+                self.assertEqual(outcome(compare.all, numbers[:count]),
+                                 outcome(lambda: all(eval_compare(number, expression) for number in numbers[:count])),
+                                 (expression, count))
+
+    def test_all_with_non_finite_numbers(self):
+        # 'inf > 1' is not Python, eval raises NameError, and so does the comparison
+        for count in (1, 300):
+            for number in (float('inf'), float('-inf'), float('nan')):
+                numbers = [1.0] * (count - 1) + [number]
+                self.assertRaises(NameError, NumericComparison('> 0').all, numbers)
+                self.assertRaises(NameError, lambda: all(eval_compare(n, '> 0') for n in numbers))
+
+
+@unittest.skipIf(command_parser.numpy is None, "numpy is not installed")
+class TestVectorized(unittest.TestCase):
+
+    def assertSameAsEval(self, expression, numbers):
+        self.assertGreaterEqual(len(numbers), command_parser.VECTORIZE_THRESHOLD)
+        self.assertEqual(outcome(NumericComparison(expression).all, numbers),
+                         outcome(lambda: all(eval_compare(number, expression) for number in numbers)),
+                         expression)
+
+    def test_same_as_eval(self):
+        generator = random.Random(1)
+        for size in (command_parser.VECTORIZE_THRESHOLD, 1000):
+            numbers = [float(generator.randint(0, 100)) for _ in range(size)]
+            for expression in ('>= 0', '> 0', '< 100', '<= 100', '!= 50', '== 7', '> -1e3', '< 100.5'):
+                self.assertSameAsEval(expression, numbers)
+            self.assertSameAsEval('== 7', [7.0] * size)
+            self.assertSameAsEval('!= 7', [8.0] * (size - 1) + [7.0])
+
+    def test_operands_past_2_53(self):
+        # as a float 9007199254740993 is 9007199254740992.0, Python compares the int exactly
+        numbers = [9007199254740992.0] * 300
+        for expression in ('== 9007199254740993', '< 9007199254740993', '!= 9007199254740993', '>= 9007199254740993',
+                           '== 9007199254740992', '< -9007199254740993'):
+            self.assertSameAsEval(expression, numbers)
+        self.assertFalse(NumericComparison('== 9007199254740993').all(numbers))
+        self.assertTrue(NumericComparison('< 9007199254740993').all(numbers))
+
+    def test_non_finite_numbers(self):
+        for number in (float('inf'), float('-inf'), float('nan')):
+            self.assertSameAsEval('> 0', [1.0] * 299 + [number])
+        self.assertSameAsEval('< 1e400', [1.0] * 300)
+
+    def test_numcmpl(self):
+        output = ConfigParse("".join("Gi1/0/{} {} input errors\n".format(index, index % 7) for index in range(300)))
+        for expression in ('< 7', '< 6', '>= 0', '== 0', '!= 9007199254740993'):
+            pattern_dic = {'numcmpl': [(r'(\d+) input errors', expression)]}
+            self.assertEqual(commandparse(output, pattern_dic), eval_commandparse(output, pattern_dic), expression)
+
+
+class TestNumericFlags(unittest.TestCase):
+
+    def assertSameAsEval(self, pattern_dic):
+        self.assertEqual(outcome(commandparse, OUTPUT, pattern_dic), outcome(eval_commandparse, OUTPUT, pattern_dic),
+                         pattern_dic)
+
+    def test_countcmpnuml(self):
+        for flag in ('countcmpnuml', 'countcmpnumzl'):
+            for expression in EXPRESSIONS:
+                self.assertSameAsEval({flag: [('input errors', expression), (r'is up', expression),
+                                              ('not in the output', expression), (r'\d+ CRC', expression)]})
+
+    def test_numcmpl(self):
+        for expression in EXPRESSIONS:
+            self.assertSameAsEval({'numcmpl': [(r'\((\d+) bytes free\)', expression),
+                                               (r'(\d+) input errors', expression),
+                                               (r'temperature ([\d.]+)', expression),
+                                               ('(not in the output)', expression)]})
+
+    def test_one_failure_fails_the_rest(self):
+        pattern_dic = {'numcmpl': [(r'(\d+) input errors', '== 0'), (r'\((\d+) bytes free\)', '> 0')]}
+        self.assertEqual(commandparse(OUTPUT, pattern_dic), {'numcmpl': [False, False]})
+        self.assertSameAsEval(pattern_dic)
+
+    def test_bad_patterns(self):
+        for flag in ('countcmpnuml', 'countcmpnumzl', 'numcmpl'):
+            self.assertSameAsEval({flag: [('(', '> 1')]})
+
+
+# every flag, with literal, escaped and regex patterns, patterns shared between commands, and patterns that fail
+CHECKDICT = {
+    'show flash': {
+        'exist': r'bytes free',
+        'existl': ['config.text', r'config\.text', r'c2960\-lanbasek9', r'\((\d+) bytes free\)', 'not in the output'],
+        'notexist': r'^\s+3\s',
+        'notexistl': ['config.text', r'\d+ bytes total', 'not in the output'],
+        'count': r'-rw-',
+        'countl': [r'\d+ CRC', 'is up', 'input errors', 'not in the output'],
+        'countcmpl': (['is up', 'line protocol is up'], 1),
+        'countcmpnuml': [('input errors', '== 3'), ('is up', '> 1'), ('not in the output', '> 0')],
+        'countcmpnumzl': [('is down', '== 2'), ('not in the output', '> 0')],
+        'numcmpl': [(r'\((\d+) bytes free\)', '> 16000000'), (r'(\d+) input errors', '< 100'),
+                    (r'temperature ([\d.]+)', '< 50')],
+    },
+    'show interfaces': {
+        'existl': ['is up', r'Gi1/0/\d+ is down'],
+        'countcmpl': (['input errors', 'CRC,'], 1),
+        'countcmpnuml': [('is up', '>= 2 and True')],
+        'numcmpl': [(r'(\d+) input errors', '== 0'), (r'(\d+) CRC', '>= 0')],
+    },
+    'show counts': {
+        'countcmpl': (['is up', r'Gi\d'], 2),
+        'countcmpnumzl': [('input errors', '>')],
+    },
+    'show none': {
+        'countcmpl': (['not in the output', 'also not'], 1),
+        'numcmpl': [('(not in the output)', '> 0')],
+    },
+    'show bad pattern in countcmpl': {'countcmpl': (['is up', '('], 1)},
+    'show unsupported': {'existl': ['is up'], 'nosuchflag': ['is up']},
+    'show output only': None,
+}
+# checks that raise, as commandparse does
+FAILING = {
+    'show bad regex': {'existl': ['is up', '(']},
+    'show bad first pattern': {'countcmpl': (['(', 'is up'], 1)},
+    'show bad shape': {'countcmpnuml': 'not a list of tuples'},
+    'show bad numcmpl': {'numcmpl': [('[', '> 1')]},
+}
+
+
+class ParseSession(SSHInteractive):
+    """SSHInteractive whose ssh_cmd_run gives OUTPUT for every command"""
+
+    def __init__(self):
+        super().__init__()
+        SshConnect.__init__(self, 'switch1')
+        self.channel_mode = 'shell'
+        self.session_log = None
+        self.init_session_state()
+
+    def ssh_cmd_run(self, cmd, *args, **kwargs):
+        return cmd + "\r\n" + OUTPUT
+
+
+class TestCheckPlan(unittest.TestCase):
+
+    def test_every_flag_is_tested(self):
+        flags = set(flag for tests in CHECKDICT.values() if tests for flag in tests)
+        self.assertLessEqual(set(FLAG_COMPILERS), flags)
+
+    def test_same_as_commandparse(self):
+        checkdict = dict(CHECKDICT, **FAILING)
+        plan = CheckPlan(checkdict)
+        for command, tests in checkdict.items():
+            expected = None if tests is None else outcome(commandparse, ConfigParse(OUTPUT), tests)
+            self.assertEqual(outcome(plan.evaluate, command, OUTPUT), expected, command)
+            self.assertEqual(outcome(plan.evaluate, command, ConfigParse(OUTPUT)), expected, command)
+            if tests is not None:
+                self.assertEqual(outcome(commandparse, ConfigParse(OUTPUT), plan[command]), expected, command)
+
+    def test_mapped_output(self):
+        plan = CheckPlan(CHECKDICT)
+        data = str(OUTPUT).encode()
+        for command, tests in CHECKDICT.items():
+            if tests is not None:
+                self.assertEqual(outcome(plan.evaluate, command, MappedConfigParse(data)),
+                                 outcome(commandparse, MappedConfigParse(data), tests), command)
+
+    def test_plan_is_reusable(self):
+        plan = CheckPlan(CHECKDICT)
+        first = [plan.evaluate(command, OUTPUT) for command in CHECKDICT]
+        other = ConfigParse("Gi1/0/9 is up, line protocol is up\n 7 input errors, 7 CRC\n")
+        for command, tests in CHECKDICT.items():
+            if tests is not None:
+                self.assertEqual(plan.evaluate(command, other), commandparse(ConfigParse(other), tests), command)
+        self.assertEqual([plan.evaluate(command, OUTPUT) for command in CHECKDICT], first)
+        self.assertIs(CheckPlan(plan)['show flash'], plan['show flash'])
+        self.assertIsInstance(plan['show flash'], CompiledChecks)
+
+    def test_ssh_parse_test(self):
+        # ssh_parse_test only takes flags whose result is a list
+        checkdict = dict((command, tests if tests is None else
+                          dict((flag, pat) for flag, pat in tests.items()
+                               if isinstance(commandparse(OUTPUT, {flag: pat})[flag], list)))
+                         for command, tests in CHECKDICT.items())
+        self.assertEqual(ParseSession().ssh_parse_test(CheckPlan(checkdict), config_snapshot=False),
+                         ParseSession().ssh_parse_test(checkdict, config_snapshot=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
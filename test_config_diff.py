@@ -0,0 +1,134 @@
+import doctest
+import unittest
+
+import config_diff
+from config_diff import config_paths, missing_config
+
+RUNNING = """Building configuration...
+
+Current configuration : 1024 bytes
+!
+hostname rtr1
+!
+interface Loopback0
+!
+interface GigabitEthernet1
+ description uplink
+ ip address 10.0.0.1 255.255.255.0
+ shutdown
+!
+interface GigabitEthernet2
+ description spare
+ no ip address
+!
+router bgp 65000
+ bgp log-neighbor-changes
+ address-family ipv4
+  neighbor 10.0.0.2 activate
+ exit-address-family
+!
+ip route 0.0.0.0 0.0.0.0 10.0.0.254
+snmp-server community public RO
+no ip http server
+end
+"""
+
+
+def load_tests(loader, tests, ignore):
+    tests.addTests(doctest.DocTestSuite(config_diff))
+    return tests
+
+
+class TestConfigPaths(unittest.TestCase):
+
+    def test_paths(self):
+        paths = config_paths(RUNNING)
+        self.assertIn(("interface GigabitEthernet1", "description uplink"), paths)
+        self.assertIn(("router bgp 65000", "address-family ipv4", "neighbor 10.0.0.2 activate"), paths)
+        self.assertIn(("interface Loopback0",), paths)
+        self.assertIn(("snmp-server community public RO",), paths)
+        self.assertNotIn(("!",), paths)
+
+
+class TestIndented(unittest.TestCase):
+
+    def assertMissing(self, cmdlist, expected):
+        self.assertEqual(missing_config(cmdlist, RUNNING), expected)
+
+    def test_everything_present(self):
+        self.assertMissing(["hostname rtr1", "interface GigabitEthernet1", " description uplink", " shutdown",
+                            "snmp-server community public RO", "router bgp 65000", " address-family ipv4",
+                            "  neighbor 10.0.0.2 activate"], [])
+
+    def test_missing_child_sends_its_parents(self):
+        self.assertMissing(["interface GigabitEthernet1", " description uplink", " mtu 9000"],
+                           ["interface GigabitEthernet1", " mtu 9000"])
+        self.assertMissing(["router bgp 65000", " address-family ipv4", "  neighbor 10.0.0.3 activate"],
+                           ["router bgp 65000", " address-family ipv4", "  neighbor 10.0.0.3 activate"])
+
+    def test_mixed_modes(self):
+        self.assertMissing(["interface GigabitEthernet1", " description uplink", " no shutdown",
+                            "snmp-server community public RO", "interface GigabitEthernet2", " shutdown",
+                            "snmp-server community private RO"],
+                           ["interface GigabitEthernet1", " no shutdown", "interface GigabitEthernet2", " shutdown",
+                            "snmp-server community private RO"])
+
+    def test_first_command_is_at_the_top_level(self):
+        self.assertMissing(["description uplink", "interface GigabitEthernet1", " shutdown"], ["description uplink"])
+
+    def test_no_commands(self):
+        self.assertMissing(["interface GigabitEthernet2", " no ip address", " no shutdown"], [])
+        self.assertMissing(["interface GigabitEthernet1", " no shutdown"],
+                           ["interface GigabitEthernet1", " no shutdown"])
+        self.assertMissing(["no ip http server", "no ip domain lookup"], [])
+        self.assertMissing(["no snmp-server community public RO"], ["no snmp-server community public RO"])
+
+    def test_whitespace_and_abbreviations(self):
+        self.assertMissing(["interface  GigabitEthernet1", "  description   uplink"], [])
+        self.assertMissing(["int GigabitEthernet1", " desc uplink"], ["int GigabitEthernet1", " desc uplink"])
+        self.assertMissing(["", "hostname rtr1", "   "], [])
+
+
+class TestFlat(unittest.TestCase):
+
+    def assertMissing(self, cmdlist, expected):
+        self.assertEqual(missing_config(cmdlist, RUNNING), expected)
+
+    def test_everything_present(self):
+        self.assertMissing(["interface GigabitEthernet1", "description uplink", "shutdown",
+                            "snmp-server community public RO", "router bgp 65000", "address-family ipv4"], [])
+
+    def test_missing_child(self):
+        self.assertMissing(["interface GigabitEthernet1", "description uplink", "mtu 9000"],
+                           ["interface GigabitEthernet1", "mtu 9000"])
+
+    def test_top_level_command_ends_the_mode(self):
+        # shutdown comes after snmp-server community, at the top level as on the device, not under snmp-server
+        self.assertMissing(["interface GigabitEthernet1", "description uplink", "snmp-server community public RO",
+                            "shutdown"], ["shutdown"])
+        self.assertMissing(["interface GigabitEthernet1", "description uplink", "ip route 0.0.0.0 0.0.0.0 10.0.0.254",
+                            "no ip http server", "hostname rtr1"], [])
+
+    def test_top_level_mode_starts_a_new_mode(self):
+        self.assertMissing(["interface GigabitEthernet1", "description uplink", "interface GigabitEthernet2",
+                            "description spare", "mtu 9000"], ["interface GigabitEthernet2", "mtu 9000"])
+        self.assertMissing(["snmp-server community public RO", "interface GigabitEthernet2", "shutdown"],
+                           ["interface GigabitEthernet2", "shutdown"])
+
+    def test_mode_with_nothing_under_it(self):
+        self.assertMissing(["snmp-server community public RO", "interface Loopback0", "description loopback"],
+                           ["interface Loopback0", "description loopback"])
+
+    def test_new_mode(self):
+        self.assertMissing(["interface GigabitEthernet3", "description new", "shutdown"],
+                           ["interface GigabitEthernet3", "description new", "shutdown"])
+
+    def test_no_commands(self):
+        self.assertMissing(["interface GigabitEthernet1", "no shutdown"], ["interface GigabitEthernet1", "no shutdown"])
+        self.assertMissing(["interface GigabitEthernet2", "no ip address", "no shutdown"], [])
+        self.assertMissing(["interface GigabitEthernet2", "no ip http server"], [])
+        self.assertMissing(["snmp-server community public RO", "no ip http server"], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
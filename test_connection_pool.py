@@ -0,0 +1,89 @@
+import unittest
+
+from connection_pool import ConnectionPool
+
+
+class FakeTransport(object):
+    def send_ignore(self):
+        pass
+
+    def set_keepalive(self, interval):
+        pass
+
+
+class FakeCache(object):
+    def invalidate(self):
+        pass
+
+
+class FakeSession(object):
+    """Stands in for SSHInteractive, records the sshconnect arguments"""
+
+    def __init__(self):
+        self.sshconnected = False
+        self.prompt = 'rtr1#'
+        self.config_cache = FakeCache()
+
+    def sshconnect(self, host, **kwargs):
+        self.host = host
+        self.kwargs = kwargs
+        self.sshconnected = True
+        self._transport = FakeTransport()
+
+    def close_session_log(self):
+        pass
+
+    def close(self):
+        self.sshconnected = False
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ConnectionPool(factory=FakeSession)
+
+    def reused(self, first, **kwargs):
+        session = self.pool.acquire('rtr1', **first)
+        self.pool.release(session)
+        other = self.pool.acquire('rtr1', **kwargs)
+        self.pool.release(other)
+        return other is session
+
+    def test_same_arguments_reuse_the_session(self):
+        arguments = dict(username='u', password='p', enable_password='e', channel_mode='shell', prompt=None,
+                         check_priv=True)
+        self.assertTrue(self.reused(arguments, **arguments))
+        self.assertEqual((self.pool.hits, self.pool.misses), (1, 1))
+
+    def test_defaults_match_sshconnect(self):
+        self.assertTrue(self.reused(dict(username='u', password='p'), username='u', password='p',
+                                    channel_mode='shell', check_priv=True, prompt=None, enable_password=None))
+
+    def test_other_arguments_are_not_matched(self):
+        self.assertTrue(self.reused(dict(username='u', password='p', command_timeout=10), username='u', password='p',
+                                    command_timeout=30))
+
+    def test_key_arguments(self):
+        first = dict(username='u', password='p', enable_password='e')
+        for change in (dict(username='v'), dict(password='q'), dict(enable_password='f'), dict(enable_password=None),
+                       dict(channel_mode='exec'), dict(check_priv=False), dict(prompt='rtr1>'), dict(port=2222)):
+            self.setUp()
+            self.assertFalse(self.reused(first, **dict(first, **change)), change)
+
+    def test_exec_session_is_not_handed_to_a_shell_caller(self):
+        session = self.pool.acquire('rtr1', username='u', password='p', channel_mode='exec')
+        self.pool.release(session)
+        shell = self.pool.acquire('rtr1', username='u', password='p')
+        self.assertIsNot(shell, session)
+        self.assertEqual(session.kwargs['channel_mode'], 'exec')
+        self.assertNotIn('channel_mode', shell.kwargs)
+
+    def test_passwords_are_not_kept_in_the_key(self):
+        session = self.pool.acquire('rtr1', username='u', password='secret', enable_password='enable-secret')
+        key = self.pool._sessions[session][0]
+        self.assertNotIn('secret', key)
+        self.assertNotIn('enable-secret', key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+import unittest
+
+from SSHInteractive import SSHInteractive
+from ncssh import SshConnect
+from pipeline import CommandPipeline
+
+CONFIG_PROMPT = "rtr1(config)#"
+CONFIG_PATTERN = r"rtr1\(config\S*\)#"
+INVALID = "% Invalid input detected at '^' marker.\r\n\r\n"
+
+
+def reply(command, prompt=CONFIG_PROMPT):
+    """What the device prints for command: its echo, an error for commands starting with bad, and the prompt"""
+    command = command.strip()
+    return command + "\r\n" + (INVALID if command.startswith("bad") else "") + prompt
+
+
+def output_of(commands):
+    return "".join(reply(command) for command in commands)
+
+
+def feed_all(pipeline, text, size=None):
+    """
+    Feeds text to pipeline in chunks of size characters, releasing batches as _send_pipelined does, the device
+    output already holds the responses to commands not yet released
+    """
+    completed = []
+    size = size or len(text)
+    for index in range(0, len(text), size):
+        completed.extend(pipeline.feed(text[index:index + size]))
+        while pipeline.next_batch():
+            completed.extend(pipeline.feed(''))
+    return completed
+
+
+class TestCommandPipeline(unittest.TestCase):
+
+    def assertSplits(self, commands, window, size=None):
+        pipeline = CommandPipeline([(command, CONFIG_PATTERN) for command in commands], window)
+        batch = pipeline.next_batch()
+        self.assertEqual(batch, "".join(command.strip() + "\n" for command in commands[:window]))
+        completed = feed_all(pipeline, output_of(commands), size)
+        self.assertEqual([(command, response) for command, response, sent, nbytes in completed],
+                         [(command.strip(), reply(command)) for command in commands])
+        self.assertTrue(pipeline.done)
+        self.assertEqual(len(pipeline), 0)
+
+    def test_window_boundaries(self):
+        commands = ["interface GigabitEthernet{}".format(index) for index in range(1, 5)]
+        for window in (1, 3, 4, 5):
+            for count in (1, window - 1, window, window + 1):
+                if count > 0:
+                    self.assertSplits(commands[:count], window)
+
+    def test_one_character_at_a_time(self):
+        commands = ["interface GigabitEthernet1", " description uplink", " no shutdown", "exit"]
+        for window in (1, 2, 4):
+            self.assertSplits(commands, window, size=1)
+
+    def test_chunks_that_split_the_prompt(self):
+        commands = ["a {}".format(index) for index in range(10)]
+        for size in (2, 5, 7, 13, 14):
+            self.assertSplits(commands, 4, size=size)
+
+    def test_prompt_echoed_in_the_command(self):
+        commands = ["interface GigabitEthernet1", " description rtr1(config)# uplink", " description rtr1(config-if)#",
+                    "exit"]
+        for window in (1, 2, 4):
+            self.assertSplits(commands, window)
+            self.assertSplits(commands, window, size=3)
+
+    def test_prompt_in_the_output(self):
+        commands = ["do show run | include description", "exit"]
+        text = ("do show run | include description\r\n description was rtr1(config)# before\r\n" + CONFIG_PROMPT +
+                reply("exit"))
+        pipeline = CommandPipeline([(command, CONFIG_PATTERN) for command in commands], 2)
+        pipeline.next_batch()
+        responses = [response for command, response, sent, nbytes in feed_all(pipeline, text)]
+        # a prompt in the output itself can not be told apart from the real one, as for a single command
+        self.assertEqual(responses[0], "do show run | include description\r\n description was rtr1(config)#")
+
+    def test_next_batch_keeps_the_window(self):
+        commands = ["a {}".format(index) for index in range(5)]
+        pipeline = CommandPipeline([(command, CONFIG_PATTERN) for command in commands], 2)
+        self.assertEqual(pipeline.next_batch(), "a 0\na 1\n")
+        self.assertEqual(pipeline.next_batch(), "")
+        pipeline.feed(reply("a 0"))
+        self.assertEqual(pipeline.next_batch(), "a 2\n")
+        pipeline.feed(reply("a 1") + reply("a 2"))
+        self.assertEqual(pipeline.next_batch(), "a 3\na 4\n")
+
+    def test_stop_on_error_partway_through_a_window(self):
+        commands = ["a 1", "bad 2", "a 3", "a 4", "a 5"]
+        pipeline = CommandPipeline([(command, CONFIG_PATTERN) for command in commands], 3, stop_on_error=True)
+        self.assertEqual(pipeline.next_batch(), "a 1\nbad 2\na 3\n")
+        completed = pipeline.feed(reply("a 1") + reply("bad 2"))
+        self.assertEqual(pipeline.failed, ("bad 2", reply("bad 2")))
+        self.assertEqual(pipeline.next_batch(), "")
+        self.assertFalse(pipeline.done)
+        # a 3 was already sent, its response is still collected
+        completed += pipeline.feed(reply("a 3"))
+        self.assertTrue(pipeline.done)
+        self.assertEqual([command for command, response, sent, nbytes in completed], ["a 1", "bad 2", "a 3"])
+        self.assertEqual(len(pipeline), 2)
+
+    def test_stop_on_error_at_the_end_of_a_window(self):
+        commands = ["a 1", "a 2", "bad 3", "a 4"]
+        pipeline = CommandPipeline([(command, CONFIG_PATTERN) for command in commands], 3, stop_on_error=True)
+        pipeline.next_batch()
+        completed = feed_all(pipeline, output_of(commands[:3]))
+        self.assertEqual(pipeline.failed[0], "bad 3")
+        self.assertTrue(pipeline.done)
+        self.assertEqual(len(completed), 3)
+
+    def test_errors_without_stop_on_error(self):
+        commands = ["a 1", "bad 2", "a 3"]
+        pipeline = CommandPipeline([(command, CONFIG_PATTERN) for command in commands], 2)
+        pipeline.next_batch()
+        completed = feed_all(pipeline, output_of(commands))
+        self.assertIsNone(pipeline.failed)
+        self.assertEqual([response for command, response, sent, nbytes in completed],
+                         [reply(command) for command in commands])
+
+    def test_bytes_are_split_between_responses(self):
+        pipeline = CommandPipeline([("a", "#"), ("b", "#"), ("c", "#")], 3, received=10)
+        pipeline.next_batch()
+        first = pipeline.feed("a\n#b\nyy#", 30)
+        second = pipeline.feed("c\n#", 35)
+        self.assertEqual([nbytes for command, response, sent, nbytes in first], [7, 13])
+        self.assertEqual([nbytes for command, response, sent, nbytes in second], [5])
+
+    def test_window_must_be_positive(self):
+        self.assertRaises(ValueError, CommandPipeline, [("a", "#")], 0)
+
+
+class ShellChannel(object):
+    """In-memory interactive shell in configuration mode, replying to each line with reply, in small chunks"""
+
+    closed = False
+    eof_received = False
+
+    def __init__(self, chunk):
+        self.chunk = chunk
+        self.commands = []
+        self._pending = b''
+
+    def send(self, message):
+        for command in message.split('\n')[:-1]:
+            self.commands.append(command)
+            self._pending += reply(command, "rtr1#" if command == "end" else CONFIG_PROMPT).encode()
+
+    def recv(self, nbytes):
+        data, self._pending = self._pending[:min(nbytes, self.chunk)], self._pending[min(nbytes, self.chunk):]
+        return data
+
+    def recv_ready(self):
+        return bool(self._pending)
+
+    def exit_status_ready(self):
+        return False
+
+    def settimeout(self, timeout):
+        pass
+
+    def gettimeout(self):
+        return 1
+
+
+class ShellTransport(object):
+    def is_active(self):
+        return True
+
+    def is_authenticated(self):
+        return True
+
+
+def shell_session(chunk):
+    session = SSHInteractive()
+    SshConnect.__init__(session, 'rtr1')
+    session._transport = ShellTransport()
+    session._channel = ShellChannel(chunk)
+    session._sshconnected = True
+    session._command_timeout = 1
+    session.wait_mode = 'event'
+    session.session_log = None
+    session.channel_mode = 'shell'
+    session.type = 'Cisco'
+    session.prompt = "rtr1#"
+    session.base_prompt = "rtr1"
+    session.init_session_state()
+    session.state.update(CONFIG_PROMPT)
+    return session
+
+
+class TestSendPipelined(unittest.TestCase):
+
+    def assertSends(self, commands, windows):
+        expected = output_of(commands)
+        for window in windows:
+            for chunk in (3, 4096):
+                session = shell_session(chunk)
+                output = session.ssh_cmd_action([(command, CONFIG_PATTERN) for command in commands], config=False,
+                                                save_config=False, window=window)
+                self.assertEqual(output, expected, (window, chunk))
+                self.assertEqual(session._channel.commands, [command.strip() for command in commands])
+                self.assertEqual(session.state.mode, 'config')
+                self.assertEqual(len(session.timing.commands), len(commands))
+                self.assertEqual(session.timing.bytes_received, len(expected))
+
+    def test_same_output_as_one_at_a_time(self):
+        self.assertSends(["interface GigabitEthernet1", " description uplink", " no shutdown", "exit",
+                          "ip access-list extended T", " permit ip any any"], (1, 2, 5, 6, 7))
+
+    def test_prompt_echoed_in_the_command(self):
+        # _send, used for window 1, stops at the prompt in the echo
+        self.assertSends(["interface GigabitEthernet1", " description rtr1(config)# uplink", " no shutdown", "exit"],
+                         (2, 3, 4, 5))
+
+    def test_stop_on_error(self):
+        commands = ["a 1", "a 2", "bad 3", "a 4", "a 5", "a 6", "a 7"]
+        for window in (1, 2, 3, 4):
+            session = shell_session(5)
+            with self.assertRaises(ValueError):
+                session.ssh_cmd_action([(command, CONFIG_PATTERN) for command in commands], config=False,
+                                       save_config=False, stop_on_error=True, window=window)
+            sent = session._channel.commands
+            self.assertEqual(sent[-1], "end")
+            # at most window - 1 commands after the one that failed were sent
+            self.assertEqual(sent[:-1], commands[:3 + window - 1], window)
+
+
+if __name__ == '__main__':
+    unittest.main()
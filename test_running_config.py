@@ -0,0 +1,273 @@
+import time
+import unittest
+
+from SSHInteractive import SSHInteractive
+from ncssh import SshConnect
+from running_config import RunningConfigCache, RunningConfigSnapshot, parse_show_run
+
+PROMPT = "rtr1#"
+CONFIG_LINES = [
+    "Building configuration...",
+    "",
+    "Current configuration : 512 bytes",
+    "!",
+    "version 16.9",
+    "hostname rtr1",
+    "!",
+    "interface GigabitEthernet1",
+    " description uplink",
+    " ip address 10.0.0.1 255.255.255.0",
+    "!",
+    "interface GigabitEthernet2",
+    " description Unused",
+    " shutdown",
+    "!",
+    "router bgp 65000",
+    " bgp log-neighbor-changes",
+    " address-family ipv4",
+    "  neighbor 10.0.0.2 activate",
+    " exit-address-family",
+    "!",
+    "ip access-list extended MGMT",
+    " permit tcp any host 10.0.0.99 eq 22",
+    "!",
+    "end",
+    "",
+]
+SHOW_RUN = "show running-config\r\n" + "".join(line + "\r\n" for line in CONFIG_LINES) + PROMPT
+
+
+def device_output(command, lines):
+    """The output the device gives for command when its filters select lines"""
+    return command + "\r\n" + "".join(line + "\r\n" for line in lines) + PROMPT
+
+
+class SnapshotSession(SSHInteractive):
+    """SSHInteractive in enable mode whose ssh_cmd_run answers from a dictionary and records what was sent"""
+
+    def __init__(self, outputs):
+        super().__init__()
+        SshConnect.__init__(self, 'rtr1')
+        self.channel_mode = 'shell'
+        self.session_log = None
+        self.init_session_state()
+        self.state.update(PROMPT)
+        self.outputs = outputs
+        self.sent = []
+
+    def ssh_cmd_run(self, cmd, *args, **kwargs):
+        self.sent.append(cmd)
+        return self.outputs[cmd]
+
+
+class TestSnapshotFilters(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshot = RunningConfigSnapshot.from_output(SHOW_RUN)
+
+    def assertShows(self, command, lines):
+        self.assertEqual(self.snapshot.show(command), device_output(command, lines))
+
+    def test_header_lines_are_part_of_the_output(self):
+        self.assertEqual(self.snapshot.lines, CONFIG_LINES)
+        self.assertEqual(self.snapshot.prompt, PROMPT)
+        self.assertEqual(self.snapshot.show("show running-config"), SHOW_RUN)
+
+    def test_header_lines_are_filtered_like_the_rest(self):
+        self.assertShows("show running-config | include Building", ["Building configuration..."])
+        self.assertShows("show running-config | include ^Current configuration : [0-9]+ bytes$",
+                         ["Current configuration : 512 bytes"])
+        self.assertShows("show running-config | include hostname", ["hostname rtr1"])
+        self.assertShows("show running-config | count config", ["Number of lines which match regexp = 2"])
+
+    def test_include(self):
+        self.assertShows("show run | include ^interface",
+                         ["interface GigabitEthernet1", "interface GigabitEthernet2"])
+        self.assertShows(r"show run | include ip address 10\.0\.0\.[0-9]+ 255",
+                         [" ip address 10.0.0.1 255.255.255.0"])
+        self.assertShows("show run | include neighbor .* activate$", ["  neighbor 10.0.0.2 activate"])
+        self.assertShows("show run | include no such line", [])
+
+    def test_exclude(self):
+        self.assertShows("show run | exclude ^[ !] | exclude ^$",
+                         ["Building configuration...", "Current configuration : 512 bytes", "version 16.9",
+                          "hostname rtr1", "interface GigabitEthernet1", "interface GigabitEthernet2",
+                          "router bgp 65000", "ip access-list extended MGMT", "end"])
+
+    def test_begin(self):
+        self.assertShows("show run | begin ^ip access-list",
+                         ["ip access-list extended MGMT", " permit tcp any host 10.0.0.99 eq 22", "!", "end", ""])
+        self.assertShows("show run | begin no such line", [])
+
+    def test_section_matching_the_parent_line(self):
+        self.assertShows("show run | section ^interface",
+                         ["interface GigabitEthernet1", " description uplink", " ip address 10.0.0.1 255.255.255.0",
+                          "interface GigabitEthernet2", " description Unused", " shutdown"])
+
+    def test_section_matching_a_child_line(self):
+        self.assertShows("show run | section shutdown",
+                         ["interface GigabitEthernet2", " description Unused", " shutdown"])
+
+    def test_section_keeps_nested_lines(self):
+        bgp = ["router bgp 65000", " bgp log-neighbor-changes", " address-family ipv4", "  neighbor 10.0.0.2 activate",
+               " exit-address-family"]
+        self.assertShows("show run | section bgp", bgp)
+        # a match two levels down selects the whole top-level section
+        self.assertShows("show run | section neighbor", bgp)
+
+    def test_count(self):
+        self.assertShows("show run | count ^interface", ["Number of lines which match regexp = 2"])
+        self.assertShows("show run | count no such line", ["Number of lines which match regexp = 0"])
+
+    def test_patterns_are_case_sensitive(self):
+        self.assertShows("show run | include Hostname", [])
+        self.assertShows("show run | include unused", [])
+        self.assertShows("show run | include Unused", [" description Unused"])
+
+    def test_keywords_are_case_insensitive_and_abbreviated(self):
+        self.assertShows("sh run | i hostname", ["hostname rtr1"])
+        self.assertShows("SHOW RUNNING-CONFIG | INCLUDE hostname", ["hostname rtr1"])
+        self.assertShows("show running | inc hostname", ["hostname rtr1"])
+        self.assertShows("sho run | e ^[ !BCvhrie] | e ^$", [])
+        self.assertShows("show run | s shutdown", ["interface GigabitEthernet2", " description Unused", " shutdown"])
+        self.assertShows("show run | c ^interface", ["Number of lines which match regexp = 2"])
+        self.assertShows("show run | b ^end", ["end", ""])
+
+    def test_chained_filters(self):
+        self.assertShows("show run | section ^interface | include description",
+                         [" description uplink", " description Unused"])
+
+    def test_commands_that_fall_through_to_the_device(self):
+        for command in ("show running-config interface GigabitEthernet1",
+                        "show running-config all",
+                        "show ip interface brief",
+                        "s run | include hostname",
+                        "show ru | include hostname",
+                        "show run | include",
+                        "show run | include ip_address",
+                        "show run | include [",
+                        "show run | redirect flash:run.txt",
+                        "show run | append flash:run.txt",
+                        "show run | include hostname|version"):
+            self.assertIsNone(parse_show_run(command), command)
+            self.assertIsNone(self.snapshot.show(command), command)
+
+
+class TestShowFromSnapshot(unittest.TestCase):
+
+    def test_parseable_commands_use_one_snapshot(self):
+        session = SnapshotSession({"show running-config": SHOW_RUN,
+                                   "show running-config interface GigabitEthernet1": device_output(
+                                       "show running-config interface GigabitEthernet1", CONFIG_LINES[7:10]),
+                                   "show ip interface brief": device_output("show ip interface brief", [])})
+        passed, results, outputs = session.ssh_parse_test({
+            "show run | include hostname": {'existl': ["hostname rtr1"]},
+            "show run | section ^interface": {'countl': ["interface Gigabit"]},
+            "show running-config interface GigabitEthernet1": {'existl': ["description uplink"]},
+            "show ip interface brief": None,
+        })
+        self.assertTrue(passed)
+        self.assertEqual(session.sent, ["show running-config", "show running-config interface GigabitEthernet1",
+                                        "show ip interface brief"])
+        self.assertEqual(results["show run | include hostname"], {'existl': [True]})
+        self.assertEqual(results["show run | section ^interface"], {'countl': [2]})
+        self.assertIn(device_output("show run | include hostname", ["hostname rtr1"]), outputs)
+
+    def test_unparseable_commands_go_to_the_device(self):
+        command = "show run | include ip_address"
+        session = SnapshotSession({command: device_output(command, [])})
+        passed, results, outputs = session.ssh_parse_test({command: {'notexistl': ["ip address"]}})
+        self.assertTrue(passed)
+        self.assertEqual(session.sent, [command])
+
+    def test_without_config_snapshot(self):
+        command = "show run | include hostname"
+        session = SnapshotSession({command: device_output(command, ["hostname rtr1"])})
+        session.ssh_parse_test({command: {'existl': ["rtr1"]}}, config_snapshot=False)
+        self.assertEqual(session.sent, [command])
+
+    def test_not_in_exec_mode(self):
+        command = "do show run | include hostname"
+        session = SnapshotSession({command: device_output(command, ["hostname rtr1"])})
+        session.state.update("rtr1(config)#")
+        session.ssh_parse_test({command: {'existl': ["rtr1"]}})
+        self.assertEqual(session.sent, [command])
+
+
+class TestRunningConfigCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = RunningConfigCache()
+        self.cache.store(SHOW_RUN, self.cache.generation)
+        self.cache.store_output("show version", "show version\r\nrtr1#", self.cache.generation)
+
+    def assertKept(self, kept):
+        self.assertEqual(self.cache.get() is not None, kept)
+        self.assertEqual(self.cache.output("show version") is not None, kept)
+
+    def test_exec_commands_keep_the_snapshot(self):
+        for command, mode in (("show clock", 'enable'), ("show run | include conf", 'enable'),
+                              ("ping 10.0.0.2", 'user'), ("write memory", 'enable')):
+            self.cache.invalidate_for(command, mode)
+            self.assertKept(True)
+
+    def test_configure(self):
+        for command in ("conf t", "configure terminal", "CONF T", "  configure replace flash:base.cfg force"):
+            self.setUp()
+            self.cache.invalidate_for(command, 'enable')
+            self.assertKept(False)
+
+    def test_config_mode(self):
+        self.cache.invalidate_for("conf t", 'config')
+        self.assertKept(False)
+        self.setUp()
+        self.cache.invalidate_for("description uplink", 'config')
+        self.assertKept(False)
+
+    def test_copy(self):
+        for command in ("copy flash:push.cfg running-config", "copy running-config startup-config",
+                        "rollback flash:base.cfg", "archive config"):
+            self.setUp()
+            self.cache.invalidate_for(command, 'enable')
+            self.assertKept(False)
+
+    def test_do(self):
+        for command, mode in (("do show running-config", 'config'), ("do copy flash:push.cfg running-config", 'config'),
+                              ("do copy flash:push.cfg running-config", 'enable'), ("do conf t", None)):
+            self.setUp()
+            self.cache.invalidate_for(command, mode)
+            self.assertKept(False)
+
+    def test_unknown_mode(self):
+        self.cache.invalidate_for("show clock", None)
+        self.assertKept(False)
+
+    def test_output_fetched_during_invalidate_is_not_kept(self):
+        generation = self.cache.generation
+        self.cache.invalidate_for("conf t", 'config')
+        self.cache.store(SHOW_RUN, generation)
+        self.cache.store_output("show version", "show version\r\nrtr1#", generation)
+        self.assertKept(False)
+
+    def test_max_age(self):
+        self.cache = RunningConfigCache(max_age=60)
+        self.cache.store(SHOW_RUN, self.cache.generation)
+        self.cache.store_output("show version", "show version\r\nrtr1#", self.cache.generation)
+        self.assertKept(True)
+        self.cache.snapshot.taken -= 61
+        taken, output = self.cache.outputs["show version"]
+        self.cache.outputs["show version"] = (taken - 61, output)
+        self.assertKept(False)
+
+    def test_running_config_refetched_after_max_age(self):
+        session = SnapshotSession({"show running-config": SHOW_RUN})
+        session.config_cache.max_age = 60
+        first = session.running_config()
+        self.assertIs(session.running_config(), first)
+        first.taken = time.monotonic() - 61
+        self.assertIsNot(session.running_config(), first)
+        self.assertEqual(session.sent, ["show running-config", "show running-config"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+from SSHInteractive import SSHInteractive
+from ncssh import SshConnect
+from spool import SpooledOutput
+
+PROMPT = "rtr1#"
+LINES = ["Gi1/0/{} is up, line protocol is up".format(index) for index in range(200)]
+OUTPUT = "show interfaces\r\n" + "".join(line + "\r\n" for line in LINES) + PROMPT
+
+
+class StreamSession(SSHInteractive):
+    """SSHInteractive whose ssh_cmd_stream gives OUTPUT in chunks for every command"""
+
+    def __init__(self):
+        super().__init__()
+        SshConnect.__init__(self, 'rtr1')
+        self.channel_mode = 'shell'
+        self.session_log = None
+        self.init_session_state()
+        self.state.update(PROMPT)
+
+    def ssh_cmd_stream(self, cmdlist, lines=False, stop_on_error=False):
+        for index in range(0, len(OUTPUT), 1000):
+            yield OUTPUT[index:index + 1000]
+
+
+class TestSpooledOutput(unittest.TestCase):
+
+    def test_spills_past_the_threshold(self):
+        for threshold, spilled in ((len(OUTPUT), False), (len(OUTPUT) - 1, True)):
+            spooled = SpooledOutput(threshold=threshold)
+            spooled.write(OUTPUT[:100])
+            spooled.write(OUTPUT[100:].encode())
+            self.assertEqual(spooled.spilled, spilled)
+            self.assertEqual(spooled.size, len(OUTPUT))
+            self.assertEqual(spooled.getvalue(), OUTPUT)
+            self.assertEqual(spooled.parser().countl(['protocol is up']), [200])
+            spooled.close()
+
+
+class TestParseSpooled(unittest.TestCase):
+
+    def test_results_do_not_depend_on_spilling(self):
+        parselist = {'show interfaces': {'existl': ['Gi1/0/199 is up'], 'countl': [r'is up, line protocol is up']},
+                     'show  interfaces': {'notexistl': ['is down']}}
+        in_memory = StreamSession().ssh_parse_test(parselist, spool_threshold=len(OUTPUT))
+        spilled = StreamSession().ssh_parse_test(parselist, spool_threshold=100)
+        self.assertEqual(spilled[:2], in_memory[:2])
+        self.assertEqual(in_memory[2], OUTPUT)
+        self.assertEqual(spilled[2], "")
+
+    def test_spilled_output_without_tests_gives_its_size(self):
+        passed, results, outputs = StreamSession().ssh_parse_test({'show interfaces': None,
+                                                                   'show  interfaces': {'countl': ['protocol is up']}},
+                                                                  spool_threshold=100)
+        self.assertTrue(passed)
+        self.assertEqual(results, {'show interfaces': len(OUTPUT.encode()), 'show  interfaces': {'countl': [200]}})
+
+    def test_output_in_memory_without_tests_gives_the_output(self):
+        passed, results, outputs = StreamSession().ssh_parse_test({'show interfaces': None},
+                                                                  spool_threshold=len(OUTPUT))
+        self.assertEqual(results, {'show interfaces': OUTPUT})
+
+
+if __name__ == '__main__':
+    unittest.main()
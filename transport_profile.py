@@ -0,0 +1,114 @@
+import logging
+
+import paramiko
+
+__version__ = '2019.03.04.1'
+
+logger = logging.getLogger('transport_profile')
+
+
+class TransportProfile(object):
+    """
+    SSH transport settings applied by ncssh.SshConnect when connecting
+
+    Window and packet sizes apply to every channel opened on the transport. The remote end may only have one
+    window of data in flight before it has to wait for us to acknowledge it, so on a link with a large bandwidth
+    delay product a bigger window is what lets a long show command use the link.
+
+    The cipher, MAC and key exchange lists are preferences, they are moved to the front of paramiko's own lists in
+    the order given. Algorithms paramiko does not support are ignored, and the rest of paramiko's list is kept after
+    them so devices with an older set of algorithms can still connect.
+    """
+
+    def __init__(self, name, compress=False, window_size=paramiko.common.DEFAULT_WINDOW_SIZE,
+                 max_packet_size=paramiko.common.DEFAULT_MAX_PACKET_SIZE, ciphers=(), macs=(), kex=()):
+        """
+        @param name: str
+        @param compress: bool, negotiate zlib compression
+        @param window_size: int, channel window in bytes
+        @param max_packet_size: int, largest channel data packet the remote end may send, in bytes
+        @param ciphers: tuple of cipher names to prefer
+        @param macs: tuple of MAC names to prefer
+        @param kex: tuple of key exchange names to prefer
+        """
+        self.name = name
+        self.compress = compress
+        self.window_size = window_size
+        self.max_packet_size = max_packet_size
+        self.ciphers = tuple(ciphers)
+        self.macs = tuple(macs)
+        self.kex = tuple(kex)
+        self._transport_class = None
+
+    @staticmethod
+    def _prefer(preferred, available):
+        """
+        @return: tuple, the names in preferred that are in available, followed by the rest of available
+        """
+        first = tuple(name for name in preferred if name in available)
+        unknown = [name for name in preferred if name not in available]
+        if unknown:
+            logger.debug("TransportProfile: ignoring unsupported algorithms {}".format(unknown))
+        return first + tuple(name for name in available if name not in first)
+
+    @property
+    def transport_class(self):
+        """
+        paramiko.Transport subclass with this profile's algorithm preferences
+        """
+        if self._transport_class is None:
+            attributes = {
+                '_preferred_ciphers': self._prefer(self.ciphers, paramiko.Transport._preferred_ciphers),
+                '_preferred_macs': self._prefer(self.macs, paramiko.Transport._preferred_macs),
+                '_preferred_kex': self._prefer(self.kex, paramiko.Transport._preferred_kex),
+            }
+            self._transport_class = type('{}Transport'.format(self.name.capitalize()), (paramiko.Transport,),
+                                         attributes)
+        return self._transport_class
+
+    def transport_factory(self, sock, **kwargs):
+        """
+        Passed to paramiko.SSHClient.connect as transport_factory
+        """
+        return self.transport_class(sock, default_window_size=self.window_size,
+                                    default_max_packet_size=self.max_packet_size, **kwargs)
+
+    def connect_kwargs(self):
+        """
+        @return: dict of keyword arguments for paramiko.SSHClient.connect
+        """
+        return {'compress': self.compress, 'transport_factory': self.transport_factory}
+
+    def __repr__(self):
+        return "<TransportProfile {}>".format(self.name)
+
+
+# AES-GCM needs no separate MAC and AES-CTR with a SHA-2 MAC is the cheapest combination without it, both use AES-NI
+FAST_CIPHERS = ('aes128-gcm@openssh.com', 'aes128-ctr', 'aes256-gcm@openssh.com')
+FAST_MACS = ('hmac-sha2-256-etm@openssh.com', 'hmac-sha2-256')
+FAST_KEX = ('curve25519-sha256@libssh.org', 'ecdh-sha2-nistp256')
+
+PROFILES = {
+    # paramiko's defaults
+    'default': TransportProfile('default'),
+    # slow, high latency links: compress the (very compressible) CLI output and keep more of it in flight
+    'wan': TransportProfile('wan', compress=True, window_size=16 * 1024 * 1024, ciphers=FAST_CIPHERS,
+                            macs=FAST_MACS, kex=FAST_KEX),
+    # large transfers on fast links: no compression, large window and packets, cheapest ciphers
+    'bulk': TransportProfile('bulk', window_size=16 * 1024 * 1024, max_packet_size=256 * 1024,
+                             ciphers=FAST_CIPHERS, macs=FAST_MACS, kex=FAST_KEX),
+}
+
+
+def get_profile(profile):
+    """
+    @param profile: str, name of one of PROFILES, or a TransportProfile
+    @return: TransportProfile
+    @raise ValueError: if there is no profile with that name
+    """
+    if isinstance(profile, TransportProfile):
+        return profile
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise ValueError("unknown transport profile {!r}, expected one of {}".format(profile, sorted(PROFILES)))